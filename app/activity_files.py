@@ -0,0 +1,270 @@
+# Reading power data from FIT and TCX files recorded by head units
+import gzip
+import hashlib
+import os
+import struct
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+from models import db, ActivityCurve
+from app.ingest import save_activity_curves
+from app.powercurve import MAX_RIDE_SECONDS, resample_1hz
+from app.strava import STREAM_GAP_FILL, STREAM_MAX_HOLD
+
+ACTIVITY_FILE_TYPES = ('.fit', '.tcx', '.fit.gz', '.tcx.gz')
+# Number of processes used to parse a batch of files (default: one per CPU)
+IMPORT_PROCESSES = int(os.getenv('IMPORT_PROCESSES', 0)) or None
+# Uploaded files wait here (one folder per user) until a worker imports them
+UPLOAD_DIR = os.getenv(
+    'UPLOAD_DIR',
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'instance', 'uploads'))
+)
+# Parsed files are stored (and their memory freed) in batches of this size
+IMPORT_BATCH_SIZE = 50
+
+# FIT timestamps count seconds from 1989-12-31 00:00 UTC
+FIT_EPOCH = 631065600
+FIT_RECORD_MESSAGE = 20
+FIT_TIMESTAMP_FIELD = 253
+FIT_POWER_FIELD = 7
+FIT_INVALID_POWER = 0xFFFF
+
+
+def activity_file_id(path):
+    """Stable activity ID for a file (hash of its contents), so re-imports are skipped."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return f"file:{digest.hexdigest()[:24]}"
+
+
+def _open(path):
+    return gzip.open(path, 'rb') if path.lower().endswith('.gz') else open(path, 'rb')
+
+
+def _read(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated FIT file")
+    return data
+
+
+def iter_fit_power(f):
+    """
+    Yield (unix_time, watts) for every record message of a FIT file, reading one message at
+    a time. Watts is None where the record has no valid power.
+
+    Notes:
+        Only the definition of each local message type is kept. Data messages are unpacked
+        with a struct built from their definition that skips every field except the timestamp
+        and power, and compressed timestamp headers are expanded from the last full timestamp.
+    """
+    while True:
+        header = f.read(1)
+        if not header:
+            return  # End of the file (FIT files can be chained)
+        header_size = header[0]
+        rest = _read(f, header_size - 1)
+        if rest[7:11] != b'.FIT':
+            raise ValueError("Not a FIT file")
+        remaining = struct.unpack('<I', rest[3:7])[0]
+        definitions = {}
+        last_timestamp = 0
+
+        while remaining > 0:
+            record_header = _read(f, 1)[0]
+            remaining -= 1
+            if record_header & 0x80:
+                # Compressed timestamp header: 5 bit offset from the last timestamp
+                local_type = (record_header >> 5) & 0x03
+                offset = record_header & 0x1F
+                timestamp = (last_timestamp & ~0x1F) + offset
+                if offset < (last_timestamp & 0x1F):
+                    timestamp += 0x20
+                last_timestamp = timestamp
+            elif record_header & 0x40:
+                # Definition message
+                local_type = record_header & 0x0F
+                fixed = _read(f, 5)
+                endian = '>' if fixed[1] else '<'
+                global_number = struct.unpack(endian + 'H', fixed[2:4])[0]
+                fields = _read(f, 3 * fixed[4])
+                remaining -= 5 + 3 * fixed[4]
+                developer_size = 0
+                if record_header & 0x20:
+                    count = _read(f, 1)[0]
+                    developer = _read(f, 3 * count)
+                    remaining -= 1 + 3 * count
+                    developer_size = sum(developer[i + 1] for i in range(0, len(developer), 3))
+                layout, names = [endian], []
+                for i in range(0, len(fields), 3):
+                    number, size = fields[i], fields[i + 1]
+                    if number == FIT_TIMESTAMP_FIELD and size == 4:
+                        layout.append('I')
+                        names.append('timestamp')
+                    elif number == FIT_POWER_FIELD and size == 2 and global_number == FIT_RECORD_MESSAGE:
+                        layout.append('H')
+                        names.append('power')
+                    else:
+                        layout.append(f'{size}x')
+                if developer_size:
+                    layout.append(f'{developer_size}x')
+                definitions[local_type] = (global_number, struct.Struct(''.join(layout)), names)
+                continue
+            else:
+                local_type = record_header & 0x0F
+                timestamp = None
+
+            if local_type not in definitions:
+                raise ValueError(f"FIT data message for undefined local type {local_type}")
+            global_number, layout, names = definitions[local_type]
+            values = dict(zip(names, layout.unpack(_read(f, layout.size))))
+            remaining -= layout.size
+            if 'timestamp' in values:
+                timestamp = last_timestamp = values['timestamp']
+            if global_number == FIT_RECORD_MESSAGE and timestamp is not None:
+                power = values.get('power')
+                yield timestamp + FIT_EPOCH, None if power in (None, FIT_INVALID_POWER) else power
+        _read(f, 2)  # File CRC
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def iter_tcx_power(f):
+    """
+    Yield (unix_time, watts) for every Trackpoint of a TCX file.
+
+    Notes:
+        Trackpoints are removed from the tree as soon as they have been read, so memory use
+        stays flat however long the ride is.
+    """
+    parents = []
+    for event, elem in ET.iterparse(f, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            continue
+        parents.pop()
+        if _local_name(elem.tag) != 'Trackpoint':
+            continue
+        time, watts = None, None
+        for child in elem.iter():
+            name = _local_name(child.tag)
+            if name == 'Time':
+                time = child.text
+            elif name == 'Watts' and child.text:
+                watts = float(child.text)
+        if time:
+            timestamp = datetime.fromisoformat(time.strip().replace('Z', '+00:00'))
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            yield timestamp.timestamp(), watts
+        if parents:
+            parents[-1].remove(elem)
+
+
+def read_activity_file(path):
+    """
+    Read a FIT or TCX file (optionally gzipped) into a 1 Hz watts array.
+
+    Returns:
+        tuple: (activity_id, start datetime in UTC, watts as an int16 array), or None if the
+            file has no power data.
+
+    Raises:
+        ValueError: The file is broken, or its samples span more than MAX_RIDE_SECONDS (its
+            1 Hz grid would not fit in memory).
+    """
+    name = path.lower()
+    parse = iter_fit_power if name.endswith(('.fit', '.fit.gz')) else iter_tcx_power
+    with _open(path) as f:
+        samples = np.fromiter(
+            (v for t, p in parse(f) for v in (t, np.nan if p is None else p)), dtype=np.float64
+        ).reshape(-1, 2)
+    if not len(samples) or not np.nan_to_num(samples[:, 1]).any():
+        return None
+    span = samples[:, 0].max() - samples[0, 0]
+    if not span <= MAX_RIDE_SECONDS:
+        raise ValueError(f"Ride spans {span / 3600:.0f} h, longer than the {MAX_RIDE_SECONDS // 3600} h limit")
+    # Gaps are filled the same way as in Strava streams
+    watts = resample_1hz(samples[:, 0], samples[:, 1], STREAM_GAP_FILL, STREAM_MAX_HOLD)
+    start_date = datetime.fromtimestamp(samples[0, 0], timezone.utc).replace(tzinfo=None)
+    watts = np.clip(watts, 0, np.iinfo(np.int16).max).astype(np.int16)
+    return activity_file_id(path), start_date, watts
+
+
+def _read_or_error(path):
+    # Runs in a pool process, errors are returned so one bad file doesn't stop the batch
+    try:
+        return read_activity_file(path), None
+    except Exception as e:
+        return None, f"{os.path.basename(path)}: {e}"
+
+
+def find_activity_files(paths):
+    """Expand directories into the FIT/TCX files they contain (recursively)."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                found.extend(os.path.join(folder, n) for n in sorted(names)
+                             if n.lower().endswith(ACTIVITY_FILE_TYPES))
+        else:
+            found.append(path)
+    return found
+
+
+def import_activity_files(user, paths, processes=IMPORT_PROCESSES):
+    """
+    Parse activity files in parallel processes and store their curves like Strava rides.
+
+    Args:
+        user (User): Owner of the files.
+        paths (list): FIT/TCX files (optionally .gz) or directories of them.
+        processes (int): Number of parser processes (default: one per CPU).
+
+    Returns:
+        dict: {"imported": n, "skipped": n (already imported or no power), "errors": [str]}
+    """
+    paths = find_activity_files(paths)
+    result = {"imported": 0, "skipped": 0, "errors": []}
+    if not paths:
+        return result
+    seen = {
+        activity_id for (activity_id,) in
+        db.session.query(ActivityCurve.activity_id).filter_by(user_id=user.id)
+    }
+    rides, start_dates = [], {}
+
+    def save(rides):
+        # Newest first, like the Strava activity list
+        rides.sort(key=lambda ride: start_dates[ride[0]], reverse=True)
+        save_activity_curves(user, rides, start_dates)
+        db.session.commit()
+        result["imported"] += len(rides)
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        for parsed, error in pool.map(_read_or_error, paths, chunksize=4):
+            if error:
+                result["errors"].append(error)
+            elif parsed is None or parsed[0] in seen:
+                result["skipped"] += 1
+            else:
+                activity_id, start_date, watts = parsed
+                seen.add(activity_id)
+                rides.append((activity_id, watts))
+                start_dates[activity_id] = start_date
+                if len(rides) >= IMPORT_BATCH_SIZE:
+                    save(rides)
+                    rides = []
+    if rides:
+        save(rides)
+    return result
+
+
+def user_upload_dir(user_id):
+    """Folder holding a user's uploaded files that haven't been imported yet."""
+    return os.path.join(UPLOAD_DIR, str(int(user_id)))
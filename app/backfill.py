@@ -0,0 +1,148 @@
+# Importing a user's whole Strava history, resumable and within the API quotas
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from models import db, User, BackfillState
+from app.ingest import refresh_user_curve
+
+# Activities per page (Strava's maximum)
+BACKFILL_PAGE_SIZE = 200
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def backfill_page(user_id, strava, per_page=BACKFILL_PAGE_SIZE):
+    """
+    Import the next page of a user's activities and checkpoint it.
+
+    Args:
+        user_id (int): The user to backfill.
+        strava (StravaClient): Client used for the activity list and watts streams.
+        per_page (int): Activities per page.
+
+    Returns:
+        bool: True if the user has more pages to import.
+
+    Notes:
+        If any watts stream of the page failed to download (Strava down, quota used up), the
+        rides that did download are stored but the checkpoint stays on the page and the user
+        stops with an error. The next run fetches the page again and only downloads the rides
+        that are still missing.
+    """
+    user = db.session.get(User, user_id)
+    state = db.session.get(BackfillState, user_id)
+    if state is None:
+        state = BackfillState(user_id=user_id, next_page=1, activities=0)
+        db.session.add(state)
+
+    activities = strava.get_activities(user.access_token, per_page=per_page, page=state.next_page)
+    state.updated_at = _now()
+    if activities is None:
+        state.error = f"Could not fetch page {state.next_page} of the activities (expired token?)"
+        db.session.commit()
+        return False
+    if activities:
+        # Commits the page's curves; the checkpoint below is only written after that
+        failed = []
+        refresh_user_curve(user, strava, user.access_token, activities, failed=failed)
+        if failed:
+            state.error = (f"Could not fetch {len(failed)} watts streams on page {state.next_page} "
+                           f"(Strava unavailable or out of quota?), the page is retried on the next run")
+            db.session.commit()
+            return False
+        state.next_page += 1
+        state.activities += len(activities)
+    state.error = None
+    if len(activities) < per_page:
+        state.finished_at = _now()
+    db.session.commit()
+    return state.finished_at is None
+
+
+def pending_users(user_ids=None, restart=False):
+    """
+    IDs of the users that still have pages to import.
+
+    Args:
+        user_ids (list): Only consider these users (default: everyone).
+        restart (bool): Forget existing checkpoints and start every user from page 1.
+    """
+    query = db.session.query(User.id)
+    if user_ids:
+        query = query.filter(User.id.in_(user_ids))
+    ids = [user_id for (user_id,) in query.order_by(User.id)]
+    if restart:
+        BackfillState.query.filter(BackfillState.user_id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        return ids
+    finished = {
+        user_id for (user_id,) in
+        db.session.query(BackfillState.user_id).filter(BackfillState.user_id.in_(ids),
+                                                      BackfillState.finished_at.isnot(None))
+    }
+    return [user_id for user_id in ids if user_id not in finished]
+
+
+def run_backfill(app, strava, user_ids=None, workers=4, per_page=BACKFILL_PAGE_SIZE, restart=False,
+                 log=print):
+    """
+    Backfill many users in parallel, one page per turn, until every history is imported.
+
+    Args:
+        app (Flask): The application (for the database connection).
+        strava (StravaClient): Client for Strava, normally with a RateLimiter attached so all
+            threads share the quotas.
+        user_ids (list): Only backfill these users (default: everyone).
+        workers (int): Number of users processed at the same time.
+        per_page (int): Activities per page.
+        restart (bool): Ignore existing checkpoints.
+        log (callable): Progress messages are passed to this function.
+
+    Returns:
+        dict: user_id -> "done" or the error that stopped the user.
+
+    Notes:
+        Users take turns from a round-robin queue: after each page a user goes to the back,
+        so one rider with thousands of activities doesn't hold up everyone else.
+    """
+    with app.app_context():
+        queue = deque(pending_users(user_ids, restart))
+        db.session.remove()
+    log(f"Backfilling {len(queue)} users")
+    results = {}
+    lock = threading.Lock()
+
+    def next_user():
+        with lock:
+            return queue.popleft() if queue else None
+
+    def worker():
+        with app.app_context():
+            while True:
+                user_id = next_user()
+                if user_id is None:
+                    return
+                try:
+                    more = backfill_page(user_id, strava, per_page)
+                except Exception as exc:
+                    db.session.rollback()
+                    log(f"User {user_id}: {exc!r}")
+                    results[user_id] = repr(exc)
+                    continue
+                state = db.session.get(BackfillState, user_id)
+                if more:
+                    log(f"User {user_id}: {state.activities} activities imported")
+                    with lock:
+                        queue.append(user_id)
+                else:
+                    results[user_id] = state.error or "done"
+                    log(f"User {user_id}: {results[user_id]} ({state.activities} activities)")
+                db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(worker) for _ in range(workers)]:
+            future.result()
+    return results
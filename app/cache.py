@@ -0,0 +1,227 @@
+# Read-through cache of users, latest power curves and the user count, shared by all processes
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+from models import db, User, PowerCurve
+from app.curve_format import PackedCurve
+from app.instrumentation import count_cache_lookup
+
+# SQLite file holding the cache (one per host, shared by the web and worker processes)
+CACHE_PATH = os.getenv(
+    'CACHE_PATH',
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'instance', 'cache.sqlite3'))
+)
+# Seconds an entry is served before it is read again from the database (0 turns caching off)
+CACHE_TTL = float(os.getenv('CACHE_TTL', 300))
+# Entries kept before the least recently used ones are evicted
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 10000))
+
+USER_COUNT_KEY = "user_count"
+_MISSING = object()
+# session.info key of the cache keys to drop when the session commits
+_PENDING_KEY = "cache_invalidate"
+
+
+def user_key(user_id):
+    return f"user:{user_id}"
+
+
+def curve_key(user_id):
+    return f"curve:{user_id}"
+
+
+class SharedCache:
+    """
+    TTL and LRU bounded key/value store in a SQLite file.
+
+    Attributes:
+        path (str): The SQLite file.
+        ttl (float): Default seconds before an entry expires. 0 disables the cache.
+        max_entries (int): Entries kept before the least recently used are evicted.
+
+    Notes:
+        Every gunicorn worker (and the job worker) opens the same file, so an entry read by
+        one is a hit in the others, and an invalidation is seen by all of them. Values are
+        stored as JSON. Each thread of each process gets its own connection, opened on first
+        use, so connections are never shared across a fork. The cache is best effort: if the
+        file is locked or broken, lookups fall through to the database.
+    """
+
+    # Only every this many writes checks the entry count, so eviction stays off the hot path
+    EVICT_EVERY = 64
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                         "expires_at REAL NOT NULL, used_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_used_at ON cache (used_at)")
+            self._local.conn, self._local.pid = conn, pid
+        return self._local.conn
+
+    def get(self, key):
+        """The cached value, or _MISSING if there is none (or it expired)."""
+        if not self.ttl:
+            return _MISSING
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT value, used_at FROM cache WHERE key = ? AND expires_at > ?",
+                               (key, now)).fetchone()
+            if row is None:
+                return _MISSING
+            # Mark as recently used, at most once per tenth of the TTL so hits rarely write
+            if now - row[1] > self.ttl / 10:
+                conn.execute("UPDATE cache SET used_at = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+        except sqlite3.Error:
+            return _MISSING
+
+    def set(self, key, value, ttl=None):
+        if not self.ttl:
+            return
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                         (key, json.dumps(value), now + (ttl or self.ttl), now))
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self.evict()
+        except sqlite3.Error:
+            pass
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        try:
+            self._connection().execute(
+                f"DELETE FROM cache WHERE key IN ({','.join('?' * len(keys))})", keys)
+        except sqlite3.Error:
+            pass
+
+    def evict(self):
+        """Delete expired entries, then the least recently used ones above max_entries."""
+        conn = self._connection()
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        excess = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used_at LIMIT ?)",
+                         (excess,))
+
+    def clear(self):
+        try:
+            self._connection().execute("DELETE FROM cache")
+        except sqlite3.Error:
+            pass
+
+    def get_or_set(self, key, load, ttl=None):
+        """
+        Read-through lookup: the cached value, or load() stored and returned on a miss.
+
+        Notes:
+            load() must return something JSON serializable. None is cached too, so a missing
+            row isn't looked up again until it expires or is invalidated.
+        """
+        value = self.get(key)
+        count_cache_lookup(key.split(":")[0], value is not _MISSING)
+        if value is _MISSING:
+            value = load()
+            self.set(key, value, ttl)
+        return value
+
+
+cache = SharedCache()
+
+
+def invalidate(*keys):
+    """Drop cache entries now (call after the change is committed)."""
+    cache.delete(*keys)
+
+
+def invalidate_after_commit(*keys):
+    """
+    Drop cache entries when the current database transaction commits.
+
+    Notes:
+        Dropping them before the commit would let another process cache the old rows again
+        in between. Nothing is dropped if the transaction is rolled back.
+    """
+    db.session.info.setdefault(_PENDING_KEY, set()).update(keys)
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_committed(session):
+    keys = session.info.pop(_PENDING_KEY, None)
+    if keys:
+        cache.delete(*keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def get_user(user_id):
+    """
+    The User with this id, from the cache when possible.
+
+    Returns:
+        User or None: A User attached to the current session (no query is sent on a hit), so
+            it behaves like one loaded by User.query.get.
+
+    Notes:
+        The access token is left out of the cache file, which is plain JSON on the host's
+        disk. It is expired on the returned User, so reading user.access_token loads it from
+        the database.
+    """
+    def load():
+        user = db.session.get(User, user_id)
+        return user and {"id": user.id, "strava_id": user.strava_id, "strava_name": user.strava_name}
+
+    data = cache.get_or_set(user_key(user_id), load)
+    if data is None:
+        return None
+    user = User(id=data["id"], strava_id=data["strava_id"], strava_name=data["strava_name"])
+    # Attributes that weren't set are expired, and loaded on first access
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def get_user_count():
+    """Number of users (shown on the landing page)."""
+    return cache.get_or_set(USER_COUNT_KEY, lambda: User.query.count())
+
+
+def get_latest_curve(user_id):
+    """
+    The user's latest PowerCurve curve, from the cache when possible.
+
+    Returns:
+        PackedCurve or None: None if the user has no curve yet.
+    """
+    def load():
+        curve = (db.session.query(PowerCurve.curve).filter_by(user_id=user_id)
+                 .order_by(PowerCurve.created_at.desc(), PowerCurve.id.desc()).limit(1).scalar())
+        return curve and {"durations": curve.durations.tolist(), "watts": curve.watts.tolist()}
+
+    data = cache.get_or_set(curve_key(user_id), load)
+    if data is None:
+        return None
+    return PackedCurve(np.array(data["durations"], dtype=np.int32), np.array(data["watts"], dtype=np.float32))
@@ -0,0 +1,52 @@
+# Comparing power curves across many users
+from models import db, User, PowerCurve
+from app.powercurve import align_curves, curve_envelopes
+
+
+def latest_curves(user_ids=None):
+    """
+    The latest PowerCurve of each user, with the user, in a single query.
+
+    Args:
+        user_ids (list): Users to include, or None for every user with a curve.
+
+    Returns:
+        dict: user_id -> (User, curve dict), in user_id order.
+
+    Notes:
+        ROW_NUMBER() over each user's curves (newest first) picks the latest row in the
+        database, so the query count doesn't grow with the number of users.
+    """
+    ranked = db.session.query(
+        PowerCurve.id.label('id'),
+        db.func.row_number().over(
+            partition_by=PowerCurve.user_id,
+            order_by=(PowerCurve.created_at.desc(), PowerCurve.id.desc())
+        ).label('row')
+    )
+    if user_ids is not None:
+        ranked = ranked.filter(PowerCurve.user_id.in_(list(user_ids)))
+    ranked = ranked.subquery()
+    rows = (
+        db.session.query(User, PowerCurve.curve)
+        .join(PowerCurve, PowerCurve.user_id == User.id)
+        .join(ranked, ranked.c.id == PowerCurve.id)
+        .filter(ranked.c.row == 1)
+        .order_by(User.id)
+    )
+    return {user.id: (user, curve) for user, curve in rows}
+
+
+def envelope_series(curves):
+    """
+    Chart series for the max, median and min of a group of {duration: watts} curves.
+
+    Returns:
+        list: [{"label", "curve", "dashed"}] ready for app.plots.chart_data.
+    """
+    durations, matrix = align_curves(curves)
+    series = []
+    for name, values in curve_envelopes(matrix).items():
+        curve = {int(d): round(float(p), 2) for d, p in zip(durations, values) if p == p}  # Skip NaN
+        series.append({"label": f"Group {name} ({len(curves)} riders)", "curve": curve, "dashed": True})
+    return series
@@ -0,0 +1,111 @@
+# Configuration for each environment, picked by the APP_ENV environment variable
+import os
+
+# APP_ENV values (and their short forms) -> config class name
+ENVIRONMENTS = {
+    "development": "development",
+    "dev": "development",
+    "production": "production",
+    "prod": "production",
+}
+
+
+class Config:
+    """
+    Settings shared by every environment.
+
+    Notes:
+        Values are read from the environment when the config object is created (in create_app),
+        not when this module is imported, so .env files loaded by the entry point are seen.
+    """
+
+    ENV_NAME = None
+    LABEL = None  # Printed when the app starts
+
+    def __init__(self):
+        # Set SECRET_KEY so sessions stay valid across processes and restarts. Without it every
+        # process gets its own random key (with gunicorn --preload, all workers share the
+        # master's key).
+        self.SECRET_KEY = os.getenv('SECRET_KEY') or os.urandom(24)
+        self.SQLALCHEMY_TRACK_MODIFICATIONS = False
+        # Largest accepted upload (all files of one FIT/TCX upload together)
+        self.MAX_CONTENT_LENGTH = int(os.getenv('UPLOAD_MAX_BYTES', 256 * 1024 * 1024))
+        # Create missing tables when the app is created (turn off when a migration tool owns
+        # the schema)
+        self.CREATE_TABLES = os.getenv('CREATE_TABLES', 'true').lower() != 'false'
+        self.STRAVA_CLIENT_ID = os.getenv('STRAVA_CLIENT_ID')
+        self.STRAVA_CLIENT_SECRET = os.getenv('STRAVA_CLIENT_SECRET')
+        self.STRAVA_REDIRECT_URI = os.getenv('STRAVA_REDIRECT_URI')
+        self.METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+        # Strava push subscription (see app/routes/webhooks.py): the verify token given when the
+        # subscription was created turns the webhook on, the subscription id (optional) is
+        # checked on every event and the record file (optional) keeps the raw events for replay
+        self.STRAVA_WEBHOOK_VERIFY_TOKEN = os.getenv('STRAVA_WEBHOOK_VERIFY_TOKEN')
+        self.STRAVA_WEBHOOK_SUBSCRIPTION_ID = os.getenv('STRAVA_WEBHOOK_SUBSCRIPTION_ID')
+        self.STRAVA_WEBHOOK_RECORD_FILE = os.getenv('STRAVA_WEBHOOK_RECORD_FILE')
+        # Bearer token for /export (off when unset)
+        self.EXPORT_TOKEN = os.getenv('EXPORT_TOKEN')
+        # Most database queries one request should need. Requests above it are logged and
+        # counted in /metrics (see app/instrumentation.py), unset turns the check off
+        self.QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', 0)) or None
+
+
+class DevelopmentConfig(Config):
+    """Local development with SQLite (SQLALCHEMY_DATABASE_URI_DEV)."""
+
+    ENV_NAME = "development"
+    LABEL = "Development Mode (SQLite)"
+
+    def __init__(self):
+        super().__init__()
+        self.SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI_DEV')
+
+
+class ProductionConfig(Config):
+    """Elastic Beanstalk with PostgreSQL on RDS (the RDS_* variables)."""
+
+    ENV_NAME = "production"
+    LABEL = "Production Mode (RDS)"
+
+    def __init__(self):
+        super().__init__()
+        # The OS Environment Variables should be stored within the configuration of the
+        # elastic beanstalk application
+        self.SQLALCHEMY_DATABASE_URI = (
+            f"postgresql+psycopg://{os.getenv('RDS_USERNAME')}:{os.getenv('RDS_PASSWORD')}"
+            f"@{os.getenv('RDS_HOSTNAME')}:{os.getenv('RDS_PORT')}/{os.getenv('RDS_DB_NAME')}"
+        )
+        # Connection pool per process. Every gunicorn worker and job worker process has its
+        # own, so pool size + overflow times the processes must stay under RDS max_connections.
+        # Pre-ping replaces connections RDS dropped (failover, idle timeout) before a request
+        # uses them, and recycling retires connections before RDS or a NAT closes them.
+        self.SQLALCHEMY_ENGINE_OPTIONS = {
+            "pool_size": int(os.getenv('DB_POOL_SIZE', 5)),
+            "max_overflow": int(os.getenv('DB_MAX_OVERFLOW', 5)),
+            "pool_timeout": float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            "pool_recycle": int(os.getenv('DB_POOL_RECYCLE', 1800)),
+            "pool_pre_ping": os.getenv('DB_POOL_PRE_PING', 'true').lower() != 'false',
+        }
+
+
+CONFIGS = {
+    "development": DevelopmentConfig,
+    "production": ProductionConfig,
+}
+
+
+def get_config(env=None):
+    """
+    Config object for an environment.
+
+    Args:
+        env (str): "development"/"dev" or "production"/"prod". Defaults to the APP_ENV
+            environment variable, and to production when that isn't set.
+
+    Returns:
+        Config: A new config object, read from the current environment variables.
+    """
+    env = env or os.getenv('APP_ENV') or 'production'
+    if env.lower() not in ENVIRONMENTS:
+        raise ValueError(f"Unknown environment {env!r}, use one of: {', '.join(ENVIRONMENTS)}")
+    return CONFIGS[ENVIRONMENTS[env.lower()]]()
@@ -0,0 +1,166 @@
+# Compact binary storage format for power curves
+import json
+import struct
+import zlib
+from collections.abc import Mapping
+import numpy as np
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+# Blob layout (little endian):
+#   header  b'PC', version (uint8), flags (uint8), number of points n (uint32)
+#   body    n int32 durations (sorted) followed by n float32 watts, zlib compressed if flagged
+CURVE_MAGIC = b'PC'
+CURVE_VERSION = 1
+CURVE_HEADER = struct.Struct('<2sBBI')
+FLAG_ZLIB = 1
+# Curves with more points than this (full resolution curves) are compressed
+COMPRESS_MIN_POINTS = 512
+
+
+class PackedCurve(Mapping):
+    """
+    Read-only {duration: watts} view over two NumPy arrays.
+
+    Attributes:
+        durations (np.ndarray): int32 durations in seconds, sorted.
+        watts (np.ndarray): float32 best average power for each duration.
+
+    Notes:
+        Behaves like the dicts curves used to be stored as (keys are int, values are watts
+        rounded to 2 decimals), so existing callers keep working, while vectorized callers
+        can use the arrays directly. Arrays decoded from an uncompressed blob share its memory.
+    """
+
+    __slots__ = ('durations', 'watts')
+
+    def __init__(self, durations, watts):
+        self.durations = durations
+        self.watts = watts
+
+    @classmethod
+    def from_dict(cls, curve):
+        """Build from a {duration: watts} dict (keys may be strings, as in JSON)."""
+        items = sorted((int(d), float(p or 0)) for d, p in curve.items())
+        return cls(np.array([d for d, _ in items], dtype=np.int32),
+                   np.array([p for _, p in items], dtype=np.float32))
+
+    def _index(self, duration):
+        try:
+            duration = int(duration)
+        except (TypeError, ValueError):
+            return None
+        i = int(np.searchsorted(self.durations, duration))
+        return i if i < len(self.durations) and self.durations[i] == duration else None
+
+    def __getitem__(self, duration):
+        i = self._index(duration)
+        if i is None:
+            raise KeyError(duration)
+        return round(float(self.watts[i]), 2)
+
+    def __contains__(self, duration):
+        return self._index(duration) is not None
+
+    def __iter__(self):
+        return iter(self.durations.tolist())
+
+    def __len__(self):
+        return len(self.durations)
+
+    def items(self):
+        return list(zip(self.durations.tolist(), np.round(self.watts.astype(np.float64), 2).tolist()))
+
+    def values_at(self, durations, fill=0.0):
+        """Watts for each of `durations` as a float32 array, `fill` where a duration is missing."""
+        durations = np.asarray(durations, dtype=np.int64)
+        result = np.full(len(durations), fill, dtype=np.float32)
+        if len(self.durations):
+            i = np.minimum(np.searchsorted(self.durations, durations), len(self.durations) - 1)
+            found = self.durations[i] == durations
+            result[found] = self.watts[i[found]]
+        return result
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"PackedCurve({self.to_dict()!r})"
+
+
+def encode_curve(curve, compress=None):
+    """
+    Encode a curve as a versioned binary blob.
+
+    Args:
+        curve (dict or PackedCurve): {duration: watts}.
+        compress (bool): Force compression on or off. Defaults to compressing curves with
+            more than COMPRESS_MIN_POINTS points.
+
+    Returns:
+        bytes: The encoded curve.
+    """
+    if not isinstance(curve, PackedCurve):
+        curve = PackedCurve.from_dict(curve)
+    body = (curve.durations.astype('<i4').tobytes()
+            + curve.watts.astype('<f4').tobytes())
+    if compress is None:
+        compress = len(curve) > COMPRESS_MIN_POINTS
+    flags = 0
+    if compress:
+        body = zlib.compress(body)
+        flags |= FLAG_ZLIB
+    return CURVE_HEADER.pack(CURVE_MAGIC, CURVE_VERSION, flags, len(curve)) + body
+
+
+def decode_curve(value):
+    """
+    Decode a stored curve into a PackedCurve.
+
+    Args:
+        value (bytes or str or dict): A binary blob, or a curve still stored as JSON
+            (text, UTF-8 bytes or an already parsed dict) from before the migration.
+
+    Returns:
+        PackedCurve or None: The curve, or None for a NULL value.
+    """
+    if value is None:
+        return None
+    if isinstance(value, Mapping):
+        return value if isinstance(value, PackedCurve) else PackedCurve.from_dict(value)
+    if isinstance(value, str):
+        return PackedCurve.from_dict(json.loads(value))
+    value = bytes(value) if isinstance(value, memoryview) else value
+    if value[:2] != CURVE_MAGIC:
+        return PackedCurve.from_dict(json.loads(value))  # Legacy JSON row
+    _, version, flags, n = CURVE_HEADER.unpack_from(value)
+    if version != CURVE_VERSION:
+        raise ValueError(f"Unsupported power curve format version {version}")
+    body, offset = value, CURVE_HEADER.size
+    if flags & FLAG_ZLIB:
+        body, offset = zlib.decompress(value[CURVE_HEADER.size:]), 0
+    # np.frombuffer shares memory with the blob, nothing is copied
+    durations = np.frombuffer(body, dtype='<i4', count=n, offset=offset)
+    watts = np.frombuffer(body, dtype='<f4', count=n, offset=offset + 4 * n)
+    return PackedCurve(durations, watts)
+
+
+class CurveBinary(TypeDecorator):
+    """
+    Column type storing {duration: watts} curves with encode_curve and loading them as
+    PackedCurve. Rows still holding JSON are decoded too, so the table can be converted
+    in the background (see utils/migrate_curves.py).
+    """
+    impl = LargeBinary
+    cache_ok = True
+    hashable = False  # Like JSON, so the ORM doesn't try to hash curves when uniquing rows
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else encode_curve(value)
+
+    def process_result_value(self, value, dialect):
+        return decode_curve(value)
+
+    def compare_values(self, x, y):
+        if x is None or y is None:
+            return x is y
+        return dict(x.items()) == dict(y.items())
@@ -0,0 +1,214 @@
+# Streaming bulk export of stored power curves to CSV or Parquet
+import csv
+import io
+import os
+import tempfile
+import numpy as np
+from models import db, PowerCurve, ActivityCurve
+from app.powercurve import DEFAULT_DURATIONS
+
+# Rows fetched (and written) per batch
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+# Exports queued from /export are written here by the job worker, and served from here
+EXPORT_DIR = os.getenv(
+    'EXPORT_DIR',
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'instance', 'exports'))
+)
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+# Export name -> model. "curves" is every user's PowerCurve, "activities" the per-activity curves
+EXPORT_TABLES = {
+    'curves': PowerCurve,
+    'activities': ActivityCurve,
+}
+
+
+def export_columns(table):
+    """
+    Column names and types of an export.
+
+    Returns:
+        list: (name, type) pairs, type being "int", "str", "float" or "time". The curve is
+            spread over one watts_<d>s column per standard duration (empty where the curve
+            doesn't have it).
+    """
+    columns = [("id", "int"), ("user_id", "int"), ("strava_id", "str"), ("activity_id", "str")]
+    if table == 'activities':
+        columns += [("start_date", "time"), ("normalized_power", "float")]
+    columns.append(("created_at", "time"))
+    return columns + [(f"watts_{d}s", "float") for d in DEFAULT_DURATIONS]
+
+
+def iter_batches(table, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Read an export table in batches, in id order.
+
+    Yields:
+        dict: Column name -> list of values for up to `batch_size` rows.
+
+    Notes:
+        yield_per makes SQLAlchemy use a server-side cursor on PostgreSQL (on SQLite rows are
+        fetched as they are read anyway), so only one batch is in memory at a time however
+        many users there are.
+    """
+    model = EXPORT_TABLES[table]
+    fields = [model.id, model.user_id, model.strava_id, model.activity_id]
+    if table == 'activities':
+        fields += [model.start_date, model.normalized_power]
+    fields += [model.created_at, model.curve]
+    names = [name for name, _ in export_columns(table)]
+    result = db.session.execute(db.select(*fields).order_by(model.id), execution_options={"yield_per": batch_size})
+    for rows in result.partitions():
+        columns = list(zip(*rows))
+        watts = np.stack([curve.values_at(DEFAULT_DURATIONS, fill=np.nan) for curve in columns[-1]])
+        batch = dict(zip(names, (list(values) for values in columns[:-1])))
+        for i, d in enumerate(DEFAULT_DURATIONS):
+            batch[f"watts_{d}s"] = [None if p != p else round(float(p), 2) for p in watts[:, i]]  # NaN -> empty
+        yield batch
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def stream_csv(table, batch_size=EXPORT_BATCH_SIZE):
+    """Yield a CSV export as UTF-8 chunks, one per batch (after the header)."""
+    names = [name for name, _ in export_columns(table)]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    yield buffer.getvalue().encode()
+    for batch in iter_batches(table, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(zip(*([_csv_value(v) for v in batch[name]] for name in names)))
+        yield buffer.getvalue().encode()
+
+
+class _ByteChunks:
+    """Write-only file object that keeps what was written until it is taken."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _import_pyarrow():
+    # Only imported for Parquet exports, so CSV exports work without pyarrow
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow), or use CSV.")
+    return pa, pq
+
+
+def stream_parquet(table, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield a Parquet export in chunks, one row group per batch.
+
+    Notes:
+        Parquet only appends (the footer comes last), so each row group is sent as soon as
+        it is written.
+    """
+    pa, pq = _import_pyarrow()
+    types = {"int": pa.int64(), "str": pa.string(), "float": pa.float64(), "time": pa.timestamp("us")}
+    schema = pa.schema([(name, types[kind]) for name, kind in export_columns(table)])
+    sink = _ByteChunks()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='zstd') as writer:
+        for batch in iter_batches(table, batch_size):
+            writer.write_table(pa.Table.from_pydict(batch, schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+
+def stream_export(table='curves', fmt='csv', batch_size=EXPORT_BATCH_SIZE):
+    """
+    Export a table of curves, as an iterator of byte chunks.
+
+    Args:
+        table (str): "curves" (PowerCurve rows) or "activities" (ActivityCurve rows).
+        fmt (str): "csv" or "parquet".
+        batch_size (int): Rows read and written at a time.
+
+    Returns:
+        iterator: Chunks of the file, to write to a file or stdout.
+
+    Raises:
+        ValueError: Unknown table or format.
+        RuntimeError: Parquet was asked for but pyarrow isn't installed (raised here, before
+            anything is streamed).
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown export {table!r}, use one of: {', '.join(EXPORT_TABLES)}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, use one of: {', '.join(EXPORT_FORMATS)}")
+    if fmt == 'parquet':
+        _import_pyarrow()
+    return (stream_parquet if fmt == 'parquet' else stream_csv)(table, batch_size)
+
+
+def export_job_kind(table, fmt):
+    """CurveJob kind writing one export, so each table and format is queued at most once."""
+    return f"export_{table}_{fmt}"
+
+
+def export_path(table, fmt):
+    """File holding the latest finished export of a table in a format."""
+    return os.path.join(EXPORT_DIR, f"{table}.{fmt}")
+
+
+def write_export(table='curves', fmt='csv', batch_size=EXPORT_BATCH_SIZE):
+    """
+    Write an export to its file in EXPORT_DIR (run by the job worker).
+
+    Returns:
+        int: Bytes written.
+
+    Notes:
+        The file is written under a temporary name and renamed into place, so a download
+        never sees a partial file and the previous export is served until the new one is done.
+    """
+    chunks = stream_export(table, fmt, batch_size)
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=EXPORT_DIR, suffix='.tmp')
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp_path, export_path(table, fmt))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size
@@ -0,0 +1,15 @@
+# Objects shared by the app factory and the blueprints (one of each per process)
+from flask_login import LoginManager
+from app.strava import StravaClient
+from app.stream_cache import StreamCache
+from app.plots import PlotCache
+
+# Initialize the flask login management
+login_manager = LoginManager()
+login_manager.login_view = 'auth.landing'  # Redirect to landing page if not logged in
+
+# Shared Strava API client (keeps connections alive between requests). No connection is opened
+# until the first request, so a client created in the gunicorn master is safe to fork.
+strava = StravaClient(stream_cache=StreamCache())
+# Cache of rendered plots shared by all workers
+plot_cache = PlotCache()
@@ -0,0 +1,51 @@
+# Application factory: builds the Flask app for an environment with its blueprints
+import os
+from dotenv import load_dotenv
+from flask import Flask
+from models import db
+from app.config import get_config
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def create_app(env=None, **overrides):
+    """
+    Build the Flask application.
+
+    Args:
+        env (str): "development" or "production" (see app.config.get_config). Defaults to the
+            APP_ENV environment variable.
+        **overrides: Config values set on top of the environment's config.
+
+    Returns:
+        Flask: The configured application.
+
+    Notes:
+        All one-off work (creating missing tables, wiring the metrics) happens here, so with
+        gunicorn --preload it runs once in the master and the forked workers start ready. The
+        connections opened for it are closed again, so no worker shares a database socket
+        with the master.
+    """
+    load_dotenv()  # Variables from a .env file (already set variables win)
+    config = get_config(env)
+    # Templates, static files and instance/ live next to main.py, not in the app package
+    app = Flask(__name__, root_path=ROOT_DIR, instance_path=os.path.join(ROOT_DIR, 'instance'))
+    app.config.from_object(config)
+    app.config.update(overrides)
+    print(f"Running in {config.LABEL}")
+
+    db.init_app(app)
+    from app.extensions import login_manager
+    login_manager.init_app(app)
+
+    from app.routes import register_blueprints
+    register_blueprints(app)
+
+    from app.instrumentation import instrument_app
+    with app.app_context():
+        if app.config['CREATE_TABLES']:
+            db.create_all()  # Create the database tables if they don't exist
+        # Request latency, template rendering and database timing for /metrics
+        instrument_app(app, db.engine)
+        db.engine.dispose()
+    return app
@@ -0,0 +1,161 @@
+# Keeping the stored power curves up to date with new activities
+from datetime import datetime
+import numpy as np
+from models import db, User, PowerCurve, ActivityCurve
+from app.powercurve import (
+    DEFAULT_DURATIONS, mean_max_curves, normalized_powers, curve_to_dict, merge_curve_dict, align_curves,
+)
+from app.rankings import save_curve_ranks, delete_curve_ranks
+from app.instrumentation import span
+from app.cache import curve_key, invalidate_after_commit
+
+
+def parse_start_date(activity):
+    """Parse the 'start_date' of a Strava activity summary into a naive UTC datetime."""
+    start_date = activity.get("start_date")
+    if not start_date:
+        return None
+    return datetime.fromisoformat(start_date.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def lock_user_curves(user_id):
+    """
+    Lock the user until the transaction ends, so curve updates of one user from different
+    workers (refresh, file import and webhook jobs) run one after another.
+
+    Notes:
+        The aggregate PowerCurve and the rankings are read, merged and written back, so two
+        concurrent updates would silently lose one merge. PostgreSQL locks the user's row with
+        SELECT ... FOR UPDATE. SQLite ignores FOR UPDATE, so a no-op UPDATE of the row takes
+        its database write lock instead. Take it after talking to Strava, not before.
+    """
+    if db.session.get_bind().dialect.name == 'sqlite':
+        db.session.execute(db.update(User).where(User.id == user_id).values(id=User.id))
+    else:
+        db.session.execute(db.select(User.id).where(User.id == user_id).with_for_update())
+
+
+def save_activity_curves(user, rides_with_power, start_dates=None, durations=DEFAULT_DURATIONS):
+    """
+    Compute and store the curves of new activities and fold them into the user's PowerCurve.
+
+    Args:
+        user (User): Owner of the activities.
+        rides_with_power (list): (activity_id, watts) tuples, most recent first.
+        start_dates (dict): Optional activity_id -> start datetime.
+        durations (sequence): Durations in seconds.
+
+    Returns:
+        PowerCurve: The user's updated aggregate curve (not committed).
+
+    Notes:
+        Holds the user's lock (see lock_user_curves) until the caller commits. Rides another
+        job stored since they were fetched are skipped.
+    """
+    start_dates = start_dates or {}
+    if rides_with_power:
+        lock_user_curves(user.id)
+        stored = {
+            activity_id for (activity_id,) in
+            db.session.query(ActivityCurve.activity_id).filter(
+                ActivityCurve.user_id == user.id,
+                ActivityCurve.activity_id.in_([str(activity_id) for activity_id, _ in rides_with_power]))
+        }
+        rides_with_power = [ride for ride in rides_with_power if str(ride[0]) not in stored]
+    aggregate = PowerCurve.query.filter_by(user_id=user.id).order_by(PowerCurve.created_at.desc()).first()
+    if not rides_with_power:
+        return aggregate
+
+    # All new rides in one batch
+    curves = mean_max_curves([watts for _, watts in rides_with_power], durations)
+    normalized = normalized_powers([watts for _, watts in rides_with_power])
+    for (activity_id, _), powers, np_watts in zip(rides_with_power, curves, normalized):
+        db.session.add(ActivityCurve(
+            user_id=user.id,
+            strava_id=user.strava_id,
+            activity_id=str(activity_id),
+            start_date=start_dates.get(activity_id),
+            curve=curve_to_dict(durations, powers),
+            normalized_power=round(float(np_watts), 2) if np_watts > 0 else None
+        ))
+
+    # The aggregate is the elementwise max of every activity curve
+    best = curves.max(axis=0)
+    if aggregate:
+        aggregate.curve = merge_curve_dict(aggregate.curve, durations, best)
+        aggregate.activity_id = str(rides_with_power[0][0])
+    else:
+        aggregate = PowerCurve(
+            user_id=user.id,
+            strava_id=user.strava_id,
+            activity_id=str(rides_with_power[0][0]),
+            curve=curve_to_dict(durations, best)
+        )
+        db.session.add(aggregate)
+    # Keep the leaderboards in step with the new curve, and drop the cached one
+    save_curve_ranks(user.id, aggregate.curve)
+    invalidate_after_commit(curve_key(user.id))
+    return aggregate
+
+
+def refresh_user_curve(user, strava, access_token, activities, failed=None):
+    """
+    Fetch and compute only the rides in `activities` that the user doesn't have a curve for yet.
+
+    Args:
+        user (User): The user to refresh.
+        strava (StravaClient): Client used to download the watts streams.
+        access_token (str): Strava access token of the user.
+        activities (list): Activity summaries from /athlete/activities.
+        failed (list): If given, collects the IDs of rides whose stream download failed. They
+            have no curve yet, so the next refresh fetches them again.
+
+    Returns:
+        PowerCurve or None: The user's aggregate curve, or None if they have no rides with power.
+    """
+    seen = {
+        activity_id for (activity_id,) in
+        db.session.query(ActivityCurve.activity_id).filter_by(user_id=user.id)
+    }
+    new_rides = [ride for ride in activities if str(ride.get('id')) not in seen]
+    with span("strava_fetch"):
+        rides_with_power = strava.fetch_rides_with_power(access_token, new_rides, limit=len(new_rides), failed=failed)
+    start_dates = {ride['id']: parse_start_date(ride) for ride in new_rides}
+    with span("curve_compute"):
+        aggregate = save_activity_curves(user, rides_with_power, start_dates)
+    db.session.commit()
+    return aggregate
+
+
+def rebuild_user_curve(user):
+    """
+    Recompute the user's PowerCurve from the activity curves they still have.
+
+    Needed after activities are removed: the stored curve is a running maximum, so a deleted
+    ride's best efforts can't be taken out of it any other way.
+
+    Returns:
+        PowerCurve or None: The rebuilt curve (not committed), or None if no activities are left,
+            in which case the user's PowerCurve and rankings are removed.
+    """
+    lock_user_curves(user.id)
+    # Newest first, so the curve keeps pointing at the latest activity
+    rows = (db.session.query(ActivityCurve.activity_id, ActivityCurve.curve).filter_by(user_id=user.id)
+            .order_by(ActivityCurve.start_date.desc(), ActivityCurve.id.desc()).all())
+    aggregate = PowerCurve.query.filter_by(user_id=user.id).order_by(PowerCurve.created_at.desc()).first()
+    invalidate_after_commit(curve_key(user.id))
+    if not rows:
+        PowerCurve.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        delete_curve_ranks(user.id)
+        return None
+    durations, matrix = align_curves([curve for _, curve in rows])
+    # fmax skips NaN without warning about durations no remaining ride is long enough for (0 W)
+    curve = curve_to_dict(durations, np.nan_to_num(np.fmax.reduce(matrix, axis=0)))
+    if aggregate:
+        aggregate.curve = curve
+        aggregate.activity_id = rows[0][0]
+    else:
+        aggregate = PowerCurve(user_id=user.id, strava_id=user.strava_id, activity_id=rows[0][0], curve=curve)
+        db.session.add(aggregate)
+    save_curve_ranks(user.id, aggregate.curve)
+    return aggregate
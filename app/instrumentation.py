@@ -0,0 +1,235 @@
+# Timing spans and counters, exposed in the Prometheus text format on /metrics
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Set METRICS_DIR to a folder shared by the web and worker processes to report all of them
+# together (each process writes its own file, /metrics adds them up)
+METRICS_DIR = os.getenv('METRICS_DIR')
+# Seconds between writes of this process's metrics to METRICS_DIR
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUEST_SECONDS = 'powercurve_request_duration_seconds'
+SPAN_SECONDS = 'powercurve_span_duration_seconds'
+STRAVA_REQUESTS = 'powercurve_strava_requests_total'
+CACHE_LOOKUPS = 'powercurve_cache_lookups_total'
+DB_QUERIES = 'powercurve_db_queries_total'
+QUERY_BUDGET_EXCEEDED = 'powercurve_query_budget_exceeded_total'
+METRIC_HELP = {
+    REQUEST_SECONDS: ('histogram', 'Time to handle a request, by route, method and status.'),
+    SPAN_SECONDS: ('histogram', 'Time spent in each phase (strava, strava_fetch, curve_compute, db, render).'),
+    STRAVA_REQUESTS: ('counter', 'Requests sent to the Strava API, by endpoint and status.'),
+    CACHE_LOOKUPS: ('counter', 'Shared cache lookups, by cache (user, curve, user_count) and hit or miss.'),
+    DB_QUERIES: ('counter', 'Database queries sent while handling requests, by route and method.'),
+    QUERY_BUDGET_EXCEEDED: ('counter', 'Requests that sent more queries than QUERY_BUDGET, by route and method.'),
+}
+
+
+class Registry:
+    """
+    Counters and histograms of one process.
+
+    Attributes:
+        counters (dict): (name, labels) -> value.
+        histograms (dict): (name, labels) -> [count per bucket..., sum, count].
+
+    Notes:
+        labels is a sorted tuple of (key, value) pairs. Bucket counts are not cumulative here;
+        they are summed up when rendered.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def inc(self, name, labels=None, amount=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if value <= bound), len(LATENCY_BUCKETS))
+        with self._lock:
+            values = self.histograms.get(key)
+            if values is None:
+                values = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 3)
+            values[bucket] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def snapshot(self):
+        """JSON-friendly copy of everything recorded."""
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, list(labels), list(values)] for (name, labels), values in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        """Write the snapshot to METRICS_DIR (at most every METRICS_FLUSH_INTERVAL seconds)."""
+        now = time.monotonic()
+        if not METRICS_DIR or (not force and now - self._last_flush < METRICS_FLUSH_INTERVAL):
+            return
+        self._last_flush = now
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json"))
+
+
+registry = Registry()
+
+
+def _merge(snapshots):
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot["histograms"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+    return counters, histograms
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def render_metrics():
+    """
+    All metrics in the Prometheus text exposition format. With METRICS_DIR set, the metrics of
+    every process that wrote there are included.
+    """
+    snapshots = [registry.snapshot()]
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        own = f"metrics-{os.getpid()}.json"
+        for name in os.listdir(METRICS_DIR):
+            if name.startswith('metrics-') and name.endswith('.json') and name != own:
+                try:
+                    with open(os.path.join(METRICS_DIR, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # Being replaced right now
+    counters, histograms = _merge(snapshots)
+
+    lines = []
+    for name, (kind, help_text) in METRIC_HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_labels(labels)} {value}")
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), values):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {values[-2]}")
+            lines.append(f"{name}_count{_labels(labels)} {values[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def span(name):
+    """Time a block of code as one phase (recorded in SPAN_SECONDS under span=name)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(SPAN_SECONDS, time.perf_counter() - start, {"span": name})
+        registry.flush()
+
+
+def count_strava_request(endpoint, status):
+    """Count one request to the Strava API."""
+    registry.inc(STRAVA_REQUESTS, {"endpoint": endpoint, "status": str(status)})
+
+
+def count_cache_lookup(cache, hit):
+    """Count one lookup in the shared cache (see app/cache.py)."""
+    registry.inc(CACHE_LOOKUPS, {"cache": cache, "result": "hit" if hit else "miss"})
+
+
+def instrument_app(app, engine):
+    """
+    Record request latency per route, template render time and database time for a Flask app.
+
+    Args:
+        app (Flask): The application.
+        engine (sqlalchemy.engine.Engine): The database engine to time queries on.
+
+    Notes:
+        Queries are also counted per request. With the QUERY_BUDGET config set, a request that
+        sends more queries than that is logged and counted, which is how N+1 query patterns
+        (a query per user or per curve) show up in the load test (utils/load_test.py).
+    """
+    from flask import g, request, has_request_context, before_render_template, template_rendered
+    from sqlalchemy import event
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+        g.query_count = 0
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            registry.observe(REQUEST_SECONDS, time.perf_counter() - started,
+                             {"route": route, "method": request.method, "status": str(response.status_code)})
+            queries = g.pop('query_count', 0)
+            registry.inc(DB_QUERIES, {"route": route, "method": request.method}, queries)
+            budget = app.config.get('QUERY_BUDGET')
+            if budget and queries > budget:
+                registry.inc(QUERY_BUDGET_EXCEEDED, {"route": route, "method": request.method})
+                print(f"Query budget exceeded: {request.method} {request.full_path} sent {queries} "
+                      f"queries (budget {budget})")
+            registry.flush()
+        return response
+
+    def _render_started(sender, template, context, **extra):
+        g.setdefault('render_started', []).append(time.perf_counter())
+
+    def _render_finished(sender, template, context, **extra):
+        if g.get('render_started'):
+            registry.observe(SPAN_SECONDS, time.perf_counter() - g.render_started.pop(), {"span": "render"})
+
+    before_render_template.connect(_render_started, app, weak=False)
+    template_rendered.connect(_render_finished, app, weak=False)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _query_started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+        # Only queries sent while handling a request (not the job worker's)
+        if has_request_context() and 'query_count' in g:
+            g.query_count += 1
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _query_finished(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('query_started')
+        if started:
+            registry.observe(SPAN_SECONDS, time.perf_counter() - started.pop(), {"span": "db"})
+
+    @event.listens_for(engine, 'handle_error')
+    def _query_failed(context):
+        if context.connection is not None and context.connection.info.get('query_started'):
+            context.connection.info['query_started'].pop()
@@ -0,0 +1,318 @@
+# Database-backed job queue for power curve computation (run by worker.py)
+import os
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.exc import IntegrityError
+from models import db, User, ActivityCurve, CurveJob
+from app.ingest import refresh_user_curve
+from app.webhooks import (EVENT_JOB_KIND, apply_activity_events, pending_events,
+                          users_with_stranded_events)
+from app.metrics import recompute_metrics
+from app.export import EXPORT_FORMATS, EXPORT_TABLES, export_job_kind, write_export
+from app.instrumentation import registry, span
+
+# Seconds between queue polls when there's nothing to do
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+# Running jobs without a heartbeat for this many seconds are assumed to belong to a dead
+# worker and retried
+JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', 600))
+# Seconds between the heartbeats of a running job (well under JOB_TIMEOUT)
+JOB_HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', 30))
+# Done and failed jobs are deleted this many seconds after they finished
+JOB_RETENTION = int(os.getenv('JOB_RETENTION', 7 * 24 * 60 * 60))
+# A /powercurve view doesn't queue a refresh if one finished less than this many seconds ago
+REFRESH_INTERVAL = int(os.getenv('REFRESH_INTERVAL', 300))
+# Job kind computing the full resolution curve of /powercurve?resolution=full, and how many
+# seconds its result is shown before the next view computes it again
+FULL_CURVE_JOB_KIND = 'full_curve'
+FULL_CURVE_MAX_AGE = int(os.getenv('FULL_CURVE_MAX_AGE', 600))
+# Seconds between checks for webhook events that no job will pick up
+EVENT_SWEEP_INTERVAL = float(os.getenv('EVENT_SWEEP_INTERVAL', 60))
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def job_to_dict(job):
+    """JSON-friendly view of a job for the status endpoint."""
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def enqueue_job(user_id, kind='refresh', payload=None, reuse_seconds=None):
+    """
+    Queue a job for a user, or return the job that is already queued or running.
+
+    Args:
+        user_id (int): The user the job is for, None for jobs that aren't (exports).
+        kind (str): Handler name (see JOB_HANDLERS).
+        payload (dict): Extra arguments for the handler.
+        reuse_seconds (int): Also return a job of this kind that finished successfully less
+            than this many seconds ago, instead of queueing the same work again.
+
+    Returns:
+        CurveJob: The new or existing job.
+    """
+    active = CurveJob.query.filter(CurveJob.user_id == user_id, CurveJob.kind == kind,
+                                   CurveJob.status.in_(ACTIVE_STATUSES))
+    reusable = CurveJob.status.in_(ACTIVE_STATUSES)
+    if reuse_seconds:
+        reusable = db.or_(reusable, db.and_(CurveJob.status == 'done',
+                                            CurveJob.finished_at >= _now() - timedelta(seconds=reuse_seconds)))
+    existing = (CurveJob.query.filter(CurveJob.user_id == user_id, CurveJob.kind == kind, reusable)
+                .order_by(CurveJob.id.desc()).first())
+    if existing:
+        return existing
+    job = CurveJob(user_id=user_id, kind=kind, payload=payload, status='queued')
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request queued the same job first
+        db.session.rollback()
+        return active.first()
+    return job
+
+
+def claim_next_job():
+    """
+    Claim the oldest queued job (or a running job whose worker stopped) for this worker.
+
+    Notes:
+        The claim is a conditional UPDATE, so when several workers race for the same job
+        only the one whose update changes a row gets it. This works on SQLite and Postgres.
+        A running job is only taken over once its heartbeat (see run_job) is JOB_TIMEOUT
+        seconds old, so long jobs of live workers are never run twice.
+    """
+    cutoff = _now() - timedelta(seconds=JOB_TIMEOUT)
+    claimable = db.or_(
+        CurveJob.status == 'queued',
+        db.and_(CurveJob.status == 'running',
+                db.func.coalesce(CurveJob.heartbeat_at, CurveJob.started_at) < cutoff),
+    )
+    for job_id, status in (CurveJob.query.filter(claimable).order_by(CurveJob.id)
+                           .with_entities(CurveJob.id, CurveJob.status).limit(10)):
+        now = _now()
+        claimed = (CurveJob.query.filter(CurveJob.id == job_id, CurveJob.status == status, claimable)
+                   .update({"status": "running", "started_at": now, "heartbeat_at": now},
+                           synchronize_session=False))
+        db.session.commit()
+        if claimed:
+            return db.session.get(CurveJob, job_id)
+    return None
+
+
+def run_refresh(job, strava):
+    """Fetch the user's recent activities and compute curves for the new ones."""
+    user = db.session.get(User, job.user_id)
+    if not user:
+        raise RuntimeError("User not found")
+    activities = strava.get_activities(user.access_token, per_page=20, page=1)
+    if activities is None:
+        raise RuntimeError("Failed to fetch activities from Strava.")
+    before = ActivityCurve.query.filter_by(user_id=user.id).count()
+    refresh_user_curve(user, strava, user.access_token, activities)
+    after = ActivityCurve.query.filter_by(user_id=user.id).count()
+    if after > before:
+        recompute_metrics([user.id])
+    return {"new_activities": after - before}
+
+
+def run_import_files(job, strava):
+    """
+    Import every file waiting in the user's upload folder, then delete them.
+
+    Notes:
+        An upload made while this job is queued or running is merged into it (see enqueue_job),
+        so the folder is read again until nothing new has arrived.
+    """
+    # Imported here so the web process, which only enqueues, never loads the file parsers
+    from app.activity_files import import_activity_files, find_activity_files, user_upload_dir
+    user = db.session.get(User, job.user_id)
+    if not user:
+        raise RuntimeError("User not found")
+    totals = {"imported": 0, "skipped": 0, "errors": []}
+    folder = user_upload_dir(user.id)
+    while True:
+        paths = find_activity_files([folder]) if os.path.isdir(folder) else []
+        if not paths:
+            if totals["imported"]:
+                recompute_metrics([user.id])
+            return totals
+        result = import_activity_files(user, paths)
+        for key in totals:
+            totals[key] += result[key]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Deleted with the user's data in the meantime
+
+
+def run_activity_events(job, strava):
+    """
+    Apply the user's pending Strava webhook events (see app/webhooks.py).
+
+    Notes:
+        Events that arrive while this job is queued or running are merged into it (see
+        enqueue_job), so pending events are read again until none are left.
+    """
+    user = db.session.get(User, job.user_id)
+    if not user:
+        raise RuntimeError("User not found")
+    totals = {"added": 0, "removed": 0, "ignored": 0}
+    while True:
+        events = pending_events(user.id)
+        if not events:
+            if totals["added"] or totals["removed"]:
+                recompute_metrics([user.id])
+            return totals
+        result = apply_activity_events(user, strava, events)
+        for key in totals:
+            totals[key] += result[key]
+
+
+def run_full_curve(job, strava):
+    """
+    Compute every duration of the user's 5 latest rides with power for
+    /powercurve?resolution=full.
+
+    Returns:
+        dict: {"chart": chart_data payload, or None if no ride has power}. Full resolution
+            curves are only shown, the stored curve keeps the standard durations.
+    """
+    import numpy as np
+    from app.powercurve import full_mean_max_curve, combine_curves, curve_to_dict
+    from app.plots import chart_data, plot_points
+    user = db.session.get(User, job.user_id)
+    if not user:
+        raise RuntimeError("User not found")
+    activities = strava.get_activities(user.access_token, per_page=20, page=1)
+    if activities is None:
+        raise RuntimeError("Failed to fetch activities from Strava.")
+    with span("strava_fetch"):
+        rides_with_power = strava.fetch_rides_with_power(user.access_token, activities, limit=5)
+    if not rides_with_power:
+        return {"chart": None}
+    with span("curve_compute"):
+        curves = [full_mean_max_curve(watts) for _, watts in rides_with_power]
+        curve_values = combine_curves([curve for curve, _ in curves])
+    powercurve = curve_to_dict(np.arange(1, len(curve_values) + 1), curve_values)
+    # Thousands of points, so the chart uses a log scale and log-spaced durations
+    data = chart_data([{"label": "Last 5 rides", "curve": dict(zip(*plot_points(powercurve)))}], xscale="log")
+    # Exact up to the first duration a ride only has an estimate for (a long, very steady ride)
+    data["exact_seconds"] = min((exact for curve, exact in curves if exact < len(curve)), default=None)
+    return {"chart": data}
+
+
+def run_export(job, strava):
+    """Write a bulk export queued from /export (see app/export.py)."""
+    table, fmt = job.payload["table"], job.payload["format"]
+    return {"table": table, "format": fmt, "bytes": write_export(table, fmt)}
+
+
+def prune_jobs(retention=JOB_RETENTION):
+    """Delete done and failed jobs that finished more than `retention` seconds ago. Returns how many."""
+    cutoff = _now() - timedelta(seconds=retention)
+    deleted = CurveJob.query.filter(CurveJob.status.in_(('done', 'failed')),
+                                    CurveJob.finished_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def enqueue_stranded_events():
+    """Queue an event job for every user whose pending events have none. Returns how many."""
+    user_ids = users_with_stranded_events()
+    for user_id in user_ids:
+        enqueue_job(user_id, kind=EVENT_JOB_KIND)
+    return len(user_ids)
+
+
+# Job kind -> handler(job, strava) returning the job result
+JOB_HANDLERS = {
+    'refresh': run_refresh,
+    'import_files': run_import_files,
+    EVENT_JOB_KIND: run_activity_events,
+    FULL_CURVE_JOB_KIND: run_full_curve,
+    **{export_job_kind(table, fmt): run_export for table in EXPORT_TABLES for fmt in EXPORT_FORMATS},
+}
+
+
+def _heartbeat(engine, job_id, stop, interval):
+    # Runs next to the handler with its own connection, so it never touches the handler's
+    # session or transaction
+    while not stop.wait(interval):
+        try:
+            with engine.begin() as connection:
+                connection.execute(db.update(CurveJob)
+                                   .where(CurveJob.id == job_id, CurveJob.status == 'running')
+                                   .values(heartbeat_at=_now()))
+        except Exception as e:
+            print(f"Heartbeat of job {job_id} failed: {e}")
+
+
+def run_job(job, strava, heartbeat_interval=JOB_HEARTBEAT_INTERVAL):
+    """
+    Run a claimed job and record its result or error.
+
+    Notes:
+        While the handler runs, a thread refreshes the job's heartbeat_at every
+        heartbeat_interval seconds, so other workers don't take it over however long it takes.
+    """
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(db.engine, job.id, stop, heartbeat_interval), daemon=True)
+    beat.start()
+    try:
+        job.result = JOB_HANDLERS[job.kind](job, strava)
+        job.status = 'done'
+    except Exception as e:
+        db.session.rollback()
+        traceback.print_exc()
+        job.status = 'failed'
+        job.error = str(e)
+    finally:
+        stop.set()
+        beat.join()
+    job.finished_at = _now()
+    db.session.commit()
+
+
+def work(app, strava, once=False, poll_interval=JOB_POLL_INTERVAL):
+    """
+    Worker loop: claim and run jobs until stopped.
+
+    Args:
+        app (Flask): The application (for the database connection).
+        strava (StravaClient): Client used by the job handlers.
+        once (bool): Stop when the queue is empty instead of polling forever.
+        poll_interval (float): Seconds to wait when the queue is empty.
+    """
+    last_sweep = None
+    with app.app_context():
+        while True:
+            job = claim_next_job()
+            if job:
+                run_job(job, strava)
+                continue
+            # Throttled, so a user whose events keep failing isn't retried on every poll
+            if last_sweep is None or (not once and time.monotonic() - last_sweep >= EVENT_SWEEP_INTERVAL):
+                last_sweep = time.monotonic()
+                prune_jobs()
+                if enqueue_stranded_events():
+                    continue
+            db.session.remove()
+            registry.flush(force=once)  # Let /metrics see this worker's latest numbers
+            if once:
+                return
+            time.sleep(poll_interval)
@@ -0,0 +1,84 @@
+# Critical power, W', FTP and normalized power derived from the stored curves
+from datetime import datetime, timezone
+from models import db, ActivityCurve, CurveMetrics
+from app.compare import latest_curves
+from app.powercurve import align_curves, fit_critical_power, estimate_ftp
+
+# Metrics that can be ranked, with their display names and units
+METRICS = {
+    "ftp": ("FTP", "W"),
+    "critical_power": ("Critical power", "W"),
+    "w_prime": ("W'", "J"),
+    "normalized_power": ("Best normalized power", "W"),
+}
+
+
+def _rounded(value, digits=1):
+    return None if value != value else round(float(value), digits)  # NaN -> None
+
+
+def recompute_metrics(user_ids=None):
+    """
+    Recompute and store the metrics of many users in one batch.
+
+    Args:
+        user_ids (list): Users to recompute (default: every user with a curve).
+
+    Returns:
+        int: Number of users whose metrics were stored.
+
+    Notes:
+        Two queries load every latest curve and every user's best normalized power, all curves
+        are fitted together (see fit_critical_power), and the rows are written with one bulk
+        insert, so the cost grows with the data, not with per-user round trips.
+    """
+    latest = latest_curves(user_ids)
+    best_np = db.session.query(ActivityCurve.user_id, db.func.max(ActivityCurve.normalized_power))
+    if user_ids is not None:
+        best_np = best_np.filter(ActivityCurve.user_id.in_(list(user_ids)))
+    best_np = dict(best_np.group_by(ActivityCurve.user_id).all())
+
+    ids = list(latest)
+    durations, matrix = align_curves([curve for _, curve in latest.values()])
+    critical_power, w_prime, r_squared = fit_critical_power(durations, matrix)
+    ftp = estimate_ftp(durations, matrix, critical_power)
+
+    stale = CurveMetrics.query
+    if user_ids is not None:
+        stale = stale.filter(CurveMetrics.user_id.in_(list(user_ids)))
+    stale.delete(synchronize_session=False)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = [
+        {
+            "user_id": user_id,
+            "critical_power": _rounded(critical_power[i]),
+            "w_prime": _rounded(w_prime[i], 0),
+            "r_squared": _rounded(r_squared[i], 3),
+            "ftp": _rounded(ftp[i]),
+            "normalized_power": best_np.get(user_id),
+            "computed_at": now,
+        }
+        for i, user_id in enumerate(ids)
+    ]
+    if rows:
+        db.session.execute(db.insert(CurveMetrics), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def user_metrics(user_ids):
+    """{user_id: {metric: value}} for the given users (users without metrics are left out)."""
+    return {
+        row.user_id: {metric: getattr(row, metric) for metric in METRICS}
+        for row in CurveMetrics.query.filter(CurveMetrics.user_id.in_(list(user_ids)))
+    }
+
+
+def metric_leaderboard(metric, limit=10):
+    """[(user_id, value)] of the best users for a metric, best first."""
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric}")
+    column = getattr(CurveMetrics, metric)
+    rows = (CurveMetrics.query.filter(column.isnot(None)).order_by(column.desc())
+            .with_entities(CurveMetrics.user_id, column).limit(limit))
+    return [(user_id, value) for user_id, value in rows]
@@ -0,0 +1,181 @@
+# Rendering power curve charts and caching the PNGs on disk
+import hashlib
+import io
+import json
+import os
+import tempfile
+import numpy as np
+from app.stream_cache import EvictionTrigger, evict_lru
+
+# Directory for cached plots and the byte budget before old plots are evicted
+PLOT_CACHE_DIR = os.getenv(
+    'PLOT_CACHE_DIR',
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'instance', 'plot_cache'))
+)
+PLOT_CACHE_MAX_BYTES = int(os.getenv('PLOT_CACHE_MAX_BYTES', 128 * 1024 * 1024))
+# Bump when render_plot changes so old images aren't served for the new style
+PLOT_STYLE_VERSION = 1
+# Full resolution curves are drawn with this many log-spaced points
+MAX_PLOT_POINTS = 500
+
+
+def plot_points(curve):
+    """
+    Sorted (durations, watts) lists for a {duration: watts} curve. Curves with more than
+    MAX_PLOT_POINTS durations are thinned to log-spaced durations, which look the same on a
+    log axis.
+    """
+    durations = sorted(int(d) for d in curve)
+    if len(durations) > MAX_PLOT_POINTS:
+        keep = np.unique(np.geomspace(1, len(durations), MAX_PLOT_POINTS).astype(int) - 1)
+        durations = [durations[i] for i in keep]
+    powers = [curve[d] if d in curve else curve[str(d)] for d in durations]
+    return durations, powers
+
+
+def plot_key(spec):
+    """Hash of everything that affects the image, used as the cache key and ETag."""
+    payload = json.dumps([PLOT_STYLE_VERSION, spec], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def render_plot(spec):
+    """
+    Render a plot spec to PNG bytes.
+
+    Args:
+        spec (dict): {"title", "xscale", "series": [{"label", "x", "y", "marker", "linestyle", "color"}]}
+
+    Returns:
+        bytes: The PNG image.
+    """
+    # Imported here so only requests that actually render pay for matplotlib
+    import matplotlib
+    matplotlib.use('Agg')  # Use 'Agg' backend for non-GUI environments
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    for series in spec["series"]:
+        ax.plot(series["x"], series["y"], marker=series.get("marker"),
+                linestyle=series.get("linestyle", "-"), color=series.get("color"),
+                label=series.get("label"))
+    if spec.get("xscale"):
+        ax.set_xscale(spec["xscale"])
+    ax.set_xlabel('Duration (seconds)')
+    ax.set_ylabel('Power (watts)')
+    ax.set_title(spec.get("title", 'Power Curve'))
+    if any(series.get("label") for series in spec["series"]):
+        ax.legend()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    plt.close(fig)
+    return buf.getvalue()
+
+
+class PlotCache:
+    """
+    Size-bounded LRU cache of rendered plots shared by all worker processes.
+
+    Attributes:
+        directory (str): Folder holding <key>.json (the plot spec) and <key>.png files.
+        max_bytes (int): Byte budget. The least recently used files are deleted above it.
+
+    Notes:
+        Pages only register the spec of the plot they show (cheap) and link to the image
+        endpoint, which renders the PNG the first time it is requested. Because the key is a
+        hash of the spec, an unchanged curve or compare pair is never rendered twice.
+        Old files are evicted every few writes (see EvictionTrigger), not on every one.
+    """
+
+    def __init__(self, directory=PLOT_CACHE_DIR, max_bytes=PLOT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._eviction = EvictionTrigger(max_bytes)
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def _write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self._eviction.wrote(len(data)):
+            evict_lru(self.directory, self.max_bytes, ('.png', '.json'))
+
+    def register(self, spec):
+        """Remember a plot spec and return its key (nothing is rendered here)."""
+        key = plot_key(spec)
+        path = self._path(key, '.json')
+        if os.path.exists(path):
+            os.utime(path)  # Mark as recently used
+        else:
+            self._write(path, json.dumps(spec).encode('utf-8'))
+        return key
+
+    def get_png(self, key):
+        """
+        PNG bytes for a registered plot, rendering and caching it on first use.
+
+        Returns:
+            bytes or None: The image, or None if the key is unknown (or was evicted).
+        """
+        if len(key) != 64 or any(c not in '0123456789abcdef' for c in key):
+            return None  # Not a plot_key hash
+        png_path = self._path(key, '.png')
+        try:
+            with open(png_path, 'rb') as f:
+                png = f.read()
+            os.utime(png_path)  # Mark as recently used
+            return png
+        except FileNotFoundError:
+            pass
+        try:
+            with open(self._path(key, '.json'), 'rb') as f:
+                spec = json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+        png = render_plot(spec)
+        self._write(png_path, png)
+        return png
+
+
+def chart_data(series, xscale=None):
+    """
+    Compact JSON for client-side charts: one shared, sorted list of durations and one list of
+    watts per curve (None where a curve has no value for a duration).
+
+    Args:
+        series (list): [{"label": str, "curve": {duration: watts}, ...}], extra keys are kept.
+        xscale (str): Optional axis scale hint for the chart ('log').
+    """
+    curves = [{int(d): p for d, p in s["curve"].items()} for s in series]
+    durations = sorted(set().union(*curves)) if curves else []
+    data = {"durations": durations, "curves": []}
+    if xscale:
+        data["xscale"] = xscale
+    for s, curve in zip(series, curves):
+        entry = {k: v for k, v in s.items() if k != "curve"}
+        entry["watts"] = [curve.get(d) for d in durations]
+        data["curves"].append(entry)
+    return data
+
+
+def chart_plot_spec(data, title):
+    """Plot spec (see render_plot) for the same curves as a chart_data payload."""
+    spec = {"title": title, "series": []}
+    if data.get("xscale"):
+        spec["xscale"] = data["xscale"]
+    for curve in data["curves"]:
+        points = {d: p for d, p in zip(data["durations"], curve["watts"]) if p is not None}
+        x, y = plot_points(points)
+        spec["series"].append({"x": x, "y": y, "marker": "o" if len(x) <= 50 else None,
+                               "label": curve.get("label")})
+    return spec
@@ -0,0 +1,171 @@
+# Leaderboards and percentile rankings across all users
+import threading
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from models import db, CurveRank, CurveRankChange, RankVersion
+from app.compare import latest_curves
+
+
+# Versions of curve_rank_change kept, an index further behind reloads everything
+RANK_CHANGES_KEPT = 10000
+
+
+def _log_rank_change(user_id):
+    """
+    Increment the rankings version and log which user's rows change at it (part of the
+    caller's transaction, which holds the rank_version row lock until it ends).
+    """
+    bump = db.update(RankVersion).where(RankVersion.id == 1).values(version=RankVersion.version + 1)
+    if not db.session.execute(bump).rowcount:
+        # The first change ever: create the row, unless another transaction just did
+        try:
+            with db.session.begin_nested():
+                db.session.add(RankVersion(id=1, version=0))
+        except IntegrityError:
+            pass
+        db.session.execute(bump)
+    version = db.session.query(RankVersion.version).filter_by(id=1).scalar()
+    db.session.add(CurveRankChange(version=version, user_id=user_id))
+    if version % 100 == 0:
+        CurveRankChange.query.filter(CurveRankChange.version <= version - RANK_CHANGES_KEPT).delete(
+            synchronize_session=False)
+
+
+def save_curve_ranks(user_id, curve):
+    """
+    Replace a user's ranking rows with the values of their (new) curve. Call this whenever a
+    PowerCurve is saved; it is part of the caller's transaction.
+    """
+    _log_rank_change(user_id)
+    CurveRank.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    db.session.add_all([
+        CurveRank(user_id=user_id, duration=int(d), watts=float(p))
+        for d, p in curve.items() if p and float(p) > 0
+    ])
+
+
+def delete_curve_ranks(user_id):
+    """Remove a user from the rankings (part of the caller's transaction)."""
+    _log_rank_change(user_id)
+    CurveRank.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
+
+def rebuild_curve_ranks():
+    """Rebuild the whole ranking table from the latest PowerCurve of every user."""
+    _log_rank_change(None)
+    CurveRank.query.delete(synchronize_session=False)
+    for user_id, (_, curve) in latest_curves().items():
+        save_curve_ranks(user_id, curve)
+    db.session.commit()
+
+
+def _sorted_by_duration(rows):
+    # rows: (user_id, duration, watts) -> {duration: (ascending watts, user ids in that order)}
+    if not len(rows):
+        return {}
+    users, durations, watts = (np.asarray(column) for column in zip(*rows))
+    order = np.lexsort((watts, durations))
+    users, durations, watts = users[order].astype(np.int64), durations[order], watts[order].astype(np.float64)
+    starts = np.flatnonzero(np.r_[True, durations[1:] != durations[:-1]])
+    ends = np.r_[starts[1:], len(durations)]
+    return {int(durations[a]): (watts[a:b], users[a:b]) for a, b in zip(starts, ends)}
+
+
+class RankIndex:
+    """
+    Sorted in-memory copy of the curve_rank table, one sorted array per duration.
+
+    Attributes:
+        watts (dict): duration -> ascending float64 array of every user's best power.
+        users (dict): duration -> user IDs in the same order as watts.
+        version (int): The rank_version the index reflects.
+
+    Notes:
+        Percentiles are two binary searches and top-N is a slice off the end of the array.
+        sync() reads the one-row rank_version table, and when it moved on, only the rows of
+        the users logged in curve_rank_change since, so keeping the index current costs the
+        number of changed users, not a scan of every user.
+    """
+
+    def __init__(self):
+        self.watts = {}
+        self.users = {}
+        self.version = 0
+
+    def _load(self, rows):
+        # Build from scratch, one sort per duration
+        self.watts, self.users = {}, {}
+        for duration, (watts, users) in _sorted_by_duration(rows).items():
+            self.watts[duration], self.users[duration] = watts, users
+
+    def _replace(self, user_ids, rows):
+        # Drop every value of user_ids, then merge their new rows in (each sorted once)
+        changed = np.fromiter(user_ids, dtype=np.int64)
+        for duration in list(self.users):
+            keep = ~np.isin(self.users[duration], changed)
+            self.watts[duration], self.users[duration] = self.watts[duration][keep], self.users[duration][keep]
+        for duration, (watts, users) in _sorted_by_duration(rows).items():
+            values = self.watts.get(duration, np.empty(0))
+            position = np.searchsorted(values, watts)
+            self.watts[duration] = np.insert(values, position, watts)
+            self.users[duration] = np.insert(self.users.get(duration, np.empty(0, dtype=np.int64)), position, users)
+
+    def sync(self):
+        """Bring the index up to date with the curve_rank table."""
+        version = db.session.query(RankVersion.version).filter_by(id=1).scalar() or 0
+        if version == self.version:
+            return
+        fields = (CurveRank.user_id, CurveRank.duration, CurveRank.watts)
+        changed = set()
+        if self.version and version - self.version < RANK_CHANGES_KEPT:
+            changed = {user_id for (user_id,) in db.session.query(CurveRankChange.user_id).filter(
+                CurveRankChange.version > self.version, CurveRankChange.version <= version)}
+        if not changed or None in changed:
+            # Cold start, too far behind, or the whole table was rebuilt
+            self._load(db.session.query(*fields).all())
+        else:
+            self._replace(changed, db.session.query(*fields).filter(CurveRank.user_id.in_(changed)).all())
+        self.version = version
+
+    def percentile(self, duration, watts):
+        """Percentile rank (0-100) of `watts` among all users for a duration, or None."""
+        values = self.watts.get(duration)
+        if values is None or not len(values):
+            return None
+        below = np.searchsorted(values, watts, 'left')
+        at_or_below = np.searchsorted(values, watts, 'right')
+        return round(float(100.0 * (below + at_or_below) / (2 * len(values))), 1)
+
+    def top(self, duration, limit=10):
+        """[(user_id, watts)] of the best `limit` users for a duration, best first."""
+        values = self.watts.get(duration)
+        if values is None:
+            return []
+        users = self.users[duration]
+        return [(int(u), float(w)) for u, w in zip(users[::-1][:limit], values[::-1][:limit])]
+
+
+# One index per worker process
+_index = RankIndex()
+_index_lock = threading.Lock()
+
+
+def rank_index():
+    """The worker's RankIndex, synced with the database."""
+    with _index_lock:
+        _index.sync()
+        return _index
+
+
+def user_percentiles(user_id, curve):
+    """{duration: percentile} for every duration in a user's curve."""
+    index = rank_index()
+    return {
+        int(d): index.percentile(int(d), float(p))
+        for d, p in sorted(curve.items(), key=lambda item: int(item[0])) if p and float(p) > 0
+    }
+
+
+def leaderboard(duration, limit=10):
+    """[(user_id, watts)] of the best users for a duration."""
+    return rank_index().top(int(duration), limit)
@@ -0,0 +1,13 @@
+# Blueprints of the web app
+
+
+def register_blueprints(app):
+    """Register every blueprint on the app (called by create_app)."""
+    from app.routes.auth import bp as auth
+    from app.routes.curves import bp as curves
+    from app.routes.export import bp as export
+    from app.routes.leaderboard import bp as leaderboard
+    from app.routes.monitoring import bp as monitoring
+    from app.routes.webhooks import bp as webhooks
+    for blueprint in (auth, curves, export, leaderboard, monitoring, webhooks):
+        app.register_blueprint(blueprint)
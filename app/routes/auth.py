@@ -0,0 +1,148 @@
+# Signing in with Strava, the home page and deleting your data
+import shutil
+from flask import Blueprint, current_app, redirect, request, session, render_template, flash, url_for
+from flask_login import login_user, logout_user, login_required, current_user
+from models import db, User, PowerCurve, ActivityCurve, CurveJob, BackfillState, CurveMetrics, StravaEvent
+from app.extensions import login_manager, strava
+from app.cache import USER_COUNT_KEY, curve_key, get_user, get_user_count, invalidate, user_key
+from app.rankings import delete_curve_ranks
+from utils.pretty_print import pretty_print, print_db_state
+
+bp = Blueprint('auth', __name__)
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    # Runs on every request, so served from the shared cache
+    return get_user(int(user_id))
+
+@bp.route("/logout")
+@login_required
+def logout():
+    logout_user()
+    session.clear()  # <-- This drops all session data
+    return redirect("/")
+
+@bp.route("/home")
+@login_required
+def home():
+    return render_template("home.html", user=current_user)
+
+# Brings up the main page and asks if you have an account.
+@bp.route("/")
+def landing():
+    # If user is logged in, redirect to /home. Otherwise, show landing page.
+    if current_user.is_authenticated:
+        return redirect("/home")
+    else:
+        user_count = get_user_count()
+        return render_template("landing.html", user_count=user_count)
+
+# Authorizing the Application to work with your strava
+@bp.route("/authorize")
+def authorize():
+    # Redirect to Strava's OAuth page
+    auth_url = (
+        f"https://www.strava.com/oauth/authorize"
+        f"?client_id={current_app.config['STRAVA_CLIENT_ID']}"
+        f"&response_type=code"
+        f"&redirect_uri={current_app.config['STRAVA_REDIRECT_URI']}"
+        f"&approval_prompt=force"
+        f"&scope=read,activity:read"
+    )
+    return redirect(auth_url)
+
+# Strava OAuth callback route
+@bp.route("/strava/callback")
+def callback():
+    # Get the authorization code returned by Strava after user approval
+    code = request.args.get("code")
+
+    # Exchange the authorization code for an access token
+    token_response = strava.exchange_token(
+        code, current_app.config['STRAVA_CLIENT_ID'], current_app.config['STRAVA_CLIENT_SECRET']
+    )
+    # Parse the response JSON to extract the access token and athlete info
+    token_json = token_response.json()
+    pretty_print(token_json)  # Debug: print the full JSON response
+    access_token = token_json["access_token"]
+    session['access_token'] = access_token  # Store access token in session for later use
+    athlete = token_json["athlete"]
+    strava_id = str(athlete["id"])
+    strava_name = athlete.get("username", "")
+
+    # Look up the user in the database by Strava ID
+    user = User.query.filter_by(strava_id=strava_id).first()
+    created = not user
+    if created:
+        # If user does not exist, create a new user record
+        user = User(strava_id=strava_id, access_token=access_token, strava_name=strava_name)
+        db.session.add(user)
+    else:
+        # If user exists, update their access token and Strava username
+        user.access_token = access_token
+        user.strava_name = strava_name
+    db.session.commit()
+    # The cached user has the old token, and a new user changes the count
+    invalidate(user_key(user.id), *([USER_COUNT_KEY] if created else []))
+
+    # Log the user in using Flask-Login
+    session['strava_id'] = strava_id  # <-- Changed from 'athlete_id' to 'strava_id'
+    login_user(user)
+    # Redirect to the home page after successful login
+    return redirect("/home")
+
+# Route for deleting data of logged in users to to comply with GDPR
+@bp.route("/delete-data", methods=["POST"])
+def delete_data():
+    # Only needed here, so the web process doesn't load the file parsers at startup
+    from app.activity_files import user_upload_dir
+    try:
+        print_db_state(db, User, PowerCurve, label="BEFORE DELETE USER DATA")
+        # Get the current user's Strava ID
+        strava_id = current_user.strava_id
+        user_id = current_user.id
+
+        # Strava activities whose watts streams are in the on-disk stream cache (imported
+        # files have "file:" IDs and are never cached)
+        activity_ids = [activity_id for (activity_id,) in
+                        db.session.query(ActivityCurve.activity_id).filter_by(strava_id=strava_id)
+                        if activity_id.isdigit()]
+
+        # Delete all PowerCurve and ActivityCurve records associated with the user
+        PowerCurve.query.filter_by(strava_id=strava_id).delete()
+        ActivityCurve.query.filter_by(strava_id=strava_id).delete()
+        CurveJob.query.filter_by(user_id=current_user.id).delete()
+        BackfillState.query.filter_by(user_id=current_user.id).delete()
+        delete_curve_ranks(current_user.id)
+        CurveMetrics.query.filter_by(user_id=current_user.id).delete()
+        StravaEvent.query.filter_by(user_id=current_user.id).delete()
+        # Uploaded files that haven't been imported yet
+        shutil.rmtree(user_upload_dir(current_user.id), ignore_errors=True)
+
+        # Delete the user record
+        User.query.filter_by(strava_id=strava_id).delete()
+
+        # Commit changes to the database
+        db.session.commit()
+        invalidate(user_key(user_id), curve_key(user_id), USER_COUNT_KEY)
+        if strava.stream_cache is not None:
+            for activity_id in activity_ids:
+                strava.stream_cache.delete(activity_id)
+
+        # Log the user out after deleting their data
+        logout_user()
+
+        flash("Your data has been deleted successfully.", "success")
+        print_db_state(db, User, PowerCurve, label="After DELETE USER DATA")
+        return redirect(url_for("auth.home"))
+    except Exception as e:
+        db.session.rollback()
+        flash(f"An error occurred while deleting your data: {str(e)}", "error")
+        return redirect(url_for("auth.home"))
+
+
+# Route to publish the privacy policy template
+@bp.route("/privacy_policy")
+def privacy_policy():
+    return render_template("privacy_policy.html")
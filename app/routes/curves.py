@@ -0,0 +1,273 @@
+# Power curve pages, the chart JSON API, ride file uploads, background jobs and comparisons
+import os
+import uuid
+from datetime import datetime, timedelta
+from flask import Blueprint, current_app, redirect, request, session, render_template, flash, url_for, jsonify
+from flask_login import login_required, current_user
+from werkzeug.utils import secure_filename
+from models import db, User, PowerCurve, CurveJob
+from app.extensions import strava, plot_cache
+from app.jobs import (ACTIVE_STATUSES, FULL_CURVE_JOB_KIND, FULL_CURVE_MAX_AGE, REFRESH_INTERVAL,
+                      enqueue_job, job_to_dict)
+from app.windows import window_curve, window_curves
+from app.compare import latest_curves, envelope_series
+from app.cache import get_latest_curve
+from app.metrics import user_metrics
+from app.plots import chart_data, chart_plot_spec
+from utils.pretty_print import print_db_state
+
+bp = Blueprint('curves', __name__)
+
+
+# Grabbing data from specific activities to start
+@bp.route("/activities")
+def activities():
+    # Get the access token from session
+    access_token = session.get('access_token')
+    if not access_token:
+        return redirect('/authorize')
+
+    # Get the most recent 5 activities
+    data = strava.get_activities(access_token, per_page=10)
+    if data is None:
+        return "Failed to fetch activities from Strava.", 500
+
+    # Filter to the activities that are bike rides
+    html = "<h1>Your Recent Cycling Activities</h1><ul>"
+    count = 0
+    for activity in data:
+        if activity.get("type") == 'Ride':
+            name = activity.get("name")
+            distance_km = activity.get("distance", 0)/1000
+            html += f"<li>{name} - {distance_km:.2f} km </li>"
+            count += 1
+            if count >= 5:
+                break
+    html += "</ul>"
+
+    if count == 0:
+        html = "<h1>No recent cycling activities found.</h1>"
+
+    return html
+
+# Generate Power Curve from recent rides
+@bp.route("/powercurve")
+@login_required
+def powercurve():
+    html = "<h1>Your Power Curve</h1>"
+    # Debug statement
+    print_db_state(db, User, PowerCurve, label="BEFORE /powercurve")
+    
+    # Get the access token from session and if not reauthorize
+    access_token = session.get('access_token')
+    if not access_token:
+        return redirect('/authorize')
+    
+    # The logged in user (loaded from the cache by the login manager)
+    user = current_user
+
+    # "?resolution=full" gives every duration from 1 second up to the longest ride of the 5
+    # latest rides with power. Fetching the streams and computing every duration takes seconds,
+    # so it runs on the job worker and the page polls until it is done; the result is shown
+    # for FULL_CURVE_MAX_AGE seconds before a view computes it again.
+    if request.args.get("resolution") == "full":
+        job = enqueue_job(user.id, kind=FULL_CURVE_JOB_KIND, reuse_seconds=FULL_CURVE_MAX_AGE)
+        if job.status != 'done':
+            return render_template("powercurve.html", curve_data=None, api_url=None, job=job_to_dict(job))
+        if not job.result.get("chart"):
+            return "<h1>No rides with power data found.</h1>", 500
+        data = dict(job.result["chart"])
+        data["plot_url"] = url_for("curves.plot_image", key=plot_cache.register(chart_plot_spec(data, "Power Curve")))
+        return render_template("powercurve.html", curve_data=data, api_url=None, job=None)
+
+    # A background worker checks Strava for new rides and folds them into the stored
+    # PowerCurve, the page charts what is stored now (via /api/powercurve) and polls the job.
+    # With the Strava webhook set up (STRAVA_WEBHOOK_VERIFY_TOKEN) new rides are pushed to
+    # /strava/webhook instead, so once a user has a curve the page only reads.
+    has_curve = get_latest_curve(user.id) is not None
+    job = None
+    if not has_curve or not current_app.config["STRAVA_WEBHOOK_VERIFY_TOKEN"]:
+        # A refresh that finished a moment ago is reused, so reloading the page doesn't queue
+        # (and store) a new job every time
+        job = enqueue_job(user.id, reuse_seconds=REFRESH_INTERVAL)
+        job = job_to_dict(job) if job.status in ACTIVE_STATUSES else None
+    # Show the recent date windows, plus an optional "?start=YYYY-MM-DD&end=YYYY-MM-DD"
+    chart_args = {"windows": 1, "start": request.args.get("start"), "end": request.args.get("end")}
+    api_url = url_for("curves.api_powercurve", **chart_args)
+
+    # Display HTML in the site
+    return render_template(
+        "powercurve.html",
+        curve_data=None,
+        api_url=api_url if has_curve else None,
+        png_url=url_for("curves.api_powercurve_png", **chart_args),
+        job=job
+    )
+
+# Chart data for the current user's curve, optionally their date window curves (?windows=1,
+# ?start=&end=), the curves of other users (?compare=<id>,<id>) and the max/median/min of the
+# compared group (?envelope=1). ?compare=all compares against everyone, in which case only the
+# group envelope is returned. Returns (data, None), or (None, error response).
+def powercurve_chart_data():
+    compare_values = request.args.getlist("compare")
+    compare_all = "all" in compare_values
+    compare_ids = [
+        int(user_id) for value in compare_values
+        for user_id in value.split(",") if user_id.strip().isdigit()
+    ]
+    user_ids = [current_user.id] + [user_id for user_id in compare_ids if user_id != current_user.id]
+    if len(user_ids) == 1 and not compare_all:
+        # Just the user's own curve (the chart on /powercurve), from the cache
+        curve = get_latest_curve(current_user.id)
+        latest = {current_user.id: (current_user, curve)} if curve is not None else {}
+    else:
+        # Users and their latest curves in one query, however many users are compared
+        latest = latest_curves(None if compare_all else user_ids)
+    if current_user.id not in latest:
+        return None, (jsonify({"error": "No power curve found for the current user."}), 404)
+    if compare_all:
+        user_ids = [current_user.id]
+    metrics = user_metrics(user_ids)
+
+    show_windows = bool(request.args.get("windows"))
+    series = []
+    for user_id in user_ids:
+        if user_id in latest:
+            user, curve = latest[user_id]
+            label = "All time" if show_windows and user_id == current_user.id else f"{user.strava_name or user.strava_id}'s Curve"
+            series.append({"user_id": user_id, "label": label, "curve": curve,
+                           "metrics": metrics.get(user_id)})
+        if user_id == current_user.id and show_windows:
+            # Best curves over recent date windows
+            for label, curve in window_curves(current_user.id).items():
+                series.append({"user_id": user_id, "label": label, "curve": curve, "dashed": True})
+            start, end = request.args.get("start"), request.args.get("end")
+            if start or end:
+                try:
+                    start_date = datetime.fromisoformat(start) if start else None
+                    end_date = datetime.fromisoformat(end) + timedelta(days=1) if end else None
+                except ValueError:
+                    return None, (jsonify({"error": "Dates must be in YYYY-MM-DD format."}), 400)
+                series.append({"user_id": user_id, "label": f"{start or 'Start'} to {end or 'today'}",
+                               "curve": window_curve(current_user.id, start_date, end_date), "dashed": True})
+
+    if request.args.get("envelope"):
+        # Spread of the compared group (everyone but the current user)
+        group = [curve for user_id, (_, curve) in latest.items() if user_id != current_user.id]
+        if group:
+            series.extend(envelope_series(group))
+
+    return chart_data(series), None
+
+# Power curves as JSON for the charts (see powercurve_chart_data for the query arguments)
+@bp.route("/api/powercurve")
+@login_required
+def api_powercurve():
+    data, error = powercurve_chart_data()
+    return error or jsonify(data)
+
+# The same chart as a PNG, for the "Download as PNG" links. Only this registers the plot spec,
+# so the JSON requests behind every chart don't hash and write one. Redirects to the cached
+# image, whose URL browsers can cache for good.
+@bp.route("/api/powercurve.png")
+@login_required
+def api_powercurve_png():
+    data, error = powercurve_chart_data()
+    if error:
+        return error
+    return redirect(url_for("curves.plot_image", key=plot_cache.register(chart_plot_spec(data, "Power Curve"))))
+
+# Serve a cached plot image. The key is a hash of the plot contents, so the URL never changes
+# meaning and browsers can cache it for good.
+@bp.route("/plots/<key>.png")
+@login_required
+def plot_image(key):
+    if key in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        png = plot_cache.get_png(key)
+        if png is None:
+            return "Plot not found.", 404
+        response = current_app.response_class(png, mimetype="image/png")
+    response.set_etag(key)
+    response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
+# Upload FIT/TCX files from a head unit. The files are saved and imported by a worker.
+@bp.route("/upload", methods=["GET", "POST"])
+@login_required
+def upload():
+    # Only needed here, so the web process doesn't load the file parsers at startup
+    from app.activity_files import ACTIVITY_FILE_TYPES, user_upload_dir
+    job = None
+    if request.method == "POST":
+        files = [f for f in request.files.getlist("files")
+                 if f.filename and f.filename.lower().endswith(ACTIVITY_FILE_TYPES)]
+        if not files:
+            flash("Please choose .fit or .tcx files (optionally .gz).", "error")
+        else:
+            folder = user_upload_dir(current_user.id)
+            os.makedirs(folder, exist_ok=True)
+            for f in files:
+                f.save(os.path.join(folder, f"{uuid.uuid4().hex}_{secure_filename(f.filename)}"))
+            job = job_to_dict(enqueue_job(current_user.id, kind="import_files"))
+    return render_template("upload.html", job=job)
+
+# Queue a background refresh of the current user's power curve
+@bp.route("/jobs", methods=["POST"])
+@login_required
+def create_job():
+    job = enqueue_job(current_user.id)
+    return jsonify(job_to_dict(job)), 202
+
+# Poll the status of a background job
+@bp.route("/jobs/<int:job_id>")
+@login_required
+def job_status(job_id):
+    job = db.session.get(CurveJob, job_id)
+    if not job or job.user_id != current_user.id:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_to_dict(job))
+
+# Route to compare power curves between users
+@bp.route("/compare", methods=["GET", "POST"])
+@login_required
+def compare():
+    html = "<h1>Power Curve Comparison</h1>"
+    # Query all users (except the current user) who have at least one PowerCurve
+    users_with_curves = (
+        db.session.query(User)
+        .join(PowerCurve, User.id == PowerCurve.user_id)
+        .filter(User.id != current_user.id)
+        .distinct()
+        .all()
+    )
+
+    # Get the user IDs selected in the compare form (POST request)
+    # The multi-select in the HTML form has name="compare_user", and the "everyone" checkbox
+    # has name="compare_all"
+    other_user_ids = [user_id for user_id in request.form.getlist("compare_user") if user_id]
+    compare_all = bool(request.form.get("compare_all"))
+
+    # Check the current user has a PowerCurve
+    has_curve = get_latest_curve(current_user.id) is not None
+    if not has_curve:
+        # If the current user has no PowerCurve, prompt to generate one
+        html = "<h1>No power curve found for the current user. Please generate one first.</h1>"
+        return html, 404
+
+    # The chart is drawn in the browser from /api/powercurve. Comparing with more than one user
+    # also draws the max/median/min of the group.
+    compare_ids = "all" if compare_all else ",".join(other_user_ids) or None
+    chart_args = {"compare": compare_ids, "envelope": 1 if compare_all or len(other_user_ids) > 1 else None}
+    api_url = url_for("curves.api_powercurve", **chart_args)
+
+    # Render the compare.html template, passing all necessary data
+    return render_template(
+        "compare.html",
+        users_with_curves=users_with_curves,  # List of users for the dropdown
+        api_url=api_url,                      # URL of the curve data to chart
+        png_url=url_for("curves.api_powercurve_png", **chart_args),  # The same chart as an image
+        other_user_ids=other_user_ids,        # The selected users (if any)
+        compare_all=compare_all               # Whether everyone was selected
+    )
@@ -0,0 +1,59 @@
+# Bulk export of every user's power curves for analysis
+import os
+from flask import Blueprint, current_app, redirect, request, jsonify, send_file, url_for
+from models import db, CurveJob
+from app.export import EXPORT_FORMATS, EXPORT_TABLES, export_job_kind, export_path
+from app.jobs import enqueue_job, job_to_dict
+
+bp = Blueprint('export', __name__)
+
+
+# Exports hold everyone's data, so they are off unless EXPORT_TOKEN is set, and then need
+# "Authorization: Bearer <token>". Returns an error response, or None if the request may go on.
+def check_export_token():
+    token = current_app.config["EXPORT_TOKEN"]
+    if not token:
+        return jsonify({"error": "Export not enabled"}), 404
+    if request.headers.get("Authorization") != f"Bearer {token}":
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+
+# POST /export/curves.csv, /export/activities.parquet, ... queues the export on the job worker
+# (a full export takes longer than a sync gunicorn worker should be tied up for). Poll the
+# returned status_url, which redirects to the file once the job is done.
+@bp.route("/export/<table>.<fmt>", methods=["POST"])
+def queue_export(table, fmt):
+    error = check_export_token()
+    if error:
+        return error
+    if table not in EXPORT_TABLES or fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "Unknown export"}), 404
+    job = enqueue_job(None, kind=export_job_kind(table, fmt), payload={"table": table, "format": fmt})
+    return jsonify({**job_to_dict(job), "status_url": url_for("export.export_status", job_id=job.id)}), 202
+
+# Status of a queued export, or a redirect to its file once it is done
+@bp.route("/export/jobs/<int:job_id>")
+def export_status(job_id):
+    error = check_export_token()
+    if error:
+        return error
+    job = db.session.get(CurveJob, job_id)
+    if not job or job.user_id is not None or not (job.payload or {}).get("table"):
+        return jsonify({"error": "Job not found"}), 404
+    if job.status == 'done':
+        return redirect(url_for("export.export_file", table=job.payload["table"], fmt=job.payload["format"]))
+    return jsonify(job_to_dict(job))
+
+# GET /export/curves.csv, ... downloads the latest finished export
+@bp.route("/export/<table>.<fmt>")
+def export_file(table, fmt):
+    error = check_export_token()
+    if error:
+        return error
+    if table not in EXPORT_TABLES or fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "Unknown export"}), 404
+    path = export_path(table, fmt)
+    if not os.path.exists(path):
+        return jsonify({"error": "Not exported yet, POST to this URL to queue an export"}), 404
+    return send_file(path, mimetype=EXPORT_FORMATS[fmt], as_attachment=True, download_name=f"{table}.{fmt}")
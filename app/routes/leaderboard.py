@@ -0,0 +1,83 @@
+# Leaderboards by duration or derived metric, and percentile rankings
+from flask import Blueprint, request, render_template, jsonify
+from flask_login import login_required, current_user
+from models import User, PowerCurve
+from app.powercurve import DEFAULT_DURATIONS
+from app.rankings import user_percentiles, leaderboard as top_users
+from app.metrics import METRICS, user_metrics, metric_leaderboard
+
+bp = Blueprint('leaderboard', __name__)
+
+# Most entries one leaderboard request returns
+MAX_LEADERBOARD_LIMIT = 100
+
+
+def leaderboard_limit():
+    # ?limit= clamped to 1..MAX_LEADERBOARD_LIMIT (a negative limit would slice from the end)
+    return max(1, min(request.args.get("limit", 10, type=int), MAX_LEADERBOARD_LIMIT))
+
+
+# Leaderboard for one duration plus the current user's percentile for every duration
+@bp.route("/leaderboard")
+@login_required
+def leaderboard():
+    duration = request.args.get("duration", 300, type=int)
+    # ?metric=ftp (or another key of METRICS) ranks by a derived metric instead of a duration
+    metric = request.args.get("metric") if request.args.get("metric") in METRICS else None
+    entries = leaderboard_entries(duration, limit=leaderboard_limit(), metric=metric)
+    user_curve = (
+        PowerCurve.query.filter_by(user_id=current_user.id)
+        .order_by(PowerCurve.created_at.desc())
+        .first()
+    )
+    percentiles = user_percentiles(current_user.id, user_curve.curve) if user_curve else {}
+    return render_template(
+        "leaderboard.html",
+        duration=duration,
+        durations=DEFAULT_DURATIONS,
+        metric=metric,
+        metrics=METRICS,
+        entries=entries,
+        percentiles=percentiles,
+        my_metrics=user_metrics([current_user.id]).get(current_user.id)
+    )
+
+# Top users for a duration (?duration=300&limit=10) or a metric (?metric=ftp) as JSON
+@bp.route("/api/leaderboard")
+@login_required
+def api_leaderboard():
+    duration = request.args.get("duration", 300, type=int)
+    metric = request.args.get("metric")
+    if metric is not None and metric not in METRICS:
+        return jsonify({"error": f"Unknown metric. Choose one of: {', '.join(METRICS)}"}), 400
+    limit = leaderboard_limit()
+    if metric:
+        return jsonify({"metric": metric, "entries": leaderboard_entries(limit=limit, metric=metric)})
+    return jsonify({"duration": duration, "entries": leaderboard_entries(duration, limit)})
+
+# The current user's percentile (0-100) among all users for every duration
+@bp.route("/api/percentiles")
+@login_required
+def api_percentiles():
+    user_curve = (
+        PowerCurve.query.filter_by(user_id=current_user.id)
+        .order_by(PowerCurve.created_at.desc())
+        .first()
+    )
+    if not user_curve:
+        return jsonify({"error": "No power curve found for the current user."}), 404
+    return jsonify({"percentiles": user_percentiles(current_user.id, user_curve.curve)})
+
+def leaderboard_entries(duration=None, limit=10, metric=None):
+    # Best users for a duration (from the rankings) or for a metric (from curve_metrics)
+    top = metric_leaderboard(metric, limit) if metric else top_users(duration, limit)
+    # Look up the names of the top users in one query
+    names = {
+        user.id: user.strava_name or user.strava_id
+        for user in User.query.filter(User.id.in_([user_id for user_id, _ in top]))
+    }
+    key = "value" if metric else "watts"
+    return [
+        {"rank": rank, "user_id": user_id, "name": names.get(user_id), key: round(value, 2)}
+        for rank, (user_id, value) in enumerate(top, start=1)
+    ]
@@ -0,0 +1,15 @@
+# Prometheus metrics endpoint
+from flask import Blueprint, current_app, request
+from app.instrumentation import render_metrics
+
+bp = Blueprint('monitoring', __name__)
+
+
+# Prometheus metrics: request latency per route, phase timings and Strava call counts.
+# Set METRICS_TOKEN to require "Authorization: Bearer <token>" from the scraper.
+@bp.route("/metrics")
+def metrics():
+    token = current_app.config["METRICS_TOKEN"]
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return "Unauthorized", 401
+    return current_app.response_class(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,40 @@
+# Strava push subscription: new, changed and deleted activities are posted here
+from flask import Blueprint, current_app, request, jsonify
+from app.jobs import enqueue_job
+from app.webhooks import EVENT_JOB_KIND, record_event, save_raw_event
+
+bp = Blueprint('webhooks', __name__)
+
+
+# Validation handshake, sent once by Strava when the subscription is created. Answering with
+# the challenge proves we asked for it (the verify token is ours).
+@bp.route("/strava/webhook", methods=["GET"])
+def webhook_challenge():
+    token = current_app.config["STRAVA_WEBHOOK_VERIFY_TOKEN"]
+    if (not token or request.args.get("hub.mode") != "subscribe"
+            or request.args.get("hub.verify_token") != token):
+        return jsonify({"error": "Invalid verify token"}), 403
+    return jsonify({"hub.challenge": request.args.get("hub.challenge")})
+
+
+# Activity events. Strava wants a 200 within two seconds, so the event is only stored and a
+# worker fetches the activity. Duplicate and repeated events for an activity are merged.
+@bp.route("/strava/webhook", methods=["POST"])
+def webhook_event():
+    if not current_app.config["STRAVA_WEBHOOK_VERIFY_TOKEN"]:
+        return jsonify({"error": "Webhook not enabled"}), 404
+    event = request.get_json(silent=True)
+    if not isinstance(event, dict):
+        return jsonify({"error": "Expected a JSON event"}), 400
+    subscription_id = current_app.config["STRAVA_WEBHOOK_SUBSCRIPTION_ID"]
+    if subscription_id and str(event.get("subscription_id")) != str(subscription_id):
+        return jsonify({"error": "Unknown subscription"}), 403
+    record_file = current_app.config["STRAVA_WEBHOOK_RECORD_FILE"]
+    if record_file:
+        save_raw_event(event, record_file)
+
+    pending = record_event(event)
+    if pending is None:
+        return jsonify({"status": "ignored"})
+    job = enqueue_job(pending.user_id, kind=EVENT_JOB_KIND)
+    return jsonify({"status": "queued", "job_id": job.id})
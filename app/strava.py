@@ -1 +1,379 @@
 # API Logic for getting Strava Data
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.powercurve import resample_1hz
+from app.instrumentation import span, count_strava_request
+
+# Base URLs for the Strava API. Can be pointed at a local stub server for testing.
+STRAVA_API_URL = os.getenv('STRAVA_API_URL', 'https://www.strava.com/api/v3')
+STRAVA_OAUTH_URL = os.getenv('STRAVA_OAUTH_URL', 'https://www.strava.com/oauth')
+# Set STRAVA_VERIFY_SSL=false to skip certificate checks during local testing
+STRAVA_VERIFY_SSL = os.getenv('STRAVA_VERIFY_SSL', 'true').lower() != 'false'
+# Maximum number of requests in flight to the same host at once
+MAX_CONNECTIONS_PER_HOST = int(os.getenv('STRAVA_MAX_CONNECTIONS_PER_HOST', 4))
+# Number of retries (with exponential backoff) for failed GET requests
+STRAVA_RETRIES = int(os.getenv('STRAVA_RETRIES', 3))
+# Number of /athlete/activities pages kept for conditional requests
+ACTIVITY_CACHE_SIZE = int(os.getenv('STRAVA_ACTIVITY_CACHE_SIZE', 1024))
+
+# How gaps in a ride (auto-pause, dropped samples) are filled on the 1 Hz grid: 'zero' or
+# 'hold', and the longest gap in seconds that 'hold' repeats the last sample across
+STREAM_GAP_FILL = os.getenv('STREAM_GAP_FILL', 'zero')
+STREAM_MAX_HOLD = int(os.getenv('STREAM_MAX_HOLD')) if os.getenv('STREAM_MAX_HOLD') else None
+
+# Strava's default quotas (requests per 15 minutes, per day) until the response headers say otherwise
+STRAVA_SHORT_LIMIT = int(os.getenv('STRAVA_SHORT_LIMIT', 200))
+STRAVA_DAILY_LIMIT = int(os.getenv('STRAVA_DAILY_LIMIT', 2000))
+# Requests retried after a 429 (Too Many Requests) once the rate limiter allows it
+RATE_LIMIT_RETRIES = 3
+
+# One semaphore per host so concurrent fetches never exceed MAX_CONNECTIONS_PER_HOST
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+
+
+def _host_limit(url):
+    host = urlparse(url).netloc
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(MAX_CONNECTIONS_PER_HOST)
+        return _host_limits[host]
+
+
+class RateLimiter:
+    """
+    Token buckets for Strava's 15-minute and daily request quotas, shared by all threads.
+
+    Attributes:
+        limits (list): [15-minute limit, daily limit].
+        used (list): Requests used in the current 15-minute window and day.
+        reserve (float): Fraction of each quota left for other clients (e.g. the web app).
+
+    Notes:
+        Each bucket is refilled when its window ends; Strava resets the short quota at every
+        quarter hour and the daily quota at midnight UTC. acquire() takes a token from both
+        buckets, sleeping until the next reset if either is empty. update() syncs the buckets
+        with the X-RateLimit headers of every response, which count the requests of every
+        client of the Strava app (web workers, other backfills), not just this process.
+        clock and sleep can be replaced to test without waiting.
+    """
+
+    WINDOWS = (15 * 60, 24 * 60 * 60)
+
+    def __init__(self, short_limit=STRAVA_SHORT_LIMIT, daily_limit=STRAVA_DAILY_LIMIT, reserve=0.0,
+                 clock=time.time, sleep=time.sleep):
+        self.limits = [short_limit, daily_limit]
+        self.used = [0, 0]
+        self.reserve = reserve
+        self.clock = clock
+        self.sleep = sleep
+        self._window_starts = [None, None]
+        self._lock = threading.Lock()
+
+    def _roll(self, now):
+        # Refill the buckets whose window has ended
+        for i, length in enumerate(self.WINDOWS):
+            start = now - now % length
+            if start != self._window_starts[i]:
+                self._window_starts[i] = start
+                self.used[i] = 0
+
+    def _available(self, i):
+        return self.limits[i] - int(self.limits[i] * self.reserve) - self.used[i]
+
+    def acquire(self):
+        """Block until a request is allowed by both quotas, then count it."""
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._roll(now)
+                empty = [i for i in range(len(self.WINDOWS)) if self._available(i) <= 0]
+                if not empty:
+                    for i in range(len(self.WINDOWS)):
+                        self.used[i] += 1
+                    return
+                # Wait for the latest reset among the empty buckets
+                wait = max(self._window_starts[i] + self.WINDOWS[i] - now for i in empty)
+            self.sleep(max(wait, 0.01))
+
+    def update(self, headers, status_code=None):
+        """
+        Sync the buckets with a response's rate-limit headers.
+
+        Notes:
+            Read requests have their own (lower) quota on newer Strava apps, reported in the
+            X-ReadRateLimit headers, which are used when present. A 429 empties the short bucket
+            (or the daily one, if the headers say that's the one used up).
+        """
+        limit = headers.get('X-ReadRateLimit-Limit') or headers.get('X-RateLimit-Limit')
+        usage = headers.get('X-ReadRateLimit-Usage') or headers.get('X-RateLimit-Usage')
+        with self._lock:
+            self._roll(self.clock())
+            try:
+                if limit:
+                    self.limits = [int(v) for v in limit.split(',')[:2]]
+                if usage:
+                    # Never go below our own count, requests still in flight aren't in the headers yet
+                    self.used = [max(mine, int(v)) for mine, v in zip(self.used, usage.split(',')[:2])]
+            except ValueError:
+                pass  # Malformed header, keep counting locally
+            if status_code == 429:
+                i = 1 if self.used[1] >= self.limits[1] else 0
+                self.used[i] = self.limits[i]
+
+
+class StravaClient:
+    """
+    Client for the Strava API shared by all routes.
+
+    Attributes:
+        session (requests.Session): Keep-alive session with a connection pool, gzip and retries.
+        api_url (str): Base URL for the Strava API.
+        oauth_url (str): Base URL for Strava OAuth.
+        stream_cache (StreamCache): Optional on-disk cache of watts streams.
+        rate_limiter (RateLimiter): Optional quota tracker. When set, every GET waits for it and
+            requests rejected with 429 are retried after the quota resets.
+        activity_cache_size (int): /athlete/activities pages kept for conditional requests,
+            0 turns the page cache off.
+
+    Notes:
+        GET requests are retried with exponential backoff on connection errors and 5xx responses.
+        When the retries run out the request counts as failed (the getters return None).
+        /athlete/activities pages are cached together with their ETag and requested with
+        If-None-Match, so an unchanged activity list costs a 304 and is not parsed again.
+        The cache is per process and holds at most activity_cache_size pages.
+        Watts streams found in the stream cache are returned without calling Strava.
+        Streams are downloaded together with the time stream and resampled to 1 Hz, so gaps
+        from auto-pause or recording dropouts count as real seconds (see resample_1hz).
+    """
+
+    def __init__(self, api_url=STRAVA_API_URL, oauth_url=STRAVA_OAUTH_URL,
+                 max_connections=MAX_CONNECTIONS_PER_HOST, retries=STRAVA_RETRIES,
+                 backoff_factor=0.5, verify=STRAVA_VERIFY_SSL, stream_cache=None, rate_limiter=None,
+                 gap_fill=STREAM_GAP_FILL, max_hold=STREAM_MAX_HOLD, activity_cache_size=ACTIVITY_CACHE_SIZE):
+        self.api_url = api_url
+        self.oauth_url = oauth_url
+        self.max_connections = max_connections
+        self.verify = verify
+        self.stream_cache = stream_cache
+        self.rate_limiter = rate_limiter
+        self.gap_fill = gap_fill
+        self.max_hold = max_hold
+        self.activity_cache_size = activity_cache_size
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        retry = Retry(total=retries, backoff_factor=backoff_factor,
+                      status_forcelist=(500, 502, 503, 504),
+                      allowed_methods=frozenset(["GET"]),
+                      raise_on_status=False)  # Return the last 5xx response instead of raising
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_connections, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # (access_token, per_page, page) -> (etag, activities)
+        self._activity_cache = OrderedDict()
+        self._activity_cache_lock = threading.Lock()
+
+    @staticmethod
+    def _headers(access_token):
+        return {"Authorization": f"Bearer {access_token}"}
+
+    def _send(self, endpoint, method, url, **kwargs):
+        # Every Strava request is timed and counted by endpoint for /metrics
+        with span("strava"):
+            response = self.session.request(method, url, verify=self.verify, **kwargs)
+        count_strava_request(endpoint, response.status_code)
+        return response
+
+    def _get(self, endpoint, url, **kwargs):
+        # GET that respects the rate limiter, if there is one. Returns None when Strava can't
+        # be reached after the retries (connection errors, timeouts), so one failing request
+        # is skipped like any other failed request instead of aborting the whole job.
+        try:
+            if self.rate_limiter is None:
+                return self._send(endpoint, 'GET', url, **kwargs)
+            for _ in range(RATE_LIMIT_RETRIES + 1):
+                self.rate_limiter.acquire()
+                response = self._send(endpoint, 'GET', url, **kwargs)
+                self.rate_limiter.update(response.headers, response.status_code)
+                if response.status_code != 429:
+                    break
+            return response
+        except requests.RequestException:
+            count_strava_request(endpoint, "error")
+            return None
+
+    def exchange_token(self, code, client_id, client_secret):
+        """
+        Exchange an OAuth authorization code for an access token.
+
+        Returns:
+            requests.Response: The token response from Strava.
+        """
+        return self._send(
+            "oauth/token", 'POST', f"{self.oauth_url}/token",
+            data={
+                "client_id": client_id,
+                "client_secret": client_secret,
+                "code": code,
+                "grant_type": "authorization_code",
+            }
+        )
+
+    def get_activities(self, access_token, per_page=20, page=1):
+        """
+        Get one page of the athlete's activities, most recent first.
+
+        Returns:
+            list or None: The activities, or None if the request failed.
+        """
+        key = (access_token, per_page, page)
+        headers = self._headers(access_token)
+        with self._activity_cache_lock:
+            cached = self._activity_cache.get(key)
+        if cached:
+            headers["If-None-Match"] = cached[0]
+
+        response = self._get("athlete/activities", f"{self.api_url}/athlete/activities",
+                             headers=headers,
+                             params={"per_page": per_page, "page": page})
+        if response is None:
+            return None
+        if response.status_code == 304 and cached:
+            with self._activity_cache_lock:
+                if key in self._activity_cache:
+                    self._activity_cache.move_to_end(key)
+            return cached[1]
+        if response.status_code != 200:
+            return None
+
+        activities = response.json()
+        etag = response.headers.get("ETag")
+        if etag and self.activity_cache_size:
+            with self._activity_cache_lock:
+                self._activity_cache[key] = (etag, activities)
+                self._activity_cache.move_to_end(key)
+                while len(self._activity_cache) > self.activity_cache_size:
+                    self._activity_cache.popitem(last=False)
+        return activities
+
+    def get_activity(self, access_token, activity_id):
+        """
+        Get the summary of one activity (used for webhook events, which only carry its ID).
+
+        Returns:
+            dict or None: The activity, or None if the request failed (e.g. it was deleted
+                or made private since).
+        """
+        response = self._get("activities", f"{self.api_url}/activities/{int(activity_id)}",
+                             headers=self._headers(access_token))
+        if response is None or response.status_code != 200:
+            return None
+        return response.json()
+
+    def get_watts_stream(self, access_token, activity_id, stop=None, failed=None):
+        """
+        Download the watts stream for one activity, resampled to 1 Hz.
+
+        Args:
+            access_token (str): Strava access token.
+            activity_id (int): Strava activity ID.
+            stop (threading.Event): If set before the request starts, the request is skipped.
+            failed (list): If given, the activity ID is appended to it when the request failed
+                (connection error, 429 or 5xx after the retries), so callers can tell a failed
+                download from a ride without power.
+
+        Returns:
+            np.ndarray or None: One watts value per second (a memory-mapped array when it comes
+                from the stream cache), or None if the request failed or the ride has no power.
+        """
+        if self.stream_cache is not None:
+            cached = self.stream_cache.get(activity_id)
+            if cached is not None:
+                return cached if len(cached) else None
+
+        url = f'{self.api_url}/activities/{activity_id}/streams'
+        with _host_limit(url):
+            if stop is not None and stop.is_set():
+                return None
+            stream_response = self._get("activities/streams", url,
+                                        headers=self._headers(access_token),
+                                        params={"keys": "time,watts", "key_by_type": True})
+        if stream_response is None or stream_response.status_code == 429 or stream_response.status_code >= 500:
+            if failed is not None:
+                failed.append(activity_id)
+            return None
+        if stream_response.status_code != 200:
+            return None  # No stream (deleted or private activity), like a ride without power
+
+        # Parse the JSON and put the power data on a 1 Hz grid using the time stream
+        streams = stream_response.json()
+        watts_data = streams.get('watts')
+        watts_array = watts_data.get('data') if watts_data else None
+        if not isinstance(watts_array, list) or not watts_array:
+            watts_array = None
+        else:
+            time_data = (streams.get('time') or {}).get('data')
+            if not isinstance(time_data, list) or len(time_data) != len(watts_array):
+                time_data = np.arange(len(watts_array))  # No usable time stream, assume 1 Hz
+            # None (a dropped sample) becomes NaN
+            watts = np.array(watts_array, dtype=np.float64)
+            try:
+                watts_array = resample_1hz(time_data, watts, self.gap_fill, self.max_hold)
+            except ValueError:
+                watts_array = None  # Time stream spans days (broken clock), treat as no power
+        if self.stream_cache is not None:
+            self.stream_cache.put(activity_id, watts_array)
+        return watts_array
+
+    def fetch_rides_with_power(self, access_token, activities, limit=5, failed=None):
+        """
+        Download watts streams for a list of activities concurrently.
+
+        Args:
+            access_token (str): Strava access token.
+            activities (list): Activities from /athlete/activities, most recent first.
+            limit (int): Number of rides with power to return.
+            failed (list): If given, collects the IDs of rides whose download failed (see
+                get_watts_stream).
+
+        Returns:
+            list: Up to `limit` (ride_id, watts) tuples, in the same order as `activities`.
+
+        Notes:
+            Results are read back in activity order, so the first `limit` rides with power are the
+            same as fetching one by one. Once enough rides are found, queued downloads are
+            cancelled and downloads that have not started yet are skipped.
+        """
+        ride_ids = [ride['id'] for ride in activities if ride.get("type") == 'Ride']
+        rides_with_power = []
+        if not ride_ids:
+            return rides_with_power
+
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=self.max_connections) as pool:
+            futures = [
+                pool.submit(self.get_watts_stream, access_token, ride_id, stop, failed)
+                for ride_id in ride_ids
+            ]
+            try:
+                for ride_id, future in zip(ride_ids, futures):
+                    watts = future.result()
+                    if watts is not None:
+                        rides_with_power.append((ride_id, watts))
+                    # Only take most recent rides with power data
+                    if len(rides_with_power) >= limit:
+                        break
+            finally:
+                # Cancel anything still outstanding, also when a download raised
+                stop.set()
+                for future in futures:
+                    future.cancel()
+        return rides_with_power
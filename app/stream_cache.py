@@ -0,0 +1,150 @@
+# On-disk cache of Strava watts streams shared by all worker processes
+import os
+import tempfile
+import numpy as np
+
+try:
+    import fcntl  # Only available on POSIX, used to serialize eviction between processes
+except ImportError:
+    fcntl = None
+
+# Directory for cached streams and the byte budget before old streams are evicted
+STREAM_CACHE_DIR = os.getenv(
+    'STREAM_CACHE_DIR',
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'instance', 'stream_cache'))
+)
+STREAM_CACHE_MAX_BYTES = int(os.getenv('STREAM_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+
+class EvictionTrigger:
+    """
+    Decides which writes to a size-bounded cache directory run evict_lru.
+
+    Attributes:
+        every (int): Writes between two evictions.
+        max_unchecked (int): Bytes written since the last eviction that trigger one early.
+
+    Notes:
+        evict_lru lists the whole directory under a lock, too slow to run on every write.
+        Each process counts its own writes, so the directory can go over its budget by what
+        every process writes between two of its evictions (at most max_unchecked each).
+    """
+
+    def __init__(self, max_bytes, every=64):
+        self.every = every
+        self.max_unchecked = max(1, max_bytes // 16)
+        self._writes = 0
+        self._unchecked = 0
+
+    def wrote(self, size):
+        """Count a write of `size` bytes, True if it is time to evict."""
+        self._writes += 1
+        self._unchecked += size
+        if self._writes % self.every and self._unchecked < self.max_unchecked:
+            return False
+        self._unchecked = 0
+        return True
+
+
+class StreamCache:
+    """
+    Size-bounded LRU cache of watts streams stored as int16 .npy files keyed by activity ID.
+
+    Attributes:
+        directory (str): Folder holding one <activity_id>.npy file per ride.
+        max_bytes (int): Byte budget. The least recently used files are deleted above it.
+
+    Notes:
+        Files are written to a temporary file and renamed into place, so readers in other
+        processes never see a partial file. Reads are memory-mapped and bump the file's mtime,
+        which is used as the "last used" time for eviction. Eviction runs every few writes (see
+        EvictionTrigger) and holds an exclusive lock on a lock file so two workers don't evict at the same time.
+        A ride without power is stored as an empty array, so it isn't requested again either.
+    """
+
+    def __init__(self, directory=STREAM_CACHE_DIR, max_bytes=STREAM_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._eviction = EvictionTrigger(max_bytes)
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, activity_id):
+        # ".1hz" marks streams resampled with the time stream; older index-based files are
+        # never read and age out of the cache
+        return os.path.join(self.directory, f"{int(activity_id)}.1hz.npy")
+
+    def get(self, activity_id):
+        """
+        Return the cached watts for an activity as a read-only memory-mapped int16 array,
+        or None if the activity isn't cached.
+        """
+        path = self._path(activity_id)
+        try:
+            watts = np.load(path, mmap_mode='r')
+            os.utime(path)  # Mark as recently used
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        return watts
+
+    def put(self, activity_id, watts):
+        """
+        Store the watts for an activity (None or [] records a ride without power).
+        Values are clipped to the int16 range; missing samples are stored as 0.
+        """
+        watts = np.asarray([] if watts is None else watts, dtype=np.float64)
+        watts = np.clip(np.nan_to_num(watts, nan=0.0), 0, np.iinfo(np.int16).max).astype(np.int16)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, watts)
+            os.replace(tmp_path, self._path(activity_id))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self._eviction.wrote(watts.nbytes):
+            self.evict()
+
+    def delete(self, activity_id):
+        """Remove an activity from the cache (e.g. after it was edited on Strava)."""
+        try:
+            os.remove(self._path(activity_id))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Delete the least recently used files until the cache fits in max_bytes."""
+        evict_lru(self.directory, self.max_bytes, '.npy')
+
+
+def evict_lru(directory, max_bytes, suffix):
+    """
+    Delete the least recently used (oldest mtime) files ending in `suffix` from `directory`
+    until their total size fits in max_bytes. Holds an exclusive lock so only one process
+    evicts at a time.
+    """
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        entries = []
+        total = 0
+        for entry in os.scandir(directory):
+            if not entry.name.endswith(suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        if total <= max_bytes:
+            return
+        # Oldest first
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # Another worker removed it, or it's still open on Windows
+            total -= size
+            if total <= max_bytes:
+                break
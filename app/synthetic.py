@@ -0,0 +1,122 @@
+# Realistic synthetic rides for benchmarks, load tests and dummy data
+import numpy as np
+
+# Shortest and longest generated rides in seconds
+MIN_RIDE_SECONDS = 30 * 60
+MAX_RIDE_SECONDS = 24 * 60 * 60
+
+# Segment kinds: (relative frequency, (shortest, longest) in seconds, (low, high) fraction of FTP)
+RIDE_SEGMENTS = {
+    "endurance": (10, (300, 1800), (0.55, 0.75)),
+    "tempo": (3, (300, 1200), (0.76, 0.90)),
+    "threshold": (2, (240, 1200), (0.92, 1.05)),
+    "intervals": (2, (30, 480), (1.05, 1.50)),  # Several reps with easy recoveries
+    "sprint": (1, (5, 20), (2.00, 3.50)),
+    "coast": (3, (5, 90), (0.0, 0.0)),  # Descents, corners, traffic lights
+    "stop": (1, (60, 900), (0.0, 0.0)),  # Café stops, the device auto-pauses
+}
+# Relative spread of the second to second power around the segment target
+PEDALING_NOISE = 0.12
+# Power meter dropouts per hour of riding, and their (shortest, longest) length in seconds
+DROPOUTS_PER_HOUR = 1.5
+DROPOUT_SECONDS = (1, 30)
+# Fraction of the pedaling seconds that are short freewheeling moments (zero watts)
+FREEWHEEL_FRACTION = 0.04
+
+
+def _ride_samples(duration, ftp, rng):
+    # 1 Hz watts (NaN during dropouts) plus a mask of the seconds spent stopped
+    kinds = list(RIDE_SEGMENTS)
+    weights = np.array([RIDE_SEGMENTS[kind][0] for kind in kinds], dtype=np.float64)
+    weights /= weights.sum()
+    target = np.empty(duration, dtype=np.float64)
+    stopped = np.zeros(duration, dtype=bool)
+
+    position = 0
+    while position < duration:
+        kind = kinds[rng.choice(len(kinds), p=weights)]
+        _, (shortest, longest), (low, high) = RIDE_SEGMENTS[kind]
+        length = int(rng.integers(shortest, longest + 1))
+        end = min(position + length, duration)
+        if kind == "intervals":
+            # Reps of `length` seconds with recoveries as long as the rep at 50% FTP
+            reps = int(rng.integers(3, 9))
+            level = rng.uniform(low, high) * ftp
+            for _ in range(reps):
+                end = min(position + length, duration)
+                target[position:end] = level
+                position = end
+                end = min(position + length, duration)
+                target[position:end] = 0.5 * ftp
+                position = end
+            continue
+        target[position:end] = rng.uniform(low, high) * ftp
+        stopped[position:end] = kind == "stop"
+        position = end
+
+    # Fatigue: long rides slowly lose power (about 10% after 6 hours)
+    target *= np.exp(-np.arange(duration) / (60 * 3600.0))
+    # Smoothed multiplicative noise, so neighbouring seconds are correlated like real pedaling
+    noise = np.convolve(rng.normal(0.0, PEDALING_NOISE, duration + 4), np.ones(5) / 5 ** 0.5, mode="valid")
+    watts = np.clip(target * (1.0 + noise), 0.0, None)
+    watts[target == 0] = 0.0
+    watts[rng.random(duration) < FREEWHEEL_FRACTION] = 0.0
+
+    # Power meter dropouts (the recording goes on, but without power)
+    for _ in range(rng.poisson(DROPOUTS_PER_HOUR * duration / 3600.0)):
+        start = int(rng.integers(0, duration))
+        watts[start:start + int(rng.integers(DROPOUT_SECONDS[0], DROPOUT_SECONDS[1] + 1))] = np.nan
+    return np.round(watts), stopped
+
+
+def synthetic_ride(duration, ftp=250.0, seed=None):
+    """
+    Generate a realistic 1 Hz watts stream.
+
+    Args:
+        duration (int): Length of the ride in seconds.
+        ftp (float): Functional threshold power of the rider the ride is shaped around.
+        seed (int or np.random.Generator): Random seed, the same seed gives the same ride.
+
+    Returns:
+        np.ndarray: float64 watts per second. Zero while coasting or stopped and NaN during
+            power meter dropouts (like a dropped sample in a Strava stream).
+
+    Notes:
+        The ride is a random sequence of endurance, tempo, threshold, interval, sprint, coasting
+        and stop segments (see RIDE_SEGMENTS), with correlated pedaling noise, fatigue over
+        long rides, short freewheeling moments and dropouts.
+    """
+    rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+    watts, _ = _ride_samples(int(duration), ftp, rng)
+    return watts
+
+
+def synthetic_stream(duration, ftp=250.0, seed=None):
+    """
+    Generate a ride in the shape of the Strava streams API (?keys=time,watts&key_by_type=true).
+
+    Returns:
+        dict: {"time": {"data": [...]}, "watts": {"data": [...]}}. The time stream skips the
+            seconds the device was auto-paused at stops, and dropped watts are None.
+    """
+    rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+    watts, stopped = _ride_samples(int(duration), ftp, rng)
+    recorded = np.flatnonzero(~stopped)
+    values = watts[recorded]
+    return {
+        "time": {"data": recorded.tolist()},
+        "watts": {"data": [None if value != value else int(value) for value in values.tolist()]},
+    }
+
+
+def synthetic_rides(count, min_duration=MIN_RIDE_SECONDS, max_duration=MAX_RIDE_SECONDS, ftp=250.0, seed=None):
+    """
+    Generate many rides with log-uniform lengths (most are short, a few are very long).
+
+    Returns:
+        list: `count` watts arrays (see synthetic_ride).
+    """
+    rng = np.random.default_rng(seed)
+    durations = np.exp(rng.uniform(np.log(min_duration), np.log(max_duration), count)).astype(np.int64)
+    return [synthetic_ride(duration, ftp, rng) for duration in durations]
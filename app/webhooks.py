@@ -0,0 +1,156 @@
+# Strava push subscription: recording activity events and applying them to the stored curves
+import json
+import threading
+from sqlalchemy.exc import IntegrityError
+from models import db, User, ActivityCurve, CurveJob, StravaEvent
+from app.ingest import parse_start_date, lock_user_curves, save_activity_curves, rebuild_user_curve
+from app.instrumentation import span
+
+# Job kind that applies a user's pending events (see app/jobs.py)
+EVENT_JOB_KIND = 'activity_events'
+ASPECT_TYPES = ('create', 'update', 'delete')
+# Events applied per transaction
+EVENT_BATCH_SIZE = 50
+
+_record_lock = threading.Lock()
+
+
+def save_raw_event(event, path):
+    """Append a received event to a JSON lines file, for replaying it later (utils/replay_events.py)."""
+    with _record_lock, open(path, 'a') as f:
+        f.write(json.dumps(event) + '\n')
+
+
+def _merge_event(row, aspect_type, updates, event_time):
+    # A delete wins over anything, a pending create fetches the latest version of the activity
+    # anyway, and the changed fields of several updates add up
+    if 'delete' in (row.aspect_type, aspect_type):
+        row.aspect_type = 'delete'
+    elif 'create' in (row.aspect_type, aspect_type):
+        row.aspect_type = 'create'
+    else:
+        row.updates = {**(row.updates or {}), **(updates or {})}
+    row.event_time = max(row.event_time or 0, event_time or 0)
+
+
+def record_event(event):
+    """
+    Store a webhook event until a worker applies it, merged with any pending event for the
+    same activity.
+
+    Args:
+        event (dict): The event as posted by Strava ({"object_type", "object_id", "aspect_type",
+            "owner_id", "updates", "event_time", "subscription_id"}).
+
+    Returns:
+        StravaEvent or None: The pending event row (committed), or None if the event is not
+            about an activity of a known user (athlete events, unknown owners, bad payloads).
+    """
+    aspect_type = event.get('aspect_type')
+    if event.get('object_type') != 'activity' or aspect_type not in ASPECT_TYPES or not event.get('object_id'):
+        return None
+    user = User.query.filter_by(strava_id=str(event.get('owner_id'))).first()
+    if not user:
+        return None
+    activity_id = str(event['object_id'])
+    updates = event.get('updates') if isinstance(event.get('updates'), dict) else None
+    event_time = event.get('event_time') if isinstance(event.get('event_time'), int) else None
+
+    for _ in range(2):
+        row = StravaEvent.query.filter_by(user_id=user.id, activity_id=activity_id).first()
+        if row:
+            _merge_event(row, aspect_type, updates, event_time)
+        else:
+            row = StravaEvent(user_id=user.id, activity_id=activity_id, aspect_type=aspect_type,
+                              updates=updates, event_time=event_time)
+            db.session.add(row)
+        try:
+            db.session.commit()
+            return row
+        except IntegrityError:
+            # The same event was delivered twice at once, merge into the row that won
+            db.session.rollback()
+    raise RuntimeError(f"Could not record event for activity {activity_id}")
+
+
+def pending_events(user_id, limit=EVENT_BATCH_SIZE):
+    """The oldest pending events of a user."""
+    return StravaEvent.query.filter_by(user_id=user_id).order_by(StravaEvent.id).limit(limit).all()
+
+
+def users_with_stranded_events():
+    """
+    Users with pending events but no queued or running event job.
+
+    Notes:
+        An event that arrives just as the user's event job finishes is merged into that job
+        (see enqueue_job) but never applied by it. The worker checks for these when the queue
+        is empty.
+    """
+    active_job = db.session.query(CurveJob.id).filter(
+        CurveJob.user_id == StravaEvent.user_id, CurveJob.kind == EVENT_JOB_KIND,
+        CurveJob.status.in_(('queued', 'running'))
+    )
+    return [user_id for (user_id,) in
+            db.session.query(StravaEvent.user_id).filter(~active_job.exists()).distinct()]
+
+
+def apply_activity_events(user, strava, events):
+    """
+    Apply pending events to the user's activity curves and PowerCurve, then delete them.
+
+    Args:
+        user (User): Owner of the activities.
+        strava (StravaClient): Client used to fetch new activities and their watts streams.
+        events (list): StravaEvent rows of this user.
+
+    Returns:
+        dict: {"added": n, "removed": n, "ignored": n} activities.
+
+    Notes:
+        Only the activities named by the events are fetched. Deleted activities (and updates
+        that change the sport, which are applied as delete plus create) remove the activity's
+        curve and rebuild the PowerCurve from the remaining activities; deleted ones also
+        leave the stream cache. Other updates (titles, descriptions...) don't change the
+        power data and are dropped.
+    """
+    removed = {e.activity_id for e in events if e.aspect_type == 'delete'}
+    retyped = {e.activity_id for e in events if e.aspect_type == 'update' and 'type' in (e.updates or {})}
+    created = {e.activity_id for e in events if e.aspect_type == 'create'}
+
+    # Talk to Strava before locking the user: new activities, and retyped ones again
+    seen = {
+        activity_id for (activity_id,) in
+        db.session.query(ActivityCurve.activity_id)
+        .filter(ActivityCurve.user_id == user.id, ActivityCurve.activity_id.in_(created))
+    } if created else set()
+    with span("strava_fetch"):
+        activities = [strava.get_activity(user.access_token, activity_id)
+                      for activity_id in sorted((created - seen) | retyped)]
+        activities = sorted((a for a in activities if a), key=lambda a: a.get('start_date') or '', reverse=True)
+        rides_with_power = strava.fetch_rides_with_power(user.access_token, activities, limit=len(activities))
+    start_dates = {activity['id']: parse_start_date(activity) for activity in activities}
+
+    result = {"added": 0, "removed": 0, "ignored": 0}
+    lock_user_curves(user.id)
+    if removed | retyped:
+        result["removed"] = ActivityCurve.query.filter(
+            ActivityCurve.user_id == user.id, ActivityCurve.activity_id.in_(removed | retyped)
+        ).delete(synchronize_session=False)
+    with span("curve_compute"):
+        save_activity_curves(user, rides_with_power, start_dates)
+        if result["removed"]:
+            rebuild_user_curve(user)
+    result["added"] = len(rides_with_power)
+    # Updates without a change of sport, and new activities that aren't rides with power
+    result["ignored"] = len(events) - len(removed) - len(rides_with_power)
+
+    # Only delete the events that weren't merged with a newer one while this ran
+    for event in events:
+        StravaEvent.query.filter_by(id=event.id, event_time=event.event_time).delete(synchronize_session=False)
+    db.session.commit()
+    # The rider deleted the activity, so its watts stream goes too
+    if strava.stream_cache is not None:
+        for activity_id in removed:
+            strava.stream_cache.delete(activity_id)
+    return result
@@ -0,0 +1,77 @@
+# Power curves over date windows (e.g. last 42 days) built from the per-activity curves
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from models import db, ActivityCurve
+from app.powercurve import DEFAULT_DURATIONS, CurveSparseTable, curve_to_dict
+
+# Bytes of sparse tables kept in memory per worker (a table grows with the user's activity
+# count, about 52 bytes per activity per level, so counting tables wouldn't bound memory)
+WINDOW_CACHE_MAX_BYTES = int(os.getenv('WINDOW_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Named windows shown next to the all-time curve
+WINDOWS = {
+    "Last 42 days": lambda now: (now - timedelta(days=42), None),
+    "Last 90 days": lambda now: (now - timedelta(days=90), None),
+    "This season": lambda now: (datetime(now.year, 1, 1), None),
+}
+
+# user_id -> ((activity count, newest id), CurveSparseTable), least recently used first
+_tables = OrderedDict()
+_tables_bytes = 0
+_tables_lock = threading.Lock()
+
+
+def user_sparse_table(user_id, durations=DEFAULT_DURATIONS):
+    """
+    Get the sparse table over a user's dated activity curves.
+
+    Notes:
+        Tables are cached per worker and rebuilt only when the user's activity curves change,
+        which is detected with a single count/max(id) query. The least recently used tables are
+        dropped once the cached ones hold more than WINDOW_CACHE_MAX_BYTES; a table larger than
+        that on its own is built for the request and not cached.
+    """
+    global _tables_bytes
+    dated = ActivityCurve.query.filter(ActivityCurve.user_id == user_id,
+                                       ActivityCurve.start_date.isnot(None))
+    version = tuple(dated.with_entities(db.func.count(ActivityCurve.id), db.func.max(ActivityCurve.id)).one())
+    with _tables_lock:
+        cached = _tables.get(user_id)
+        if cached and cached[0] == version:
+            _tables.move_to_end(user_id)
+            return cached[1]
+
+    rows = dated.with_entities(ActivityCurve.start_date, ActivityCurve.curve).all()
+    curves = np.zeros((len(rows), len(durations)), dtype=np.float32)
+    for i, (_, curve) in enumerate(rows):
+        curves[i] = curve.values_at(durations)
+    table = CurveSparseTable([start_date for start_date, _ in rows], curves)
+    with _tables_lock:
+        old = _tables.pop(user_id, None)
+        if old:
+            _tables_bytes -= old[1].nbytes
+        if table.nbytes <= WINDOW_CACHE_MAX_BYTES:
+            _tables[user_id] = (version, table)
+            _tables_bytes += table.nbytes
+            while _tables_bytes > WINDOW_CACHE_MAX_BYTES:
+                _, (_, evicted) = _tables.popitem(last=False)
+                _tables_bytes -= evicted.nbytes
+    return table
+
+
+def window_curve(user_id, start=None, end=None, durations=DEFAULT_DURATIONS):
+    """Best {duration: watts} curve over the user's activities with start <= date < end."""
+    return curve_to_dict(durations, user_sparse_table(user_id, durations).query(start, end))
+
+
+def window_curves(user_id, now=None, durations=DEFAULT_DURATIONS):
+    """Curves for every named window in WINDOWS, as {label: {duration: watts}}."""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    table = user_sparse_table(user_id, durations)
+    return {
+        label: curve_to_dict(durations, table.query(*bounds(now)))
+        for label, bounds in WINDOWS.items()
+    }
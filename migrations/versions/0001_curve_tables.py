@@ -0,0 +1,146 @@
+"""Tables of the activity curves, jobs, rankings, backfill, webhook events and metrics
+
+Revision ID: 0001_curve_tables
+Revises:
+Create Date: 2026-10-17 00:00:00
+
+The first revision. Databases created by create_all before migrations existed already have
+some or all of these tables, so only the missing ones are created, and an activity_curve
+table older than normalized_power gets the column. An empty database gets every table,
+user and power_curve included.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0001_curve_tables'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Tables added after user and power_curve, dropped again (newest first) by downgrade
+TABLES = ('activity_curve', 'curve_job', 'curve_rank', 'backfill_state', 'strava_event', 'curve_metrics')
+ACTIVE_JOB = sa.text("status IN ('queued', 'running')")
+
+
+def _user_id():
+    return sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False)
+
+
+def _created_at(name='created_at'):
+    return sa.Column(name, sa.DateTime(), server_default=sa.func.now())
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = set(inspector.get_table_names())
+
+    if 'user' not in existing:
+        op.create_table(
+            'user',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('strava_id', sa.String(50), nullable=False, unique=True),
+            sa.Column('access_token', sa.String(), nullable=False),
+            sa.Column('strava_name', sa.String(100)),
+        )
+    if 'power_curve' not in existing:
+        op.create_table(
+            'power_curve',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            _user_id(),
+            sa.Column('strava_id', sa.String(80), nullable=False),
+            sa.Column('activity_id', sa.String(50), nullable=False),
+            sa.Column('curve', sa.LargeBinary(), nullable=False),
+            _created_at(),
+        )
+
+    if 'activity_curve' not in existing:
+        op.create_table(
+            'activity_curve',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            _user_id(),
+            sa.Column('strava_id', sa.String(80), nullable=False),
+            sa.Column('activity_id', sa.String(50), nullable=False),
+            sa.Column('start_date', sa.DateTime()),
+            sa.Column('curve', sa.LargeBinary(), nullable=False),
+            sa.Column('normalized_power', sa.Float()),
+            _created_at(),
+            sa.UniqueConstraint('user_id', 'activity_id', name='uq_activity_curve_user_activity'),
+        )
+    elif 'normalized_power' not in {c['name'] for c in inspector.get_columns('activity_curve')}:
+        op.add_column('activity_curve', sa.Column('normalized_power', sa.Float()))
+
+    if 'curve_job' not in existing:
+        op.create_table(
+            'curve_job',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            _user_id(),
+            sa.Column('kind', sa.String(50), nullable=False),
+            sa.Column('payload', sa.JSON()),
+            sa.Column('status', sa.String(20), nullable=False),
+            sa.Column('result', sa.JSON()),
+            sa.Column('error', sa.Text()),
+            _created_at(),
+            sa.Column('started_at', sa.DateTime()),
+            sa.Column('finished_at', sa.DateTime()),
+        )
+        # One queued or running job per user and kind
+        op.create_index('uq_curve_job_active', 'curve_job', ['user_id', 'kind'], unique=True,
+                        sqlite_where=ACTIVE_JOB, postgresql_where=ACTIVE_JOB)
+
+    if 'curve_rank' not in existing:
+        op.create_table(
+            'curve_rank',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            _user_id(),
+            sa.Column('duration', sa.Integer(), nullable=False),
+            sa.Column('watts', sa.Float(), nullable=False),
+        )
+        op.create_index('ix_curve_rank_user_id', 'curve_rank', ['user_id'])
+        op.create_index('ix_curve_rank_duration_watts', 'curve_rank', ['duration', 'watts'])
+
+    if 'backfill_state' not in existing:
+        op.create_table(
+            'backfill_state',
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), primary_key=True),
+            sa.Column('next_page', sa.Integer(), nullable=False),
+            sa.Column('activities', sa.Integer(), nullable=False),
+            sa.Column('error', sa.Text()),
+            _created_at('started_at'),
+            sa.Column('updated_at', sa.DateTime()),
+            sa.Column('finished_at', sa.DateTime()),
+        )
+
+    if 'strava_event' not in existing:
+        op.create_table(
+            'strava_event',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            _user_id(),
+            sa.Column('activity_id', sa.String(50), nullable=False),
+            sa.Column('aspect_type', sa.String(20), nullable=False),
+            sa.Column('updates', sa.JSON()),
+            sa.Column('event_time', sa.Integer()),
+            _created_at('received_at'),
+            sa.UniqueConstraint('user_id', 'activity_id', name='uq_strava_event_activity'),
+        )
+
+    if 'curve_metrics' not in existing:
+        op.create_table(
+            'curve_metrics',
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), primary_key=True),
+            sa.Column('critical_power', sa.Float()),
+            sa.Column('w_prime', sa.Float()),
+            sa.Column('r_squared', sa.Float()),
+            sa.Column('ftp', sa.Float()),
+            sa.Column('normalized_power', sa.Float()),
+            sa.Column('computed_at', sa.DateTime()),
+        )
+        op.create_index('ix_curve_metrics_critical_power', 'curve_metrics', ['critical_power'])
+        op.create_index('ix_curve_metrics_ftp', 'curve_metrics', ['ftp'])
+
+
+def downgrade():
+    # user and power_curve predate the migrations and are kept
+    for table in reversed(TABLES):
+        op.drop_table(table)
@@ -0,0 +1,43 @@
+"""Store power curves as packed binary (see app/curve_format.py)
+
+Revision ID: 0002_packed_curves
+Revises: 0001_curve_tables
+Create Date: 2026-10-17 00:00:00
+
+On PostgreSQL the curve columns change from json to bytea, keeping the JSON text as UTF-8
+bytes, which the app still reads. SQLite stores either format in the same column, so nothing
+changes there. The rows themselves are re-encoded afterwards by utils/migrate_curves.py, in
+batches, while the app runs.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0002_packed_curves'
+down_revision = '0001_curve_tables'
+branch_labels = None
+depends_on = None
+
+CURVE_TABLES = ('power_curve', 'activity_curve')
+
+
+def _curve_type(table):
+    return next(c['type'] for c in sa.inspect(op.get_bind()).get_columns(table) if c['name'] == 'curve')
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in CURVE_TABLES:
+        if not isinstance(_curve_type(table), sa.LargeBinary):
+            op.execute(f"ALTER TABLE {table} ALTER COLUMN curve TYPE bytea USING convert_to(curve::text, 'UTF8')")
+
+
+def downgrade():
+    # Only works while every row still holds JSON text: packed curves fail the cast to json
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in CURVE_TABLES:
+        if isinstance(_curve_type(table), sa.LargeBinary):
+            op.execute(f"ALTER TABLE {table} ALTER COLUMN curve TYPE json USING convert_from(curve, 'UTF8')::json")
@@ -0,0 +1,41 @@
+"""Indexes for the curve, activity and job lookups
+
+Revision ID: 0003_curve_indexes
+Revises: 0002_packed_curves
+Create Date: 2026-10-17 00:00:00
+
+Databases created before migrations existed (by create_all) get the indexes declared in
+models.py since. Tables created by create_all afterwards already have them, hence IF NOT
+EXISTS. On PostgreSQL the indexes are built CONCURRENTLY, so the tables stay writable while
+they build.
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0003_curve_indexes'
+down_revision = '0002_packed_curves'
+branch_labels = None
+depends_on = None
+
+# (index name, table, columns)
+INDEXES = (
+    ('ix_power_curve_user_created', 'power_curve', ['user_id', 'created_at', 'id']),
+    ('ix_power_curve_strava_id', 'power_curve', ['strava_id']),
+    ('ix_activity_curve_user_start', 'activity_curve', ['user_id', 'start_date']),
+    ('ix_activity_curve_strava_id', 'activity_curve', ['strava_id']),
+    ('ix_curve_job_status', 'curve_job', ['status', 'id']),
+)
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
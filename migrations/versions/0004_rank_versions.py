@@ -0,0 +1,41 @@
+"""Version counter and change log of the rankings (see app/rankings.py)
+
+Revision ID: 0004_rank_versions
+Revises: 0003_curve_indexes
+Create Date: 2026-10-17 00:00:00
+
+The rank_version row is created by the first ranking change. Until then, and after the
+upgrade, every worker builds its RankIndex from the whole curve_rank table once.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0004_rank_versions'
+down_revision = '0003_curve_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'rank_version' not in existing:
+        op.create_table(
+            'rank_version',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('version', sa.Integer(), nullable=False),
+        )
+    if 'curve_rank_change' not in existing:
+        op.create_table(
+            'curve_rank_change',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer()),
+        )
+        op.create_index('ix_curve_rank_change_version', 'curve_rank_change', ['version'])
+
+
+def downgrade():
+    op.drop_table('curve_rank_change')
+    op.drop_table('rank_version')
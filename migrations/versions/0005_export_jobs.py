@@ -0,0 +1,42 @@
+"""Jobs without a user, for the exports queued from /export (see app/routes/export.py)
+
+Revision ID: 0005_export_jobs
+Revises: 0004_rank_versions
+Create Date: 2026-10-17 00:00:00
+
+curve_job.user_id becomes nullable. SQLite can't alter a column, so the table is copied
+(batch mode); the partial unique index is dropped first and created again afterwards, so
+its WHERE clause is kept.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0005_export_jobs'
+down_revision = '0004_rank_versions'
+branch_labels = None
+depends_on = None
+
+ACTIVE_JOB = sa.text("status IN ('queued', 'running')")
+
+
+def _set_user_id_nullable(nullable):
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('curve_job', 'user_id', existing_type=sa.Integer(), nullable=nullable)
+        return
+    op.drop_index('uq_curve_job_active', table_name='curve_job')
+    with op.batch_alter_table('curve_job') as batch:
+        batch.alter_column('user_id', existing_type=sa.Integer(), nullable=nullable)
+    op.create_index('uq_curve_job_active', 'curve_job', ['user_id', 'kind'], unique=True,
+                    sqlite_where=ACTIVE_JOB)
+
+
+def upgrade():
+    _set_user_id_nullable(True)
+
+
+def downgrade():
+    # Export jobs can't be kept without a user
+    op.execute("DELETE FROM curve_job WHERE user_id IS NULL")
+    _set_user_id_nullable(False)
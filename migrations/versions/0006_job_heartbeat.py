@@ -0,0 +1,29 @@
+"""Heartbeat of running jobs (see app/jobs.py run_job)
+
+Revision ID: 0006_job_heartbeat
+Revises: 0005_export_jobs
+Create Date: 2026-10-17 00:00:00
+
+Running jobs claimed before the upgrade have no heartbeat; their started_at is used instead
+until they finish.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0006_job_heartbeat'
+down_revision = '0005_export_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('curve_job')}
+    if 'heartbeat_at' not in columns:
+        op.add_column('curve_job', sa.Column('heartbeat_at', sa.DateTime()))
+
+
+def downgrade():
+    with op.batch_alter_table('curve_job') as batch:
+        batch.drop_column('heartbeat_at')
@@ -3,6 +3,7 @@ import os
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from flask import Flask
+from app.curve_format import CurveBinary
 
 # Create a SLQAlchemy instance
 db = SQLAlchemy()
@@ -37,9 +38,246 @@ class User(db.Model, UserMixin):
 # Model for storing PowerCurve data
 class PowerCurve(db.Model):
     __tablename__ = 'power_curve'  # Explicit table name for clarity and compatibility
+    __table_args__ = (
+        # The latest curve of a user (ordered by created_at, then id), and deletes by Strava ID
+        db.Index('ix_power_curve_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_power_curve_strava_id', 'strava_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)  # Primary key for the power curve table
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Reference to User table
     strava_id = db.Column(db.String(80), nullable=False)  # Strava user ID (from Strava)
     activity_id = db.Column(db.String(50), nullable=False)  # Strava activity ID
-    curve = db.Column(db.JSON, nullable=False)  # Power curve data stored as JSON
-    created_at = db.Column(db.DateTime, server_default=db.func.now())  # Timestamp when record was created
\ No newline at end of file
+    curve = db.Column(CurveBinary, nullable=False)  # Power curve, packed binary (see app/curve_format.py)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())  # Timestamp when record was created
+
+# Model for storing the power curve of each individual activity
+class ActivityCurve(db.Model):
+    """
+    Power curve of a single Strava activity, mapped to the 'activity_curve' table.
+
+    Attributes:
+        id (int): Primary key for the activity curve table.
+        user_id (int): Reference to the User who owns the activity.
+        strava_id (str): Strava user ID (from Strava).
+        activity_id (str): Strava activity ID, unique per user.
+        start_date (datetime): When the activity started (UTC).
+        curve (PackedCurve): Power curve of the activity, {duration: watts}.
+        normalized_power (float): Normalized power of the activity (None for older rows).
+
+    Notes:
+        The user's PowerCurve is the elementwise max of all of their activity curves, so it can
+        be updated from just the new activities instead of being rebuilt from scratch.
+    """
+    __tablename__ = 'activity_curve'  # Explicit table name for clarity and compatibility
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'activity_id', name='uq_activity_curve_user_activity'),
+        # A user's activities by date (date windows, rebuilding the PowerCurve), and deletes by
+        # Strava ID
+        db.Index('ix_activity_curve_user_start', 'user_id', 'start_date'),
+        db.Index('ix_activity_curve_strava_id', 'strava_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)  # Primary key for the activity curve table
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Reference to User table
+    strava_id = db.Column(db.String(80), nullable=False)  # Strava user ID (from Strava)
+    activity_id = db.Column(db.String(50), nullable=False)  # Strava activity ID
+    start_date = db.Column(db.DateTime)  # When the activity started (UTC)
+    curve = db.Column(CurveBinary, nullable=False)  # Power curve, packed binary (see app/curve_format.py)
+    normalized_power = db.Column(db.Float)  # Normalized power of the activity
+    created_at = db.Column(db.DateTime, server_default=db.func.now())  # Timestamp when record was created
+
+
+# Model for the background job queue (see app/jobs.py and worker.py)
+class CurveJob(db.Model):
+    """
+    A unit of background work, mapped to the 'curve_job' table.
+
+    Attributes:
+        id (int): Primary key for the job table.
+        user_id (int): Reference to the User the job is for (None for jobs that aren't for
+            one user, e.g. exports).
+        kind (str): Which handler runs the job (e.g. 'refresh').
+        payload (dict): Extra arguments for the handler.
+        status (str): 'queued', 'running', 'done' or 'failed'.
+        result (dict): Handler output once the job is done.
+        error (str): Error message if the job failed.
+        heartbeat_at (datetime): Refreshed by the worker while the job runs. A running job
+            whose heartbeat stops is taken over by another worker.
+
+    Notes:
+        The partial unique index allows only one queued or running job per user and kind,
+        so repeated clicks don't queue duplicate work. Jobs without a user aren't covered by
+        it (NULLs never collide), enqueue_job's check for an active job still dedupes them.
+        Finished jobs are deleted by the worker after JOB_RETENTION (see app/jobs.py).
+    """
+    __tablename__ = 'curve_job'  # Explicit table name for clarity and compatibility
+    __table_args__ = (
+        db.Index(
+            'uq_curve_job_active', 'user_id', 'kind', unique=True,
+            sqlite_where=db.text("status IN ('queued', 'running')"),
+            postgresql_where=db.text("status IN ('queued', 'running')"),
+        ),
+        # Workers look for the oldest queued job on every poll
+        db.Index('ix_curve_job_status', 'status', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)  # Primary key for the job table
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))  # Reference to User table, None for exports
+    kind = db.Column(db.String(50), nullable=False, default='refresh')  # Job handler name
+    payload = db.Column(db.JSON)  # Extra arguments for the handler
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued/running/done/failed
+    result = db.Column(db.JSON)  # Handler output
+    error = db.Column(db.Text)  # Error message if the job failed
+    created_at = db.Column(db.DateTime, server_default=db.func.now())  # Timestamp when job was queued
+    started_at = db.Column(db.DateTime)  # Timestamp when a worker claimed the job
+    heartbeat_at = db.Column(db.DateTime)  # Last sign of life of the worker running the job
+    finished_at = db.Column(db.DateTime)  # Timestamp when the job finished
+
+
+# Model for the per-duration ranking of every user's best power (see app/rankings.py)
+class CurveRank(db.Model):
+    """
+    One user's best power for one duration, mapped to the 'curve_rank' table.
+
+    Attributes:
+        id (int): Primary key for the ranking table.
+        user_id (int): Reference to the User.
+        duration (int): Duration in seconds.
+        watts (float): The user's best average power for the duration.
+
+    Notes:
+        A user's rows are replaced (not updated) when their curve changes, and every change is
+        logged in curve_rank_change so the in-memory RankIndex only reloads the users whose rows changed.
+    """
+    __tablename__ = 'curve_rank'  # Explicit table name for clarity and compatibility
+    __table_args__ = (
+        db.Index('ix_curve_rank_duration_watts', 'duration', 'watts'),
+    )
+    id = db.Column(db.Integer, primary_key=True)  # Primary key for the ranking table
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)  # Reference to User table
+    duration = db.Column(db.Integer, nullable=False)  # Duration in seconds
+    watts = db.Column(db.Float, nullable=False)  # Best average power for the duration
+
+
+# Model for the version counter of the rankings (see app/rankings.py)
+class RankVersion(db.Model):
+    """
+    The current version of the curve_rank table, mapped to the 'rank_version' table (one row).
+
+    Attributes:
+        id (int): Always 1.
+        version (int): Incremented by every transaction that changes curve_rank.
+
+    Notes:
+        Writers increment the row before changing any ranks, which locks it until they commit.
+        Versions therefore become visible in the order they were handed out, unlike
+        autoincrement ids, which a slower transaction can commit after a higher one.
+    """
+    __tablename__ = 'rank_version'  # Explicit table name for clarity and compatibility
+    id = db.Column(db.Integer, primary_key=True)  # Primary key (the single row is 1)
+    version = db.Column(db.Integer, nullable=False, default=0)  # Current rankings version
+
+
+# Model for the log of ranking changes (see app/rankings.py)
+class CurveRankChange(db.Model):
+    """
+    Which user's ranking rows changed at a version, mapped to the 'curve_rank_change' table.
+
+    Attributes:
+        version (int): The RankVersion the change was made at.
+        user_id (int): The user whose rows were replaced or deleted, None if every row was
+            (rebuild_curve_ranks).
+
+    Notes:
+        Only the latest RANK_CHANGES_KEPT versions are kept. An index that is further behind
+        than that reloads the whole table.
+    """
+    __tablename__ = 'curve_rank_change'  # Explicit table name for clarity and compatibility
+    id = db.Column(db.Integer, primary_key=True)  # Primary key for the change log
+    version = db.Column(db.Integer, nullable=False, index=True)  # RankVersion of the change
+    user_id = db.Column(db.Integer)  # The changed user (no foreign key, the user may be deleted)
+
+
+# Model for the progress of a full-history backfill (see app/backfill.py)
+class BackfillState(db.Model):
+    """
+    Checkpoint of one user's activity history backfill, mapped to the 'backfill_state' table.
+
+    Attributes:
+        user_id (int): The User being backfilled (one row per user).
+        next_page (int): The next /athlete/activities page to fetch.
+        activities (int): Activities read so far.
+        error (str): Why the last attempt stopped (e.g. an expired token), if it failed.
+        finished_at (datetime): When the last page was reached, None while in progress.
+
+    Notes:
+        The checkpoint is committed after each page, once that page's curves are stored, so an
+        interrupted backfill resumes at the first page it didn't finish.
+    """
+    __tablename__ = 'backfill_state'  # Explicit table name for clarity and compatibility
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)  # Reference to User table
+    next_page = db.Column(db.Integer, nullable=False, default=1)  # Next activities page to fetch
+    activities = db.Column(db.Integer, nullable=False, default=0)  # Activities read so far
+    error = db.Column(db.Text)  # Error message if the last attempt failed
+    started_at = db.Column(db.DateTime, server_default=db.func.now())  # Timestamp when the backfill began
+    updated_at = db.Column(db.DateTime)  # Timestamp of the last checkpoint
+    finished_at = db.Column(db.DateTime)  # Timestamp when the whole history was read
+
+
+# Model for Strava webhook events waiting to be applied (see app/webhooks.py)
+class StravaEvent(db.Model):
+    """
+    A pending activity event from the Strava push subscription, mapped to the 'strava_event' table.
+
+    Attributes:
+        id (int): Primary key, also the order events are applied in.
+        user_id (int): Reference to the User who owns the activity.
+        activity_id (str): The Strava activity the event is about.
+        aspect_type (str): 'create', 'update' or 'delete'.
+        updates (dict): Changed fields of an update (e.g. {"type": "Ride"}).
+        event_time (int): When Strava says the change happened (Unix seconds).
+        received_at (datetime): When the event was first received.
+
+    Notes:
+        There is at most one row per user and activity. Redelivered or later events for the
+        same activity are merged into it (see record_event), so an activity is only fetched
+        once however many events arrive before a worker gets to it. Rows are deleted once
+        applied.
+    """
+    __tablename__ = 'strava_event'  # Explicit table name for clarity and compatibility
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'activity_id', name='uq_strava_event_activity'),
+    )
+    id = db.Column(db.Integer, primary_key=True)  # Primary key for the event table
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Reference to User table
+    activity_id = db.Column(db.String(50), nullable=False)  # Strava activity ID
+    aspect_type = db.Column(db.String(20), nullable=False)  # create/update/delete
+    updates = db.Column(db.JSON)  # Changed fields of an update event
+    event_time = db.Column(db.Integer)  # Time of the change on Strava (Unix seconds)
+    received_at = db.Column(db.DateTime, server_default=db.func.now())  # Timestamp when first received
+
+
+# Model for the metrics derived from each user's power curve (see app/metrics.py)
+class CurveMetrics(db.Model):
+    """
+    Critical power model and training metrics of one user, mapped to the 'curve_metrics' table.
+
+    Attributes:
+        user_id (int): The User (one row per user).
+        critical_power (float): Critical power in watts, from the 2 to 20 minute curve.
+        w_prime (float): W' (work capacity above critical power) in joules.
+        r_squared (float): Goodness of the critical power fit.
+        ftp (float): Estimated functional threshold power in watts.
+        normalized_power (float): Best normalized power of any single activity.
+        computed_at (datetime): When the metrics were last computed.
+
+    Notes:
+        Rows are rebuilt by recompute_metrics for every user at once (e.g. nightly).
+        Metrics that can't be computed yet (curve too short) are None.
+    """
+    __tablename__ = 'curve_metrics'  # Explicit table name for clarity and compatibility
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)  # Reference to User table
+    critical_power = db.Column(db.Float, index=True)  # Critical power (watts)
+    w_prime = db.Column(db.Float)  # W' (joules)
+    r_squared = db.Column(db.Float)  # Fit quality of the critical power model
+    ftp = db.Column(db.Float, index=True)  # Estimated FTP (watts)
+    normalized_power = db.Column(db.Float)  # Best single activity normalized power (watts)
+    computed_at = db.Column(db.DateTime)  # Timestamp of the last recompute
@@ -0,0 +1,42 @@
+// Draws power curves in the browser with Chart.js.
+// The data comes from /api/powercurve (or is inlined in the page) and looks like:
+// {"durations": [5, 10, ...], "xscale": "log", "curves": [{"label": "...", "watts": [...]}]}
+
+var CURVE_COLORS = ["#0d6efd", "#fd7e14", "#198754", "#dc3545", "#6f42c1", "#20c997", "#6c757d", "#d63384"];
+
+function drawPowerCurves(canvas, data) {
+    var datasets = data.curves.map(function(curve, i) {
+        var color = CURVE_COLORS[i % CURVE_COLORS.length];
+        return {
+            label: curve.label,
+            data: data.durations.map(function(duration, j) { return {x: duration, y: curve.watts[j]}; }),
+            borderColor: color,
+            backgroundColor: color,
+            borderDash: curve.dashed ? [6, 4] : [],
+            pointRadius: data.durations.length > 50 ? 0 : 3,
+            spanGaps: true
+        };
+    });
+    return new Chart(canvas, {
+        type: "line",
+        data: {datasets: datasets},
+        options: {
+            parsing: false,
+            animation: false,
+            scales: {
+                x: {type: data.xscale === "log" ? "logarithmic" : "linear", title: {display: true, text: "Duration (seconds)"}},
+                y: {title: {display: true, text: "Power (watts)"}}
+            }
+        }
+    });
+}
+
+// Fetch curve data from the API and draw it. Calls onData(data) first if given.
+function loadPowerCurves(canvas, url, onData) {
+    return fetch(url)
+        .then(function(response) { return response.json(); })
+        .then(function(data) {
+            if (onData) { onData(data); }
+            return drawPowerCurves(canvas, data);
+        });
+}
@@ -0,0 +1,58 @@
+# Shared fixtures: the app on a temporary SQLite database, with its caches in a temporary folder
+import os
+import sys
+import tempfile
+import pytest
+
+# Add the project root to the path so we can import models and app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# The caches and the upload folder read their locations when their modules are imported, so
+# they are pointed away from instance/ before anything imports the app
+_WORK_DIR = tempfile.mkdtemp(prefix="powercurve-tests-")
+for _name, _folder in (("CACHE_PATH", "cache.sqlite3"), ("STREAM_CACHE_DIR", "stream_cache"),
+                       ("PLOT_CACHE_DIR", "plot_cache"), ("UPLOAD_DIR", "uploads"), ("EXPORT_DIR", "exports")):
+    os.environ[_name] = os.path.join(_WORK_DIR, _folder)
+os.environ.pop("METRICS_DIR", None)
+# Nothing in the tests may reach the real Strava API
+os.environ["STRAVA_API_URL"] = "http://127.0.0.1:9/api/v3"
+
+
+@pytest.fixture
+def app(tmp_path):
+    """
+    The app on an empty database.
+
+    Notes:
+        No app context is left pushed: requests from the test client would reuse it, and its
+        database session, instead of getting their own like in production.
+    """
+    from app.factory import create_app
+    from app.cache import cache
+    from app import rankings
+    from models import db
+    app = create_app("development", SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+                     SECRET_KEY="test", STRAVA_WEBHOOK_VERIFY_TOKEN=None)
+    # Every test starts from a new database, so nothing cached for the previous one may be served
+    cache.clear()
+    rankings._index.__init__()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """Sign a user in on the test client, as the Strava OAuth callback does."""
+    def login(user_id):
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+            session["_fresh"] = True
+            session["access_token"] = "token"
+        return client
+    return login
@@ -0,0 +1,105 @@
+# FIT parsing on small files built by hand
+import io
+import numpy as np
+import struct
+import pytest
+from app.activity_files import FIT_EPOCH, FIT_INVALID_POWER, iter_fit_power, read_activity_file
+
+
+def fit_file(records):
+    """A FIT file with a 14 byte header, the given record bytes and a (zero) CRC."""
+    data = b''.join(records)
+    header = bytes([14, 0x20]) + struct.pack('<HI', 2132, len(data)) + b'.FIT' + b'\x00\x00'
+    return io.BytesIO(header + data + b'\x00\x00')
+
+
+def definition(local_type, global_number, fields):
+    """Definition message, little endian, fields as (number, size, base type) tuples."""
+    body = bytes([0, 0]) + struct.pack('<H', global_number) + bytes([len(fields)])
+    return bytes([0x40 | local_type]) + body + b''.join(bytes(field) for field in fields)
+
+
+# Local type 0: timestamp and power. Local type 1: power only, for compressed timestamp headers
+RECORD_WITH_TIMESTAMP = definition(0, 20, [(253, 4, 0x86), (7, 2, 0x84)])
+RECORD_POWER_ONLY = definition(1, 20, [(7, 2, 0x84)])
+
+
+def record(timestamp, power):
+    return bytes([0]) + struct.pack('<IH', timestamp, power)
+
+
+def compressed(offset, power):
+    return bytes([0x80 | (1 << 5) | offset]) + struct.pack('<H', power)
+
+
+def test_full_and_compressed_timestamps():
+    start = 1_000_000_000  # offset 0 in the low five bits
+    f = fit_file([
+        RECORD_WITH_TIMESTAMP, RECORD_POWER_ONLY,
+        record(start + 28, 200),
+        compressed(30, 210),
+        compressed(2, 220),  # Offset below the last one: rolled over to the next 32 seconds
+        compressed(3, FIT_INVALID_POWER),
+        record(start + 100, 250),
+    ])
+    assert list(iter_fit_power(f)) == [
+        (start + 28 + FIT_EPOCH, 200),
+        (start + 30 + FIT_EPOCH, 210),
+        (start + 34 + FIT_EPOCH, 220),
+        (start + 35 + FIT_EPOCH, None),
+        (start + 100 + FIT_EPOCH, 250),
+    ]
+
+
+def test_skips_other_fields_and_messages():
+    # A record with extra fields around the power, and a lap message (global 19) with a timestamp
+    extra = definition(2, 20, [(3, 1, 0x02), (253, 4, 0x86), (4, 1, 0x02), (7, 2, 0x84), (2, 2, 0x84)])
+    lap = definition(3, 19, [(253, 4, 0x86), (7, 2, 0x84)])
+    f = fit_file([
+        extra, lap,
+        bytes([2]) + struct.pack('<BIBHH', 140, 500, 90, 321, 1234),
+        bytes([3]) + struct.pack('<IH', 600, 999),
+    ])
+    assert list(iter_fit_power(f)) == [(500 + FIT_EPOCH, 321)]
+
+
+def test_chained_files():
+    first = fit_file([RECORD_WITH_TIMESTAMP, record(10, 100)]).getvalue()
+    second = fit_file([RECORD_WITH_TIMESTAMP, record(20, 200)]).getvalue()
+    assert list(iter_fit_power(io.BytesIO(first + second))) == [(10 + FIT_EPOCH, 100), (20 + FIT_EPOCH, 200)]
+
+
+def test_bad_files():
+    with pytest.raises(ValueError, match="Not a FIT file"):
+        list(iter_fit_power(io.BytesIO(bytes([14]) + b'\x00' * 13)))
+    truncated = fit_file([RECORD_WITH_TIMESTAMP, record(10, 100)]).getvalue()[:-5]
+    with pytest.raises(ValueError, match="Truncated"):
+        list(iter_fit_power(io.BytesIO(truncated)))
+    with pytest.raises(ValueError, match="undefined local type"):
+        list(iter_fit_power(fit_file([record(10, 100)])))
+
+
+def tcx_file(path, trackpoints):
+    points = "".join(
+        f"<Trackpoint><Time>{time}</Time><Extensions><TPX><Watts>{watts}</Watts></TPX></Extensions></Trackpoint>"
+        for time, watts in trackpoints
+    )
+    path.write_text('<TrainingCenterDatabase xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2">'
+                    f'<Activities><Activity><Lap><Track>{points}</Track></Lap></Activity></Activities>'
+                    '</TrainingCenterDatabase>')
+    return str(path)
+
+
+def test_read_tcx(tmp_path):
+    path = tcx_file(tmp_path / "ride.tcx", [("2026-05-01T10:00:00Z", 200), ("2026-05-01T10:00:03Z", 300)])
+    activity_id, start_date, watts = read_activity_file(path)
+    assert activity_id.startswith("file:")
+    assert start_date.isoformat() == "2026-05-01T10:00:00"
+    np.testing.assert_array_equal(watts, [200, 0, 0, 300])
+
+
+def test_rides_spanning_days_are_rejected(tmp_path):
+    # Two trackpoints 60 years apart would need a grid of about 15 GB
+    path = tcx_file(tmp_path / "ride.tcx", [("1970-01-02T00:00:00Z", 200), ("2030-01-01T00:00:00Z", 300)])
+    with pytest.raises(ValueError, match="longer than the 48 h limit"):
+        read_activity_file(path)
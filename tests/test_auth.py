@@ -0,0 +1,28 @@
+# Signing in and deleting your data
+from datetime import datetime
+from models import db, User, ActivityCurve, PowerCurve
+from app.extensions import strava
+from app.ingest import save_activity_curves
+from app.synthetic import synthetic_rides
+
+
+def test_delete_data_removes_cached_streams(app, login):
+    with app.app_context():
+        user = User(strava_id="1", access_token="token")
+        db.session.add(user)
+        db.session.flush()
+        rides = list(zip((21, 22), synthetic_rides(2, max_duration=1800, seed=2)))
+        save_activity_curves(user, rides, {21: datetime(2026, 1, 1), 22: datetime(2026, 1, 2)})
+        db.session.commit()
+        user_id = user.id
+    for activity_id, watts in rides:
+        strava.stream_cache.put(activity_id, watts)
+    # Another rider's stream stays
+    strava.stream_cache.put(23, rides[0][1])
+
+    response = login(user_id).post("/delete-data")
+    assert response.status_code == 302
+    with app.app_context():
+        assert not User.query.count() and not ActivityCurve.query.count() and not PowerCurve.query.count()
+    assert strava.stream_cache.get(21) is None and strava.stream_cache.get(22) is None
+    assert strava.stream_cache.get(23) is not None
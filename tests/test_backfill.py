@@ -0,0 +1,50 @@
+# Resumable history backfill
+import numpy as np
+from models import db, User, ActivityCurve, BackfillState
+from app.backfill import backfill_page
+from app.strava import StravaClient
+
+
+class FakeStrava(StravaClient):
+    """Strava with one page of rides, whose stream downloads fail for the IDs in `down`."""
+
+    def __init__(self, pages):
+        super().__init__()
+        self.pages = pages
+        self.down = set()
+
+    def get_activities(self, access_token, per_page=20, page=1):
+        return self.pages[page - 1] if page <= len(self.pages) else []
+
+    def get_watts_stream(self, access_token, activity_id, stop=None, failed=None):
+        if activity_id in self.down:
+            failed.append(activity_id)
+            return None
+        return np.full(600, 100.0 + activity_id)
+
+
+def rides(*ids):
+    return [{"id": i, "type": "Ride", "start_date": f"2026-01-{i:02d}T08:00:00Z"} for i in ids]
+
+
+def test_failed_streams_keep_the_page(app):
+    strava = FakeStrava([rides(1, 2, 3), rides(4)])
+    with app.app_context():
+        user = User(strava_id="1", access_token="token")
+        db.session.add(user)
+        db.session.commit()
+
+        strava.down = {2}
+        assert backfill_page(user.id, strava, per_page=3) is False
+        state = db.session.get(BackfillState, user.id)
+        assert state.next_page == 1 and "page 1" in state.error
+        assert sorted(row.activity_id for row in ActivityCurve.query) == ["1", "3"]
+
+        # Strava is back: the page is read again and only the missing ride is downloaded
+        strava.down = set()
+        assert backfill_page(user.id, strava, per_page=3) is True
+        state = db.session.get(BackfillState, user.id)
+        assert state.next_page == 2 and state.error is None
+        assert sorted(row.activity_id for row in ActivityCurve.query) == ["1", "2", "3"]
+        assert backfill_page(user.id, strava, per_page=3) is False
+        assert db.session.get(BackfillState, user.id).finished_at is not None
@@ -0,0 +1,22 @@
+# The shared cache of users and latest curves
+from models import db, User
+from app.cache import cache, get_user, user_key
+
+
+def test_user_cache_leaves_out_the_access_token(app):
+    with app.app_context():
+        db.session.add(User(strava_id="1", access_token="secret", strava_name="Rider"))
+        db.session.commit()
+        user_id = User.query.one().id
+        db.session.remove()
+
+        user = get_user(user_id)
+        assert user.strava_name == "Rider"
+        assert "access_token" not in cache.get(user_key(user_id))
+        db.session.remove()
+
+        # A cache hit, the token comes from the database when it's read
+        user = get_user(user_id)
+        assert "access_token" not in user.__dict__
+        assert user.access_token == "secret"
+        assert get_user(user_id) is user
@@ -0,0 +1,90 @@
+# The packed curve format, and curves still stored as JSON
+import json
+import numpy as np
+import pytest
+from sqlalchemy import text
+from models import db, PowerCurve, User
+from app.curve_format import (COMPRESS_MIN_POINTS, CURVE_HEADER, CURVE_MAGIC, FLAG_ZLIB, PackedCurve,
+                              decode_curve, encode_curve)
+from utils.migrate_curves import convert_rows
+
+CURVE = {5: 812.25, 60: 455.5, 1200: 301.75, 3600: 260.0}
+
+
+def flags(blob):
+    return CURVE_HEADER.unpack_from(blob)[2]
+
+
+def test_round_trip():
+    blob = encode_curve(CURVE)
+    assert blob[:2] == CURVE_MAGIC
+    assert not flags(blob) & FLAG_ZLIB
+    curve = decode_curve(blob)
+    assert isinstance(curve, PackedCurve)
+    assert curve.to_dict() == CURVE
+    assert list(curve) == sorted(CURVE)
+    # Packed curves encode to the same bytes as the dict they came from
+    assert encode_curve(curve) == blob
+
+
+def test_round_trip_full_resolution_is_compressed():
+    watts = np.linspace(1200, 150, COMPRESS_MIN_POINTS + 1).astype(np.float32)
+    full = PackedCurve(np.arange(1, len(watts) + 1, dtype=np.int32), watts)
+    blob = encode_curve(full)
+    assert flags(blob) & FLAG_ZLIB
+    assert len(blob) < CURVE_HEADER.size + 8 * len(full)
+    curve = decode_curve(blob)
+    np.testing.assert_array_equal(curve.durations, full.durations)
+    np.testing.assert_array_equal(curve.watts, full.watts)
+    # Compression can also be forced either way
+    assert flags(encode_curve(CURVE, compress=True)) & FLAG_ZLIB
+    assert not flags(encode_curve(full, compress=False)) & FLAG_ZLIB
+    assert decode_curve(encode_curve(CURVE, compress=True)).to_dict() == CURVE
+
+
+def test_decode_legacy_json():
+    legacy = json.dumps({str(d): p for d, p in CURVE.items()})
+    for value in (legacy, legacy.encode('utf-8'), memoryview(legacy.encode('utf-8')), json.loads(legacy)):
+        assert decode_curve(value).to_dict() == CURVE
+    assert decode_curve(None) is None
+
+
+def test_decode_rejects_unknown_versions():
+    blob = bytearray(encode_curve(CURVE))
+    blob[2] = 99
+    with pytest.raises(ValueError):
+        decode_curve(bytes(blob))
+
+
+def test_packed_curve_mapping():
+    curve = decode_curve(encode_curve({**CURVE, 30: 500.123}))
+    assert curve[30] == 500.12
+    assert curve["60"] == 455.5
+    assert 1200 in curve and 7 not in curve and "x" not in curve
+    with pytest.raises(KeyError):
+        curve[7]
+    assert len(curve) == 5
+    np.testing.assert_array_equal(curve.values_at([1, 5, 60, 99999], fill=-1), [-1, 812.25, 455.5, -1])
+    np.testing.assert_array_equal(PackedCurve.from_dict({}).values_at([5]), [0])
+
+
+def test_column_reads_legacy_rows_and_migrates_them(app):
+    with app.app_context():
+        user = User(strava_id="1", access_token="t")
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(PowerCurve(user_id=user.id, strava_id="1", activity_id="a", curve=CURVE))
+        legacy = json.dumps({str(d): p for d, p in CURVE.items()})
+        db.session.execute(text("INSERT INTO power_curve (user_id, strava_id, activity_id, curve) "
+                                "VALUES (:user_id, '1', 'b', :curve)"), {"user_id": user.id, "curve": legacy})
+        db.session.commit()
+        db.session.expunge_all()
+
+        rows = PowerCurve.query.order_by(PowerCurve.id).all()
+        assert [row.curve.to_dict() for row in rows] == [CURVE, CURVE]
+        assert convert_rows('power_curve') == 1
+        assert convert_rows('power_curve') == 0
+        raw = [bytes(value) for value, in db.session.execute(text("SELECT curve FROM power_curve"))]
+        assert all(value[:2] == CURVE_MAGIC for value in raw)
+        db.session.expunge_all()
+        assert [row.curve.to_dict() for row in PowerCurve.query.all()] == [CURVE, CURVE]
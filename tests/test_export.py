@@ -0,0 +1,51 @@
+# Bulk exports queued from /export and written by the job worker
+import csv
+import io
+from datetime import datetime
+from models import db, User, CurveJob
+from app.extensions import strava
+from app.ingest import save_activity_curves
+from app.jobs import work
+from app.synthetic import synthetic_rides
+
+AUTH = {"Authorization": "Bearer secret"}
+
+
+def test_export_needs_the_token(app, client):
+    assert client.post("/export/curves.csv").status_code == 404
+    app.config["EXPORT_TOKEN"] = "secret"
+    assert client.post("/export/curves.csv").status_code == 401
+    assert client.get("/export/curves.csv", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.post("/export/everything.csv", headers=AUTH).status_code == 404
+
+
+def test_export_runs_on_the_worker(app, client):
+    app.config["EXPORT_TOKEN"] = "secret"
+    with app.app_context():
+        for i in range(3):
+            user = User(strava_id=str(i), access_token="token")
+            db.session.add(user)
+            db.session.flush()
+            rides = list(zip((i * 10 + 1,), synthetic_rides(1, max_duration=1800, seed=i)))
+            save_activity_curves(user, rides, {i * 10 + 1: datetime(2026, 1, 1)})
+        db.session.commit()
+
+    assert client.get("/export/curves.csv", headers=AUTH).status_code == 404
+    response = client.post("/export/curves.csv", headers=AUTH)
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job["status"] == "queued"
+    # Asking again while it is queued returns the same job
+    assert client.post("/export/curves.csv", headers=AUTH).get_json()["id"] == job["id"]
+    assert client.get(job["status_url"], headers=AUTH).get_json()["status"] == "queued"
+
+    work(app, strava, once=True)
+    with app.app_context():
+        assert db.session.get(CurveJob, job["id"]).status == "done"
+    response = client.get(job["status_url"], headers=AUTH)
+    assert response.status_code == 302 and response.location.endswith("/export/curves.csv")
+    response = client.get("/export/curves.csv", headers=AUTH)
+    assert response.status_code == 200 and response.mimetype == "text/csv"
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert sorted(row["strava_id"] for row in rows) == ["0", "1", "2"]
+    assert all(float(row["watts_60s"]) > 0 for row in rows)
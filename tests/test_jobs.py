@@ -0,0 +1,157 @@
+# The job queue: deduplication, heartbeats, pruning and the job kinds
+import time
+from datetime import timedelta
+import numpy as np
+import pytest
+from sqlalchemy.exc import IntegrityError
+from models import db, User, CurveJob
+from app import jobs
+from app.jobs import FULL_CURVE_JOB_KIND, claim_next_job, enqueue_job, prune_jobs, run_job, work
+from app.strava import StravaClient
+
+
+def add_user():
+    user = User(strava_id="1", access_token="token")
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def test_enqueue_returns_the_active_job(app):
+    with app.app_context():
+        user = User(strava_id="1", access_token="token")
+        db.session.add(user)
+        db.session.commit()
+
+        job = enqueue_job(user.id)
+        assert enqueue_job(user.id).id == job.id
+        # Other kinds get their own job
+        assert enqueue_job(user.id, kind='import_files').id != job.id
+
+        assert claim_next_job().id == job.id
+        assert enqueue_job(user.id).id == job.id
+
+        job.status = 'done'
+        db.session.commit()
+        new = enqueue_job(user.id)
+        assert new.id != job.id and new.status == 'queued'
+        assert CurveJob.query.filter_by(user_id=user.id, kind='refresh').count() == 2
+
+
+def test_duplicate_insert_is_rejected(app):
+    # The partial unique index catches two requests that both saw no active job
+    with app.app_context():
+        user = User(strava_id="1", access_token="token")
+        db.session.add(user)
+        db.session.commit()
+        job = enqueue_job(user.id)
+        db.session.add(CurveJob(user_id=user.id, kind='refresh', status='queued'))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+        assert enqueue_job(user.id).id == job.id
+
+
+def test_enqueue_reuses_recently_finished_jobs(app):
+    with app.app_context():
+        user = add_user()
+        job = enqueue_job(user.id)
+        job.status, job.finished_at = 'done', jobs._now()
+        db.session.commit()
+        assert enqueue_job(user.id, reuse_seconds=60).id == job.id
+        # Without reuse_seconds, or once it is too old, the work is queued again
+        job.finished_at = jobs._now() - timedelta(seconds=120)
+        db.session.commit()
+        assert enqueue_job(user.id, reuse_seconds=60).id != job.id
+
+
+def test_running_jobs_with_a_heartbeat_are_not_taken_over(app):
+    with app.app_context():
+        user = add_user()
+        job = enqueue_job(user.id)
+        assert claim_next_job().id == job.id
+        long_ago = jobs._now() - timedelta(seconds=jobs.JOB_TIMEOUT + 60)
+        # Started long ago but still beating: left alone
+        job.started_at, job.heartbeat_at = long_ago, jobs._now()
+        db.session.commit()
+        assert claim_next_job() is None
+        # The heartbeat stopped (dead worker): taken over
+        job.heartbeat_at = long_ago
+        db.session.commit()
+        assert claim_next_job().id == job.id
+
+
+def test_run_job_beats_while_the_handler_runs(app, monkeypatch):
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "slow", lambda job, strava: time.sleep(0.5) or {"slept": True})
+    with app.app_context():
+        user = add_user()
+        enqueue_job(user.id, kind="slow")
+        job = claim_next_job()
+        claimed_at = job.heartbeat_at
+        run_job(job, None, heartbeat_interval=0.1)
+        db.session.expire_all()
+        job = db.session.get(CurveJob, job.id)
+        assert job.status == 'done' and job.result == {"slept": True}
+        assert job.heartbeat_at > claimed_at
+
+
+def test_prune_jobs(app):
+    with app.app_context():
+        user = add_user()
+        now = jobs._now()
+        for status, age in (('done', 10), ('failed', 10), ('done', 0.5), ('running', 10), ('queued', 10)):
+            db.session.add(CurveJob(user_id=user.id, kind=f"{status}-{age}", status=status,
+                                    finished_at=now - timedelta(days=age) if status in ('done', 'failed') else None))
+        db.session.commit()
+        assert prune_jobs(retention=24 * 3600) == 2
+        assert sorted(job.kind for job in CurveJob.query) == ["done-0.5", "queued-10", "running-10"]
+
+
+class FakeStrava(StravaClient):
+    """Two rides with power and one without."""
+
+    def get_activities(self, access_token, per_page=20, page=1):
+        return [{"id": i, "type": "Ride"} for i in (1, 2, 3)]
+
+    def get_watts_stream(self, access_token, activity_id, stop=None, failed=None):
+        return None if activity_id == 3 else np.full(300 * activity_id, 100.0 * activity_id)
+
+
+def test_full_resolution_curve_is_computed_by_a_job(app, login):
+    with app.app_context():
+        user_id = add_user().id
+    client = login(user_id)
+    response = client.get("/powercurve?resolution=full")
+    assert response.status_code == 200 and b"Computing your power curve" in response.data
+    # Views while it is queued don't queue it again
+    client.get("/powercurve?resolution=full")
+    with app.app_context():
+        assert CurveJob.query.filter_by(kind=FULL_CURVE_JOB_KIND).count() == 1
+
+    work(app, FakeStrava(), once=True)
+    with app.app_context():
+        job = CurveJob.query.filter_by(kind=FULL_CURVE_JOB_KIND).one()
+        assert job.status == 'done'
+        chart = job.result["chart"]
+    assert chart["durations"][0] == 1 and chart["durations"][-1] == 600
+    assert chart["curves"][0]["watts"][0] == pytest.approx(200.0)
+    assert chart["exact_seconds"] is None
+    response = client.get("/powercurve?resolution=full")
+    assert response.status_code == 200 and b"powercurve-chart" in response.data
+    with app.app_context():
+        assert CurveJob.query.filter_by(kind=FULL_CURVE_JOB_KIND).count() == 1
+
+
+def test_powercurve_views_reuse_the_last_refresh(app, login):
+    with app.app_context():
+        user_id = add_user().id
+    client = login(user_id)
+    client.get("/powercurve")
+    with app.app_context():
+        job = CurveJob.query.one()
+        job.status, job.finished_at = 'done', jobs._now()
+        db.session.commit()
+    for _ in range(3):
+        assert client.get("/powercurve").status_code == 200
+    with app.app_context():
+        assert CurveJob.query.count() == 1
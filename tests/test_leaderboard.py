@@ -0,0 +1,12 @@
+# Leaderboard routes
+import pytest
+from test_query_budget import add_users
+
+
+@pytest.mark.parametrize("limit,expected", [(-1, 1), (0, 1), (2, 2), (10 ** 6, 5)])
+def test_limit_is_clamped(app, login, limit, expected):
+    client = login(add_users(app, 5)[0])
+    response = client.get(f"/api/leaderboard?duration=60&limit={limit}")
+    assert len(response.get_json()["entries"]) == expected
+    page = client.get(f"/leaderboard?duration=60&limit={limit}").get_data(as_text=True)
+    assert page.count("</td><td>Rider ") == expected
@@ -0,0 +1,160 @@
+# The curve math against brute force on small streams
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from app.powercurve import (CurveSparseTable, full_mean_max_curve, mean_max_curve, mean_max_curves,
+                            normalized_powers, resample_1hz)
+
+
+def brute_mean_max(watts):
+    """Best average power for every duration, checking every window."""
+    w = np.maximum(np.asarray(watts, dtype=np.float64), 0.0)
+    csum = np.concatenate(([0.0], np.cumsum(w)))
+    return np.array([(csum[d:] - csum[:-d]).max() / d for d in range(1, len(w) + 1)])
+
+
+def streams():
+    rng = np.random.default_rng(7)
+    yield "random", rng.gamma(2.0, 100.0, 3000)
+    yield "intervals", np.tile(np.r_[np.full(40, 400.0), np.full(80, 120.0)], 25)
+    yield "steady", np.full(3000, 250.0) + rng.normal(0, 1, 3000)
+    yield "zeros", np.zeros(500)
+    yield "short", np.array([300.0, 0.0, 500.0])
+
+
+
+def brute_np(watts, window=30):
+    """Normalized power from an explicit rolling mean."""
+    w = np.asarray(watts, dtype=np.float64)
+    rolling = np.array([w[i:i + window].mean() for i in range(len(w) - window + 1)])
+    return (rolling ** 4).mean() ** 0.25
+
+
+def ragged_rides():
+    rng = np.random.default_rng(11)
+    return [rng.gamma(2.0, 100.0, n) for n in (90, 0, 7, 45, 30, 120)]
+
+
+def test_mean_max_curves_per_ride():
+    rides = ragged_rides()
+    durations = (1, 5, 30, 60, 100)
+    curves = mean_max_curves(rides, durations)
+    assert curves.shape == (len(rides), len(durations))
+    for ride, curve in zip(rides, curves):
+        expected = brute_mean_max(ride)
+        for duration, power in zip(durations, curve):
+            # Rides shorter than the duration report 0, never a window from the next ride
+            want = expected[duration - 1] if duration <= len(ride) else 0.0
+            assert power == pytest.approx(want, rel=1e-5, abs=1e-3)
+
+
+def test_mean_max_curves_missing_samples_are_zero():
+    curves = mean_max_curves([[100, None, 300], [None, None]], (1, 2, 3))
+    np.testing.assert_allclose(curves, [[300, 150, 400 / 3], [0, 0, 0]], rtol=1e-6)
+
+
+def test_mean_max_curve_takes_the_best_ride():
+    rides = ragged_rides()
+    durations = (5, 60, 1000)
+    expected = mean_max_curves(rides, durations).max(axis=0)
+    np.testing.assert_array_equal(mean_max_curve(rides, durations), expected)
+    assert mean_max_curve(rides, durations)[-1] == 0
+    np.testing.assert_array_equal(mean_max_curve([], durations), np.zeros(3))
+
+
+def test_normalized_powers():
+    rides = ragged_rides()
+    powers = normalized_powers(rides)
+    assert powers.shape == (len(rides),)
+    for ride, power in zip(rides, powers):
+        want = brute_np(ride) if len(ride) >= 30 else 0.0
+        assert power == pytest.approx(want, rel=1e-5)
+    # A steady ride's NP is its average power
+    assert normalized_powers([np.full(600, 200.0)])[0] == pytest.approx(200.0)
+    np.testing.assert_array_equal(normalized_powers([[100] * 10]), [0])
+
+
+@pytest.mark.parametrize("name,watts", list(streams()))
+def test_full_curve_exact_by_default(name, watts):
+    curve, exact_seconds = full_mean_max_curve(watts, block_size=16, max_cells=1 << 12)
+    assert exact_seconds == len(watts)
+    np.testing.assert_allclose(curve, brute_mean_max(watts), rtol=1e-5, atol=1e-3)
+
+
+@pytest.mark.parametrize("name,watts", list(streams()))
+def test_full_curve_over_the_work_budget(name, watts):
+    expected = brute_mean_max(watts)
+    curve, exact_seconds = full_mean_max_curve(watts, block_size=16, max_cells=1 << 12, max_work=20000,
+                                               log_points=32)
+    assert curve.shape == expected.shape
+    assert 0 <= exact_seconds <= len(watts)
+    np.testing.assert_allclose(curve[:exact_seconds], expected[:exact_seconds], rtol=1e-5, atol=1e-3)
+    # Above exact_seconds it's a lower bound, exact at the last (full ride) duration
+    assert np.all(curve[exact_seconds:] <= expected[exact_seconds:] * (1 + 1e-5) + 1e-3)
+    np.testing.assert_allclose(curve[-1], expected[-1], rtol=1e-5, atol=1e-3)
+
+
+def test_full_curve_steady_effort_runs_out_of_budget():
+    watts = np.full(20000, 250.0)
+    curve, exact_seconds = full_mean_max_curve(watts, max_work=10 ** 7)
+    assert 0 < exact_seconds < len(watts)
+    np.testing.assert_allclose(curve[:exact_seconds], 250.0)
+    assert np.all(curve <= 250.0 + 1e-3) and curve[-1] == pytest.approx(250.0)
+
+
+def test_full_curve_ignores_negative_and_missing_samples():
+    watts = [200.0, -50.0, np.nan, 400.0]
+    np.testing.assert_allclose(full_mean_max_curve(watts)[0], brute_mean_max([200.0, 0.0, 0.0, 400.0]))
+
+
+def test_full_curve_empty():
+    curve, exact_seconds = full_mean_max_curve([])
+    assert len(curve) == 0 and exact_seconds == 0
+
+
+def test_sparse_table_matches_brute_force():
+    rng = np.random.default_rng(3)
+    first = datetime(2026, 1, 1)
+    dates = [first + timedelta(days=int(d)) for d in rng.permutation(40)[:25]]
+    curves = rng.uniform(0, 500, (len(dates), 6)).astype(np.float32)
+    table = CurveSparseTable(dates, curves)
+    bounds = [None] + [first + timedelta(days=d) for d in range(-1, 42, 3)]
+    for start in bounds:
+        for end in bounds:
+            selected = [i for i, date in enumerate(dates)
+                        if (start is None or date >= start) and (end is None or date < end)]
+            expected = curves[selected].max(axis=0) if selected else np.zeros(6, dtype=np.float32)
+            np.testing.assert_array_equal(table.query(start, end), expected)
+
+
+def test_sparse_table_empty_range():
+    table = CurveSparseTable([datetime(2026, 3, 1)], [[100.0, 50.0]])
+    np.testing.assert_array_equal(table.query(datetime(2026, 4, 1), None), [0.0, 0.0])
+    np.testing.assert_array_equal(table.query(datetime(2026, 3, 2), datetime(2026, 3, 1)), [0.0, 0.0])
+    np.testing.assert_array_equal(table.query(None, datetime(2026, 3, 2)), [100.0, 50.0])
+
+
+def test_resample_zero_fill():
+    resampled = resample_1hz([100, 101, 103.4, 104], [200, np.nan, 300, 310])
+    np.testing.assert_array_equal(resampled, [200, 0, 0, 300, 310])
+
+
+def test_resample_hold_short_gaps_only():
+    times = [0, 1, 4, 5, 12, 13]
+    watts = [100, 110, 120, np.nan, 130, 140]
+    # 2 second gap held, then a 6 second gap (after the dropped sample) zero-filled end to end
+    np.testing.assert_array_equal(resample_1hz(times, watts, 'hold', max_hold=2),
+                                  [100, 110, 110, 110, 120] + [0] * 7 + [130, 140])
+    np.testing.assert_array_equal(resample_1hz(times, watts, 'hold'),
+                                  [100, 110, 110, 110, 120] + [120] * 7 + [130, 140])
+    # A trailing gap counts up to the end of the ride
+    np.testing.assert_array_equal(resample_1hz([0, 1, 2, 3], [100, np.nan, np.nan, np.nan], 'hold', max_hold=2),
+                                  [100, 0, 0, 0])
+
+
+def test_resample_rejects_spans_over_the_limit():
+    with pytest.raises(ValueError, match="limit"):
+        resample_1hz([0, 10 ** 9], [100, 200])
+    assert len(resample_1hz([0, 100], [100, 200], max_seconds=100)) == 101
+    with pytest.raises(ValueError):
+        resample_1hz([0, 101], [100, 200], max_seconds=100)
@@ -0,0 +1,71 @@
+# Database queries per request, counted by the instrumentation (DB_QUERIES in /metrics). The
+# pages must send a fixed number of queries however many users there are, so an N+1 pattern
+# (a query per user or per curve) fails here before it shows up in the load test.
+from datetime import datetime, timedelta
+import pytest
+from models import db, User
+from app.ingest import save_activity_curves
+from app.instrumentation import DB_QUERIES, registry
+from app.synthetic import synthetic_rides
+
+# Same default as utils/load_test.py --query-budget
+QUERY_BUDGET = 10
+
+ROUTES = [
+    ("/powercurve", "/powercurve"),
+    ("/api/powercurve", "/api/powercurve?windows=1"),
+    ("/api/powercurve", "/api/powercurve?compare={others}&envelope=1"),
+    ("/api/powercurve", "/api/powercurve?compare=all&envelope=1"),
+    ("/compare", "/compare"),
+    ("/leaderboard", "/leaderboard"),
+    ("/api/leaderboard", "/api/leaderboard?duration=60"),
+    ("/api/percentiles", "/api/percentiles"),
+]
+
+
+def add_users(app, count, first=0, rides=2):
+    """IDs of new users with a few synthetic rides each, stored the way the refresh job stores them."""
+    with app.app_context():
+        users = []
+        for i in range(first, first + count):
+            user = User(strava_id=str(1000 + i), access_token=f"token{i}", strava_name=f"Rider {i}")
+            db.session.add(user)
+            db.session.flush()
+            start = datetime(2026, 1, 1) + timedelta(days=i)
+            rides_with_power = list(enumerate(synthetic_rides(rides, max_duration=1800, seed=i), start=i * 100))
+            save_activity_curves(user, rides_with_power, {activity_id: start for activity_id, _ in rides_with_power})
+            users.append(user)
+        db.session.commit()
+        return [user.id for user in users]
+
+
+def queries(client, route, path):
+    """Queries the request to `path` sent, from the DB_QUERIES counter of its route."""
+    key = (DB_QUERIES, (("method", "GET"), ("route", route)))
+    before = registry.counters.get(key, 0)
+    response = client.get(path)
+    assert response.status_code == 200, response.data
+    return registry.counters.get(key, 0) - before
+
+
+@pytest.mark.parametrize("route,path", ROUTES)
+def test_queries_within_budget(app, login, route, path):
+    user_ids = add_users(app, 3)
+    client = login(user_ids[0])
+    others = ",".join(str(user_id) for user_id in user_ids[1:])
+    assert queries(client, route, path.format(others=others)) <= QUERY_BUDGET
+
+
+@pytest.mark.parametrize("route,path", ROUTES)
+def test_queries_independent_of_user_count(app, login, route, path):
+    user_ids = add_users(app, 3)
+    client = login(user_ids[0])
+    counts = []
+    for more in (0, 12):
+        user_ids += add_users(app, more, first=len(user_ids))
+        url = path.format(others=",".join(str(user_id) for user_id in user_ids[1:]))
+        # The first request fills the caches (and queues the refresh job), the second is the
+        # steady state
+        queries(client, route, url)
+        counts.append(queries(client, route, url))
+    assert counts[1] == counts[0]
@@ -0,0 +1,100 @@
+# The in-memory rank index against the curve_rank table
+import numpy as np
+import pytest
+from models import db, CurveRank, RankVersion, User
+from app import rankings
+from app.rankings import RankIndex, delete_curve_ranks, save_curve_ranks
+
+DURATIONS = (5, 60, 1200)
+
+
+def random_curve(rng):
+    curve = {d: float(rng.uniform(100, 1000)) for d in DURATIONS}
+    if rng.random() < 0.3:
+        curve[1200] = 0  # No ride long enough, left out of the rankings
+    return curve
+
+
+def table():
+    """{duration: {user_id: watts}} straight from curve_rank."""
+    ranks = {}
+    for rank in CurveRank.query.all():
+        ranks.setdefault(rank.duration, {})[rank.user_id] = rank.watts
+    return ranks
+
+
+def assert_matches_table(index):
+    ranks = table()
+    assert sorted(index.watts) == sorted(ranks)
+    assert index.version == db.session.query(RankVersion.version).scalar()
+    for duration, by_user in ranks.items():
+        values = np.array(sorted(by_user.values()))
+        np.testing.assert_array_equal(index.watts[duration], values)
+        assert dict(zip(index.users[duration].tolist(), index.watts[duration].tolist())) == by_user
+        best = sorted(by_user.items(), key=lambda item: -item[1])[:5]
+        assert index.top(duration, 5) == best
+        for watts in (0.0, values[len(values) // 2], 2000.0):
+            expected = 100.0 * ((values < watts).sum() + (values <= watts).sum()) / (2 * len(values))
+            assert index.percentile(duration, watts) == round(expected, 1)
+
+
+@pytest.fixture
+def riders(app):
+    rng = np.random.default_rng(3)
+    with app.app_context():
+        users = [User(strava_id=str(i), access_token="t") for i in range(30)]
+        db.session.add_all(users)
+        db.session.flush()
+        for user in users:
+            save_curve_ranks(user.id, random_curve(rng))
+        db.session.commit()
+        yield rng, [user.id for user in users]
+
+
+def test_sync_replaces_only_changed_users(riders, monkeypatch):
+    rng, user_ids = riders
+    index = RankIndex()
+    index.sync()
+    assert_matches_table(index)
+
+    for user_id in user_ids[:6]:
+        save_curve_ranks(user_id, random_curve(rng))
+    save_curve_ranks(user_ids[6], {5: 2000.0})  # New best, and gone from the other durations
+    for user_id in user_ids[-3:]:
+        delete_curve_ranks(user_id)
+    db.session.commit()
+
+    def reload(rows):
+        raise AssertionError("a few changed users should not reload the whole table")
+    monkeypatch.setattr(index, "_load", reload)
+    index.sync()
+    assert_matches_table(index)
+    assert index.top(5, 1) == [(user_ids[6], 2000.0)]
+    assert user_ids[-1] not in index.users[5]
+
+    # Nothing changed since, nothing to do
+    version = index.version
+    index.sync()
+    assert index.version == version
+
+
+def test_sync_reloads_after_a_rebuild_or_falling_behind(riders, monkeypatch):
+    rng, user_ids = riders
+    index = RankIndex()
+    index.sync()
+    loads = []
+    load = index._load
+    monkeypatch.setattr(index, "_load", lambda rows: loads.append(len(rows)) or load(rows))
+
+    rankings.rebuild_curve_ranks()  # Logged with no user: every row may have changed
+    index.sync()
+    assert len(loads) == 1
+    assert_matches_table(index)
+
+    monkeypatch.setattr(rankings, "RANK_CHANGES_KEPT", 2)
+    for user_id in user_ids[:2]:
+        save_curve_ranks(user_id, random_curve(rng))
+    db.session.commit()
+    index.sync()
+    assert len(loads) == 2
+    assert_matches_table(index)
@@ -0,0 +1,80 @@
+# Strava rate limiting, on a fake clock
+import pytest
+from app.strava import RateLimiter
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    # 10 seconds into a 15-minute window, far from midnight
+    return FakeClock(86400 * 100 + 3600 * 10 + 10)
+
+
+def limiter(clock, **kwargs):
+    return RateLimiter(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_waits_for_the_next_window(clock):
+    rate = limiter(clock, short_limit=3, daily_limit=100)
+    for _ in range(3):
+        rate.acquire()
+    assert clock.slept == []
+    rate.acquire()
+    assert clock.slept == [15 * 60 - 10]
+    assert rate.used == [1, 4]
+
+
+def test_reserve_leaves_part_of_the_quota(clock):
+    rate = limiter(clock, short_limit=10, daily_limit=100, reserve=0.3)
+    for _ in range(7):
+        rate.acquire()
+    assert clock.slept == []
+    rate.acquire()
+    assert len(clock.slept) == 1
+
+
+def test_daily_quota(clock):
+    rate = limiter(clock, short_limit=100, daily_limit=2)
+    rate.acquire()
+    rate.acquire()
+    rate.acquire()
+    assert clock.slept == [86400 - 3600 * 10 - 10]
+
+
+def test_update_from_headers(clock):
+    rate = limiter(clock)
+    rate.acquire()
+    rate.update({'X-RateLimit-Limit': '100,1000', 'X-RateLimit-Usage': '40,500'})
+    assert rate.limits == [100, 1000]
+    assert rate.used == [40, 500]
+    # Our own count is kept when the headers lag behind
+    rate.update({'X-RateLimit-Usage': '0,0'})
+    assert rate.used == [40, 500]
+    # Read limits win over the overall ones
+    rate.update({'X-RateLimit-Limit': '100,1000', 'X-ReadRateLimit-Limit': '50,500'})
+    assert rate.limits == [50, 500]
+    rate.update({'X-RateLimit-Limit': 'junk'})
+    assert rate.limits == [50, 500]
+
+
+def test_429_empties_the_bucket(clock):
+    rate = limiter(clock, short_limit=100, daily_limit=1000)
+    rate.update({}, status_code=429)
+    assert rate.used == [100, 0]
+    rate.acquire()
+    assert len(clock.slept) == 1
+    rate = limiter(clock, short_limit=100, daily_limit=1000)
+    rate.update({'X-RateLimit-Usage': '10,1000'}, status_code=429)
+    assert rate.used == [10, 1000]
@@ -0,0 +1,159 @@
+# Applying Strava webhook events to the stored curves
+from datetime import datetime
+import numpy as np
+import pytest
+from models import db, User, ActivityCurve, CurveRank, PowerCurve, StravaEvent
+from app.ingest import save_activity_curves
+from app.powercurve import DEFAULT_DURATIONS, mean_max_curve
+from app.strava import StravaClient
+from app.stream_cache import StreamCache
+from app.synthetic import synthetic_rides
+from app.webhooks import apply_activity_events, record_event
+
+
+class FakeStrava(StravaClient):
+    """Activities of the given sports, with the given watts streams."""
+
+    def __init__(self, types, streams, **kwargs):
+        super().__init__(**kwargs)
+        self.types, self.streams, self.fetched = types, streams, []
+
+    def get_activity(self, access_token, activity_id):
+        self.fetched.append(int(activity_id))
+        sport = self.types.get(int(activity_id))
+        return sport and {"id": int(activity_id), "type": sport, "start_date": "2026-01-02T08:00:00Z"}
+
+    def get_watts_stream(self, access_token, activity_id, stop=None, failed=None):
+        return self.streams.get(activity_id)
+
+
+def add_user():
+    user = User(strava_id="1", access_token="token")
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def event(activity_id, aspect_type, updates=None, event_time=1, **fields):
+    return {"object_type": "activity", "object_id": activity_id, "aspect_type": aspect_type, "owner_id": 1,
+            "updates": updates or {}, "event_time": event_time, "subscription_id": 1, **fields}
+
+
+@pytest.mark.parametrize("aspect_types,expected", [
+    (("create", "update"), "create"),
+    (("update", "create"), "create"),
+    (("create", "update", "delete"), "delete"),
+    (("delete", "create"), "delete"),
+    (("update", "update"), "update"),
+])
+def test_record_event_merges_pending_events(app, aspect_types, expected):
+    with app.app_context():
+        add_user()
+        for aspect_type in aspect_types:
+            record_event(event(11, aspect_type))
+        assert [row.aspect_type for row in StravaEvent.query] == [expected]
+
+
+def test_record_event_merges_updates_and_keeps_the_latest_time(app):
+    with app.app_context():
+        add_user()
+        record_event(event(11, "update", {"title": "Morning"}, event_time=20))
+        record_event(event(11, "update", {"type": "Ride"}, event_time=10))
+        record_event(event(12, "update", {"title": "Evening"}, event_time=5))
+        rows = {row.activity_id: row for row in StravaEvent.query}
+        assert rows["11"].updates == {"title": "Morning", "type": "Ride"}
+        assert rows["11"].event_time == 20
+        assert rows["12"].updates == {"title": "Evening"}
+
+
+def test_record_event_ignores_other_events(app):
+    with app.app_context():
+        add_user()
+        assert record_event(event(1, "update", object_type="athlete")) is None
+        assert record_event(event(11, "create", owner_id=2)) is None
+        assert record_event(event(11, "archive")) is None
+        assert record_event(event(None, "create")) is None
+        assert StravaEvent.query.count() == 0
+
+
+def stored_curve(user):
+    return PowerCurve.query.filter_by(user_id=user.id).one().curve.to_dict()
+
+
+def expected_curve(*rides):
+    return dict(zip(DEFAULT_DURATIONS, mean_max_curve(list(rides)).tolist()))
+
+
+def test_delete_rebuilds_the_curve_from_the_other_rides(app):
+    streams = {11: np.full(3600, 400.0), 12: np.full(3600, 200.0)}
+    strava = FakeStrava({11: "Ride", 12: "Ride"}, streams)
+    with app.app_context():
+        user = add_user()
+        save_activity_curves(user, list(streams.items()), {11: datetime(2026, 1, 2), 12: datetime(2026, 1, 1)})
+        db.session.commit()
+        assert stored_curve(user) == pytest.approx(expected_curve(streams[11]))
+
+        record_event(event(11, "delete"))
+        assert apply_activity_events(user, strava, StravaEvent.query.all())["removed"] == 1
+        # The running maximum can't forget a ride, the rebuilt curve does
+        assert stored_curve(user) == pytest.approx(expected_curve(streams[12]))
+        assert PowerCurve.query.one().activity_id == "12"
+        assert {rank.watts for rank in CurveRank.query} == {200.0}
+        assert strava.fetched == [] and StravaEvent.query.count() == 0
+
+        record_event(event(12, "delete"))
+        apply_activity_events(user, strava, StravaEvent.query.all())
+        assert PowerCurve.query.count() == 0 and CurveRank.query.count() == 0
+
+
+@pytest.mark.parametrize("sport,kept", [("Run", [12]), ("Ride", [11, 12])])
+def test_retype_refetches_the_activity(app, sport, kept):
+    streams = {11: np.full(3600, 400.0), 12: np.full(3600, 200.0)}
+    strava = FakeStrava({11: sport, 12: "Ride"}, dict(streams))
+    with app.app_context():
+        user = add_user()
+        save_activity_curves(user, list(streams.items()), {11: datetime(2026, 1, 2), 12: datetime(2026, 1, 1)})
+        db.session.commit()
+        # The stream Strava has now, e.g. after the rider cropped the ride
+        strava.streams[11] = np.full(3600, 300.0)
+
+        record_event(event(11, "update", {"type": sport}))
+        result = apply_activity_events(user, strava, StravaEvent.query.all())
+        assert strava.fetched == [11]
+        assert result["removed"] == 1 and result["added"] == len(kept) - 1
+        assert sorted(int(row.activity_id) for row in ActivityCurve.query) == kept
+        assert stored_curve(user) == pytest.approx(expected_curve(*(strava.streams[i] for i in kept)))
+
+
+def test_update_without_a_new_sport_changes_nothing(app):
+    streams = {11: np.full(3600, 400.0)}
+    strava = FakeStrava({11: "Ride"}, streams)
+    with app.app_context():
+        user = add_user()
+        save_activity_curves(user, list(streams.items()))
+        db.session.commit()
+        record_event(event(11, "update", {"title": "Renamed"}))
+        result = apply_activity_events(user, strava, StravaEvent.query.all())
+        assert result == {"added": 0, "removed": 0, "ignored": 1}
+        assert strava.fetched == [] and StravaEvent.query.count() == 0
+        assert stored_curve(user) == pytest.approx(expected_curve(streams[11]))
+
+
+def test_deleted_activity_leaves_the_stream_cache(app, tmp_path):
+    strava = StravaClient(stream_cache=StreamCache(str(tmp_path / "streams")))
+    with app.app_context():
+        user = User(strava_id="1", access_token="token")
+        db.session.add(user)
+        db.session.flush()
+        rides = list(zip((11, 12), synthetic_rides(2, max_duration=1800, seed=1)))
+        save_activity_curves(user, rides, {11: datetime(2026, 1, 1), 12: datetime(2026, 1, 2)})
+        for activity_id, watts in rides:
+            strava.stream_cache.put(activity_id, watts)
+        db.session.add(StravaEvent(user_id=user.id, activity_id="11", aspect_type="delete", event_time=1))
+        db.session.commit()
+
+        result = apply_activity_events(user, strava, StravaEvent.query.all())
+        assert result["removed"] == 1
+        assert [row.activity_id for row in ActivityCurve.query] == ["12"]
+        assert strava.stream_cache.get(11) is None
+        assert strava.stream_cache.get(12) is not None
@@ -0,0 +1,46 @@
+# Date window curves and the per-worker cache of their sparse tables
+from datetime import datetime, timedelta
+from models import db, User
+from app import windows
+from app.ingest import save_activity_curves
+from app.synthetic import synthetic_rides
+
+
+def add_user(i, rides):
+    user = User(strava_id=str(i), access_token="token")
+    db.session.add(user)
+    db.session.flush()
+    rides_with_power = list(enumerate(synthetic_rides(rides, max_duration=1800, seed=i), start=i * 100))
+    start = datetime(2026, 1, 1)
+    save_activity_curves(user, rides_with_power,
+                         {activity_id: start + timedelta(days=j) for j, (activity_id, _) in enumerate(rides_with_power)})
+    db.session.commit()
+    return user.id
+
+
+def test_cache_is_bounded_by_bytes(app, monkeypatch):
+    monkeypatch.setattr(windows, "_tables", type(windows._tables)())
+    monkeypatch.setattr(windows, "_tables_bytes", 0)
+    with app.app_context():
+        small, large = add_user(1, 2), add_user(2, 12)
+        small_bytes = windows.user_sparse_table(small).nbytes
+        large_bytes = windows.user_sparse_table(large).nbytes
+        assert list(windows._tables) == [small, large]
+        assert windows._tables_bytes == small_bytes + large_bytes
+
+        # Room for the large table only: the small one is dropped when the large one comes back
+        monkeypatch.setattr(windows, "WINDOW_CACHE_MAX_BYTES", large_bytes)
+        windows._tables.clear()
+        windows._tables_bytes = 0
+        windows.user_sparse_table(small)
+        windows.user_sparse_table(large)
+        assert list(windows._tables) == [large]
+        assert windows._tables_bytes == large_bytes
+
+        # Too large on its own: served but not cached
+        monkeypatch.setattr(windows, "WINDOW_CACHE_MAX_BYTES", small_bytes)
+        windows._tables.clear()
+        windows._tables_bytes = 0
+        windows.user_sparse_table(large)
+        assert list(windows._tables) == []
+        assert windows._tables_bytes == 0
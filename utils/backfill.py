@@ -0,0 +1,39 @@
+# utility script to import the whole Strava history of existing users
+# Resumable: progress is checkpointed per user after every page, so just run it again after an
+# interruption. Point STRAVA_API_URL at a local stub server to try it without using the quota.
+#
+#   python utils/backfill.py [dev] [--users 1,2,3] [--workers 4] [--reserve 0.2] [--restart]
+import argparse
+import os
+import sys
+
+# Add the project root to the path so we can import models and app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.strava import StravaClient, RateLimiter
+from app.stream_cache import StreamCache
+from app.backfill import BACKFILL_PAGE_SIZE, run_backfill
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import the full activity history of users.")
+    parser.add_argument("mode", nargs="?", choices=["dev"], help="Use the development database")
+    parser.add_argument("--users", help="Comma separated user IDs (default: everyone)")
+    parser.add_argument("--workers", type=int, default=4, help="Users processed at the same time")
+    parser.add_argument("--per-page", type=int, default=BACKFILL_PAGE_SIZE)
+    parser.add_argument("--reserve", type=float, default=0.2,
+                        help="Fraction of the Strava quotas left for the web app")
+    parser.add_argument("--restart", action="store_true", help="Ignore saved progress")
+    args = parser.parse_args()
+
+    from app.factory import create_app
+    app = create_app(args.mode)
+    # Separate client with its own share of the quota. It reads and fills the shared stream
+    # cache, but doesn't keep activity pages: each page of the history is read only once
+    strava = StravaClient(stream_cache=StreamCache(), rate_limiter=RateLimiter(reserve=args.reserve),
+                          activity_cache_size=0)
+    user_ids = [int(user_id) for user_id in args.users.split(",")] if args.users else None
+    results = run_backfill(app, strava, user_ids=user_ids, workers=args.workers,
+                           per_page=args.per_page, restart=args.restart)
+    failed = {user_id: result for user_id, result in results.items() if result != "done"}
+    print(f"Backfill finished: {len(results) - len(failed)} users done, {len(failed)} failed.")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,210 @@
+# utility script with micro-benchmarks of the curve math on synthetic rides (see app/synthetic.py)
+# Results are written as JSON (one file per run, tagged with the git commit), so runs on
+# different commits can be compared:
+#
+#   python utils/benchmark.py [--quick] [--filter mean_max] [--repeats 5]
+#   python utils/benchmark.py --baseline instance/benchmarks/micro-20250101T120000-abc1234.json
+#
+# With --baseline, benchmarks more than --threshold times slower than the baseline are listed
+# and the script exits with status 1. utils/load_test.py writes its results the same way.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+# Add the project root to the path so we can import app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from app.synthetic import synthetic_rides, synthetic_stream
+from app.powercurve import (
+    DEFAULT_DURATIONS, align_curves, curve_to_dict, fit_critical_power, full_mean_max_curve,
+    mean_max_curves, normalized_powers, resample_1hz,
+)
+from app.curve_format import decode_curve, encode_curve
+
+BENCHMARK_DIR = os.getenv(
+    'BENCHMARK_DIR',
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'instance', 'benchmarks'))
+)
+# Ride lengths (seconds) and numbers of rides benchmarked
+RIDE_LENGTHS = (1800, 3600, 4 * 3600, 24 * 3600)
+RIDE_COUNTS = (1, 10, 50)
+# Combinations with more samples than this are skipped (they only measure memory bandwidth)
+MAX_SAMPLES = 20_000_000
+
+
+def git_commit():
+    """Short hash of the checked out commit (with "-dirty" for local changes), or None."""
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                               check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def time_call(func, repeats=5, min_seconds=0.2):
+    """
+    Time a function call.
+
+    Args:
+        func (callable): Called without arguments.
+        repeats (int): Minimum number of timed calls (after one untimed warm-up call).
+        min_seconds (float): Keep calling until at least this much time was measured.
+
+    Returns:
+        dict: {"min", "median", "mean"} seconds per call and the number of "calls".
+    """
+    func()
+    times = []
+    while len(times) < repeats or sum(times) < min_seconds:
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        if len(times) >= 1000:
+            break
+    return {"min": min(times), "median": float(np.median(times)), "mean": float(np.mean(times)),
+            "calls": len(times)}
+
+
+def write_results(kind, results, config, output_dir=BENCHMARK_DIR):
+    """
+    Write one run's results as JSON.
+
+    Args:
+        kind (str): "micro" or "load", the start of the file name.
+        results (dict): name -> measurements.
+        config (dict): The settings of the run.
+        output_dir (str): Folder for the result files.
+
+    Returns:
+        str: Path of the written file, <kind>-<UTC time>-<commit>.json.
+    """
+    now = datetime.now(timezone.utc)
+    commit = git_commit()
+    document = {
+        "kind": kind,
+        "commit": commit,
+        "timestamp": now.isoformat(timespec='seconds'),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "config": config,
+        "results": results,
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{kind}-{now.strftime('%Y%m%dT%H%M%S')}-{commit or 'nogit'}.json")
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    return path
+
+
+def compare_results(results, baseline_path, metric, threshold):
+    """
+    Compare a run with an earlier results file.
+
+    Args:
+        results (dict): name -> measurements of this run.
+        baseline_path (str): Results file written by an earlier run.
+        metric (str): Measurement compared, lower is better ("min" seconds, "p95" latency...).
+        threshold (float): Ratio to the baseline above which a result counts as a regression.
+
+    Returns:
+        list: (name, baseline value, new value, ratio) of every regression.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for name, measured in sorted(results.items()):
+        before, after = baseline.get(name, {}).get(metric), measured.get(metric)
+        if not before or after is None:
+            continue
+        ratio = after / before
+        flag = "  <-- slower" if ratio > threshold else ""
+        print(f"{name:55s} {before:10.4f} -> {after:10.4f}  x{ratio:.2f}{flag}")
+        if ratio > threshold:
+            regressions.append((name, before, after, ratio))
+    return regressions
+
+
+def micro_benchmarks(lengths=RIDE_LENGTHS, counts=RIDE_COUNTS, max_samples=MAX_SAMPLES):
+    """
+    The micro-benchmarks as (name, params, function) tuples.
+
+    Notes:
+        Every ride is generated once up front, so only the computation is timed.
+    """
+    benchmarks = []
+    rides = {length: synthetic_rides(max(counts), length, length + 1, seed=length) for length in lengths}
+    for length in lengths:
+        for count in counts:
+            if length * count > max_samples:
+                continue
+            batch = rides[length][:count]
+            params = {"ride_seconds": length, "rides": count}
+            benchmarks.append((f"mean_max_curves/{length}s/x{count}", params,
+                               lambda batch=batch: mean_max_curves(batch)))
+            benchmarks.append((f"normalized_powers/{length}s/x{count}", params,
+                               lambda batch=batch: normalized_powers(batch)))
+        ride = rides[length][0]
+        benchmarks.append((f"full_mean_max_curve/{length}s", {"ride_seconds": length},
+                           lambda ride=ride: full_mean_max_curve(ride)))
+
+        stream = synthetic_stream(length, seed=length)
+        times = stream["time"]["data"]
+        watts = np.array(stream["watts"]["data"], dtype=np.float64)
+        benchmarks.append((f"resample_1hz/{length}s", {"ride_seconds": length},
+                           lambda times=times, watts=watts: resample_1hz(times, watts)))
+
+    # Storage format of a full resolution curve
+    longest = max(lengths)
+    # A perfectly steady effort, where every duration would need a full scan
+    steady = np.full(longest, 200.0)
+    benchmarks.append((f"full_mean_max_curve/steady/{longest}s", {"ride_seconds": longest},
+                       lambda: full_mean_max_curve(steady)))
+    full_curve, _ = full_mean_max_curve(rides[longest][0])
+    curve = curve_to_dict(np.arange(1, len(full_curve) + 1), full_curve)
+    encoded = encode_curve(curve)
+    benchmarks.append((f"encode_curve/{len(curve)}pts", {"points": len(curve)}, lambda: encode_curve(curve)))
+    benchmarks.append((f"decode_curve/{len(curve)}pts", {"points": len(curve)}, lambda: decode_curve(encoded)))
+
+    # Critical power fit over the stored curves of many users at once
+    for users in (100, 1000):
+        curves = mean_max_curves(synthetic_rides(users, seed=users, max_duration=2 * 3600))
+        durations, matrix = align_curves([curve_to_dict(DEFAULT_DURATIONS, powers) for powers in curves])
+        benchmarks.append((f"fit_critical_power/x{users}", {"users": users},
+                           lambda durations=durations, matrix=matrix: fit_critical_power(durations, matrix)))
+    return benchmarks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the power curve math.")
+    parser.add_argument("--quick", action="store_true", help="Shorter rides and fewer of them")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default=BENCHMARK_DIR, help="Folder for the results file")
+    parser.add_argument("--baseline", help="Earlier results file to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    lengths, counts = ((1800, 4 * 3600), (1, 10)) if args.quick else (RIDE_LENGTHS, RIDE_COUNTS)
+    results = {}
+    for name, params, func in micro_benchmarks(lengths, counts):
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = {**params, **time_call(func, args.repeats)}
+        print(f"{name:55s} {results[name]['min'] * 1000:10.2f} ms (median {results[name]['median'] * 1000:.2f} ms)")
+
+    config = {"quick": args.quick, "filter": args.filter, "repeats": args.repeats}
+    print(f"Results written to {write_results('micro', results, config, args.output)}")
+    if args.baseline:
+        regressions = compare_results(results, args.baseline, "min", args.threshold)
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,93 @@
+# utility script measuring how long a fresh process takes to import and build the app and to
+# answer its first request, with and without gunicorn-style --preload (build once, then fork).
+# Results are written like the benchmarks (see utils/benchmark.py).
+#
+#   python utils/boot_time.py [--runs 10] [--baseline instance/benchmarks/boot-....json]
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Add the project root to the path so we can import utils
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from utils.benchmark import BENCHMARK_DIR, compare_results, write_results
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Runs in a fresh interpreter and prints its timings as JSON
+PROBE = r'''
+import json, os, sys, time
+start = time.perf_counter()
+from app.factory import create_app
+imported = time.perf_counter()
+app = create_app("development")
+created = time.perf_counter()
+app.test_client().get("/")
+answered = time.perf_counter()
+
+# --preload: the master built the app above, a forked worker only has to answer
+read_fd, write_fd = os.pipe()
+forked = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    app.test_client().get("/")
+    os.write(write_fd, str(time.perf_counter() - forked).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+preload_worker = float(os.read(read_fd, 64))
+print(json.dumps({
+    "import": imported - start,
+    "create_app": created - imported,
+    "first_request": answered - created,
+    "total": answered - start,
+    "preload_worker": preload_worker,
+    "modules": len(sys.modules),
+    "heavy_modules": sorted(m for m in ("matplotlib", "psycopg", "xml.etree.ElementTree") if m in sys.modules),
+}))
+'''
+
+
+def measure(runs):
+    """Median of every timing over `runs` fresh interpreters."""
+    work_dir = tempfile.mkdtemp(prefix="powercurve-boot-")
+    env = dict(os.environ,
+               SQLALCHEMY_DATABASE_URI_DEV="sqlite:///" + os.path.join(work_dir, "boot.db"),
+               STREAM_CACHE_DIR=os.path.join(work_dir, "streams"),
+               PLOT_CACHE_DIR=os.path.join(work_dir, "plots"),
+               CACHE_PATH=os.path.join(work_dir, "cache.sqlite3"))
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT_DIR, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    results = {}
+    for key in ("import", "create_app", "first_request", "total", "preload_worker"):
+        values = [sample[key] for sample in samples]
+        results[key] = {"median": float(np.median(values)), "min": min(values), "runs": runs}
+    results["modules"] = {"count": samples[-1]["modules"], "heavy": samples[-1]["heavy_modules"]}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure import and boot time of the app.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", default=BENCHMARK_DIR, help="Folder for the results file")
+    parser.add_argument("--baseline", help="Earlier results file to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    for key, value in results.items():
+        if "median" in value:
+            print(f"{key:20s} {value['median'] * 1000:8.1f} ms (min {value['min'] * 1000:.1f} ms)")
+    print(f"Modules loaded: {results['modules']['count']}, heavy: {', '.join(results['modules']['heavy']) or 'none'}")
+    print(f"Results written to {write_results('boot', results, {'runs': args.runs}, args.output)}")
+    if args.baseline:
+        regressions = compare_results(results, args.baseline, "median", args.threshold)
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        sys.exit(1 if regressions else 0)
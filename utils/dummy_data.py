@@ -8,6 +8,9 @@ from models import db, User, PowerCurve  # Ensure User model includes username f
 from random import randint, uniform
 from flask import Flask
 from utils.pretty_print import print_db_state
+from app.powercurve import DEFAULT_DURATIONS, mean_max_curve, curve_to_dict
+from app.synthetic import synthetic_rides
+from app.rankings import save_curve_ranks
 
 def create_dummy_data(app):
     with app.app_context():
@@ -26,21 +29,9 @@ def create_dummy_data(app):
                 db.session.add(user)
                 db.session.commit()
         
-            # Create a Power Curve for each user
-            durations = [5, 10, 20, 30, 60, 120, 180, 300, 600, 900, 1200, 1800, 3600]
-            max_power = round(uniform(100, 1000), 2)
-            curve = {}
-            prev_power = max_power
-            for duration in durations:
-                # For the first duration, use max_power; for others, decrease by a random amount
-                if duration == durations[0]:
-                    power = prev_power
-                else:
-                    # Decrease by a random value between 5 and 20, but not below 100
-                    decrease = round(uniform(5, 20), 2)
-                    power = max(100, prev_power - decrease)
-                curve[str(duration)] = power
-                prev_power = power
+            # Create a Power Curve for each user from a few synthetic rides (see app/synthetic.py)
+            rides = synthetic_rides(5, max_duration=4 * 3600, ftp=uniform(150, 350))
+            curve = curve_to_dict(DEFAULT_DURATIONS, mean_max_curve(rides))
             power_curve = PowerCurve(
                 user_id=user.id,
                 strava_id=user.strava_id,
@@ -49,6 +40,7 @@ def create_dummy_data(app):
             )
             print(f'Adding user: {power_curve.user_id} \n with curve: {power_curve.curve}')
             db.session.add(power_curve)
+            save_curve_ranks(user.id, curve)
             try:
                 db.session.commit()
                 print(f"PowerCurve added for {user.strava_name}")
@@ -0,0 +1,42 @@
+# utility script exporting every user's power curves (or the per-activity curves) to CSV or
+# Parquet for analysis. Rows are read and written in batches, so memory use stays flat.
+#
+#   python utils/export_curves.py [dev] [--activities] [--format csv|parquet] [--output FILE]
+import argparse
+import contextlib
+import os
+import sys
+
+# Add the project root to the path so we can import models and app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.factory import create_app
+from app.export import EXPORT_BATCH_SIZE, EXPORT_FORMATS, stream_export
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export stored power curves to CSV or Parquet.")
+    parser.add_argument("mode", nargs="?", choices=["dev"], help="Use the development database")
+    parser.add_argument("--activities", action="store_true",
+                        help="Export the per-activity curves instead of each user's power curve")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--output", help="File to write (default curves.<format> or activities.<format>, - for stdout)")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="Rows read at a time")
+    args = parser.parse_args()
+
+    table = "activities" if args.activities else "curves"
+    output = args.output or f"{table}.{args.format}"
+    # Keep stdout for the data when exporting to it
+    with contextlib.redirect_stdout(sys.stderr):
+        app = create_app(args.mode)
+    with app.app_context():
+        try:
+            chunks = stream_export(table, args.format, args.batch_size)
+        except RuntimeError as e:
+            sys.exit(str(e))
+        size = 0
+        with (open(output, "wb") if output != "-" else os.fdopen(sys.stdout.fileno(), "wb", closefd=False)) as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+    if output != "-":
+        print(f"Wrote {size} bytes to {output}.", file=sys.stderr)
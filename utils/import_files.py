@@ -0,0 +1,33 @@
+# utility script to import FIT/TCX files (or folders of them) for a user
+#
+#   python utils/import_files.py [dev] --user ID PATH [PATH ...] [--processes N]
+import argparse
+import os
+import sys
+
+# Add the project root to the path so we can import models and app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.activity_files import IMPORT_PROCESSES, import_activity_files
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import FIT/TCX ride files for a user.")
+    parser.add_argument("--user", type=int, required=True, help="User ID the rides belong to")
+    parser.add_argument("--processes", type=int, default=IMPORT_PROCESSES, help="Parser processes")
+    parser.add_argument("paths", nargs="+", help="Files or folders (searched recursively)")
+    # A leading "dev" uses the development database (it can't be an optional positional
+    # argument next to the paths)
+    dev = sys.argv[1:2] == ["dev"]
+    args = parser.parse_args(sys.argv[2:] if dev else sys.argv[1:])
+
+    from app.factory import create_app
+    app = create_app("development" if dev else None)
+    from models import db, User
+    with app.app_context():
+        user = db.session.get(User, args.user)
+        if not user:
+            sys.exit(f"User {args.user} not found.")
+        result = import_activity_files(user, args.paths, processes=args.processes)
+    print(f"Imported {result['imported']} rides, skipped {result['skipped']}.")
+    for error in result["errors"]:
+        print(f"Could not read {error}")
@@ -0,0 +1,176 @@
+# utility script for an end-to-end load test: the app (with its job worker) is served locally
+# against the stub Strava API (utils/stub_strava.py) and a temporary SQLite database, synthetic
+# riders sign in and import their rides, then /powercurve, /compare and /api/powercurve are
+# requested concurrently. Latency percentiles per endpoint are written as JSON next to the
+# micro-benchmark results (see utils/benchmark.py), with the database queries per request: any
+# request over --query-budget (an N+1 query pattern) fails the run.
+#
+#   python utils/load_test.py [--users 20] [--rides 20] [--requests 200] [--concurrency 8]
+#   python utils/load_test.py --baseline instance/benchmarks/load-20250101T120000-abc1234.json
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the project root to the path so we can import models and app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import requests
+from utils.benchmark import BENCHMARK_DIR, compare_results, write_results
+from utils.stub_strava import StubStrava
+
+
+def scenarios(user_ids):
+    """(name, method, path, form data) of every request type in the load phase."""
+    others = ",".join(str(user_id) for user_id in user_ids[1:4])
+    return [
+        ("GET /powercurve", "GET", "/powercurve", None),
+        ("GET /api/powercurve?windows=1", "GET", "/api/powercurve?windows=1", None),
+        ("GET /compare", "GET", "/compare", None),
+        ("POST /compare (everyone)", "POST", "/compare", {"compare_all": "1"}),
+        ("GET /api/powercurve?compare=3 users", "GET", f"/api/powercurve?compare={others}&envelope=1", None),
+        ("GET /api/powercurve?compare=all", "GET", "/api/powercurve?compare=all&envelope=1", None),
+    ]
+
+
+def latency_summary(latencies, errors, seconds):
+    """Request count, error count, throughput and latency percentiles (in seconds)."""
+    latencies = np.asarray(latencies, dtype=np.float64)
+    summary = {"requests": len(latencies), "errors": errors,
+               "requests_per_second": len(latencies) / seconds if seconds else None}
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary.update(mean=float(latencies.mean()), p50=float(p50), p95=float(p95), p99=float(p99),
+                       max=float(latencies.max()))
+    return summary
+
+
+def run_requests(sessions, method, path, data, count, concurrency):
+    """Send `count` requests spread over the signed in sessions, `concurrency` at a time."""
+    def one(i):
+        session, url = sessions[i % len(sessions)]
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url + path, data=data, allow_redirects=False)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(count)))
+    seconds = time.perf_counter() - start
+    return latency_summary([t for t, _ in results], sum(1 for _, ok in results if not ok), seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end load test against a stub Strava API.")
+    parser.add_argument("--users", type=int, default=20, help="Synthetic riders")
+    parser.add_argument("--rides", type=int, default=20, help="Rides per rider")
+    parser.add_argument("--max-ride-hours", type=float, default=6, help="Longest ride")
+    parser.add_argument("--strava-latency", type=float, default=0.0,
+                        help="Seconds the stub adds to every Strava response")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--workers", type=int, default=1, help="Job worker threads importing rides")
+    parser.add_argument("--output", default=BENCHMARK_DIR, help="Folder for the results file")
+    parser.add_argument("--query-budget", type=int, default=10,
+                        help="Most database queries a request may send (0 for no limit)")
+    parser.add_argument("--baseline", help="Earlier results file to compare with (by p95 latency)")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    stub = StubStrava(rides=args.rides, max_ride_seconds=int(args.max_ride_hours * 3600),
+                      latency=args.strava_latency).start()
+    work_dir = tempfile.mkdtemp(prefix="powercurve-load-")
+    # Everything the app reads at import time must be set before main is imported
+    os.environ.update({
+        "STRAVA_API_URL": stub.api_url,
+        "STRAVA_OAUTH_URL": stub.oauth_url,
+        "SQLALCHEMY_DATABASE_URI_DEV": "sqlite:///" + os.path.join(work_dir, "load.db"),
+        "STREAM_CACHE_DIR": os.path.join(work_dir, "streams"),
+        "PLOT_CACHE_DIR": os.path.join(work_dir, "plots"),
+        "CACHE_PATH": os.path.join(work_dir, "cache.sqlite3"),
+        "UPLOAD_DIR": os.path.join(work_dir, "uploads"),
+    })
+    from werkzeug.serving import make_server
+    from app.factory import create_app
+    from app.extensions import strava
+    from app.jobs import work
+    from app.instrumentation import DB_QUERIES, QUERY_BUDGET_EXCEEDED, registry
+    app = create_app("development", QUERY_BUDGET=args.query_budget or None)
+
+    def total(name):
+        return sum(value for (metric, _), value in list(registry.counters.items()) if metric == name)
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # No line per request
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    print(f"App on {url}, stub Strava API on {stub.api_url}, data in {work_dir}")
+    results = {}
+
+    # Sign in every rider through the OAuth callback
+    sessions = [(requests.Session(), url) for _ in range(args.users)]
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for i, (session, _) in enumerate(sessions):
+        request_start = time.perf_counter()
+        response = session.get(f"{url}/strava/callback", params={"code": f"athlete-{i + 1}"},
+                               allow_redirects=False)
+        latencies.append(time.perf_counter() - request_start)
+        errors += response.status_code >= 400
+    results["GET /strava/callback"] = latency_summary(latencies, errors, time.perf_counter() - start)
+
+    # Import every rider's rides: each /powercurve visit queues a refresh, the workers drain it
+    for session, _ in sessions:
+        session.get(f"{url}/powercurve", allow_redirects=False)
+    start = time.perf_counter()
+    workers = [threading.Thread(target=work, args=(app, strava), kwargs={"once": True})
+               for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - start
+    from models import ActivityCurve, User
+    with app.app_context():
+        activities = ActivityCurve.query.count()
+        user_ids = [user_id for (user_id,) in User.query.with_entities(User.id).order_by(User.id)]
+    results["ingest"] = {"seconds": seconds, "activities": activities,
+                         "activities_per_second": activities / seconds if seconds else None}
+    print(f"Imported {activities} rides in {seconds:.2f} s")
+
+    for name, method, path, data in scenarios(user_ids):
+        queries = total(DB_QUERIES)
+        results[name] = run_requests(sessions, method, path, data, args.requests, args.concurrency)
+        summary = results[name]
+        summary["queries_per_request"] = (total(DB_QUERIES) - queries) / summary["requests"]
+        print(f"{name:45s} {summary['requests_per_second']:8.1f} req/s"
+              f"  p50 {summary['p50'] * 1000:8.1f} ms  p95 {summary['p95'] * 1000:8.1f} ms"
+              f"  {summary['queries_per_request']:5.1f} queries/req  errors {summary['errors']}")
+
+    server.shutdown()
+    stub.stop()
+    config = {key: getattr(args, key) for key in
+              ("users", "rides", "max_ride_hours", "strava_latency", "requests", "concurrency", "workers",
+               "query_budget")}
+    config["strava_requests"] = stub.requests
+    print(f"Results written to {write_results('load', results, config, args.output)}")
+    failed = sum(summary.get("errors", 0) for summary in results.values())
+    over_budget = total(QUERY_BUDGET_EXCEEDED)
+    if over_budget:
+        print(f"{over_budget} requests sent more than {args.query_budget} queries")
+        failed += over_budget
+    if args.baseline:
+        regressions = compare_results(results, args.baseline, "p95", args.threshold)
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        sys.exit(1 if regressions or failed else 0)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,72 @@
+# utility script to convert stored power curves from JSON to the packed binary format
+# (see app/curve_format.py). Safe to stop and run again: converted rows are skipped.
+#
+#   python utils/migrate_curves.py [dev] [--batch-size N]
+#
+# Run it after "utils/migrate_db.py upgrade", whose 0002_packed_curves migration changes the
+# curve columns from json to bytea on PostgreSQL. SQLite stores either format in the same
+# column, so there only the rows are rewritten.
+import argparse
+import os
+import sys
+
+# Add the project root to the path so we can import models and app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import inspect, text
+from sqlalchemy.types import LargeBinary
+from models import db
+from app.curve_format import CURVE_MAGIC, decode_curve, encode_curve
+
+CURVE_TABLES = ('power_curve', 'activity_curve')
+
+
+def is_binary_column(table):
+    """Whether a curve column can hold packed curves (always true on SQLite)."""
+    if db.engine.dialect.name != 'postgresql':
+        return True
+    column = next(c for c in inspect(db.engine).get_columns(table) if c['name'] == 'curve')
+    return isinstance(column['type'], LargeBinary)
+
+
+def convert_rows(table, batch_size=1000):
+    """
+    Re-encode every JSON curve in `table` as a binary curve, one batch per transaction.
+
+    Returns:
+        int: Number of rows converted.
+    """
+    converted = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            text(f"SELECT id, curve FROM {table} WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": batch_size}
+        ).all()
+        if not rows:
+            return converted
+        updates = []
+        for row_id, value in rows:
+            raw = value.encode('utf-8') if isinstance(value, str) else value
+            if raw is not None and bytes(raw[:2]) != CURVE_MAGIC:
+                updates.append({"id": row_id, "curve": encode_curve(decode_curve(value))})
+        if updates:
+            db.session.execute(text(f"UPDATE {table} SET curve = :curve WHERE id = :id"), updates)
+            db.session.commit()
+            converted += len(updates)
+        last_id = rows[-1][0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert stored power curves to the binary format.")
+    parser.add_argument("mode", nargs="?", choices=["dev"], help="Use the development database")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    from app.factory import create_app
+    app = create_app(args.mode)
+    with app.app_context():
+        for table in CURVE_TABLES:
+            if not is_binary_column(table):
+                sys.exit(f"{table}.curve is still json, run utils/migrate_db.py upgrade first.")
+            print(f"Converted {convert_rows(table, args.batch_size)} curves in {table}.")
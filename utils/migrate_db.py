@@ -0,0 +1,48 @@
+# utility script applying the database migrations in migrations/ (Alembic, via Flask-Migrate)
+#
+#   python utils/migrate_db.py [dev] upgrade             # apply every pending migration
+#   python utils/migrate_db.py [dev] current             # show the database's revision
+#   python utils/migrate_db.py [dev] downgrade REVISION
+#   python utils/migrate_db.py [dev] revision "message"  # new migration from the model changes
+#
+# The migrations also bring databases created by older versions (with create_all) up to
+# date: missing tables and columns are added and, on PostgreSQL, the curve columns become
+# bytea. Afterwards utils/migrate_curves.py re-encodes the stored curves. A database created
+# by this version of the app (CREATE_TABLES) is already up to date: stamp it with "stamp".
+import argparse
+import os
+import sys
+
+# Add the project root to the path so we can import models and app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+MIGRATIONS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'migrations'))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply or create database migrations.")
+    parser.add_argument("mode", nargs="?", choices=["dev"], help="Use the development database")
+    parser.add_argument("command", choices=["upgrade", "downgrade", "current", "history", "stamp", "revision"])
+    parser.add_argument("argument", nargs="?",
+                        help="Target revision (upgrade: head, downgrade: -1, stamp), or the message for revision")
+    parser.add_argument("--sql", action="store_true", help="Print the SQL instead of running it (upgrade/downgrade)")
+    args = parser.parse_args()
+
+    # Only needed here, so the app doesn't load Alembic at startup
+    import flask_migrate
+    from models import db
+    from app.factory import create_app
+    # The schema belongs to the migrations here (create_all would also hide model changes from
+    # "revision")
+    app = create_app(args.mode, CREATE_TABLES=False)
+    flask_migrate.Migrate(app, db, directory=MIGRATIONS_DIR)
+    with app.app_context():
+        if args.command == "upgrade":
+            flask_migrate.upgrade(revision=args.argument or "head", sql=args.sql)
+        elif args.command == "downgrade":
+            flask_migrate.downgrade(revision=args.argument or "-1", sql=args.sql)
+        elif args.command == "stamp":
+            flask_migrate.stamp(revision=args.argument or "head")
+        elif args.command == "revision":
+            flask_migrate.migrate(message=args.argument)
+        else:
+            getattr(flask_migrate, args.command)()
@@ -1,4 +1,6 @@
 import json
+import os
+import random
 
 def pretty_print(obj):
     """
@@ -10,20 +12,34 @@ def pretty_print(obj):
     except TypeError:
         print("Object is not JSON serializable:", obj)
 
-def print_db_state(db, User, PowerCurve, label=""):
+# Fraction of calls to print_db_state that actually print (0 = off, 1 = every call)
+DB_DUMP_SAMPLE_RATE = float(os.getenv('DB_DUMP_SAMPLE_RATE', 0))
+# Most rows printed per table
+DB_DUMP_MAX_ROWS = int(os.getenv('DB_DUMP_MAX_ROWS', 20))
+
+def print_db_state(db, User, PowerCurve, label="", sample_rate=None, max_rows=None):
+    """
+    Debug dump of the newest users and power curves.
+    Off unless DB_DUMP_SAMPLE_RATE (or sample_rate) is set, because it queries whole tables;
+    with a rate below 1 only that fraction of calls print.
+    """
+    sample_rate = DB_DUMP_SAMPLE_RATE if sample_rate is None else sample_rate
+    if sample_rate <= 0 or random.random() >= sample_rate:
+        return
+    max_rows = max_rows or DB_DUMP_MAX_ROWS
     print(f"\n--- DATABASE STATE {label} ---")
-    print("Users:")
+    print(f"Users (newest {max_rows}):")
     pretty_print([{
         "id": u.id,
         "strava_id": u.strava_id,
         "strava_name": u.strava_name
-    } for u in User.query.all()])
-    print("PowerCurves:")
+    } for u in User.query.order_by(User.id.desc()).limit(max_rows)])
+    print(f"PowerCurves (newest {max_rows}):")
     pretty_print([{
         "id": c.id,
         "user_id": c.user_id,
         "strava_id": c.strava_id,
         "activity_id": c.activity_id,
-        "curve": c.curve
-    } for c in PowerCurve.query.all()])
+        "curve": dict(c.curve)
+    } for c in PowerCurve.query.order_by(PowerCurve.id.desc()).limit(max_rows)])
     print("--- END DATABASE STATE ---\n")
@@ -1,4 +1,7 @@
 # utility script to rebuild the database after changes.
+#
+#   python utils/rebuild_db.py [dev]
+import argparse
 import os
 import sys
 
@@ -6,9 +9,9 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from models import db
-from main import app
+from app.factory import create_app
 
-def rebuild_database():
+def rebuild_database(app):
     db_path = os.path.join(os.path.dirname(__file__), '..', 'powercurve.db')
     # Delete the existing database file if it exists
     if os.path.exists(db_path):
@@ -25,5 +28,8 @@ def rebuild_database():
     print("Dummy data created.")
 
 if __name__ == "__main__":
-    rebuild_database()
+    parser = argparse.ArgumentParser(description="Reset the database and fill it with dummy data.")
+    parser.add_argument("mode", nargs="?", choices=["dev"], help="Use the development database")
+    args = parser.parse_args()
+    rebuild_database(create_app(args.mode))
     print("Database rebuild complete.")
\ No newline at end of file
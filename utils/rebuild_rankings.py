@@ -0,0 +1,23 @@
+# utility script to rebuild the leaderboard rankings from the stored power curves
+# (run once after upgrading, or if the curve_rank table gets out of step)
+#
+#   python utils/rebuild_rankings.py [dev]
+import argparse
+import os
+import sys
+
+# Add the project root to the path so we can import models and app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.factory import create_app
+from app.rankings import rebuild_curve_ranks
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the leaderboard rankings.")
+    parser.add_argument("mode", nargs="?", choices=["dev"], help="Use the development database")
+    args = parser.parse_args()
+
+    app = create_app(args.mode)
+    with app.app_context():
+        rebuild_curve_ranks()
+    print("Rankings rebuilt.")
@@ -0,0 +1,21 @@
+# utility script to recompute critical power, W', FTP and normalized power for every user
+# (run nightly, e.g. from cron: python utils/recompute_metrics.py [dev])
+import argparse
+import os
+import sys
+
+# Add the project root to the path so we can import models and app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.factory import create_app
+from app.metrics import recompute_metrics
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute every user's derived metrics.")
+    parser.add_argument("mode", nargs="?", choices=["dev"], help="Use the development database")
+    args = parser.parse_args()
+
+    app = create_app(args.mode)
+    with app.app_context():
+        count = recompute_metrics()
+    print(f"Metrics recomputed for {count} users.")
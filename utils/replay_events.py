@@ -0,0 +1,61 @@
+# utility script replaying recorded Strava webhook events (STRAVA_WEBHOOK_RECORD_FILE), to
+# reproduce ingestion locally without a public URL for Strava to post to
+#
+#   python utils/replay_events.py [dev] FILE [--url http://localhost:5000] [--work]
+#
+# Without --url the events are posted to the app in this process, --work then applies them
+# right away instead of waiting for worker.py.
+import argparse
+import json
+import os
+import sys
+
+# Add the project root to the path so we can import models and app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def read_events(path):
+    """Events from a JSON lines file (as recorded) or a JSON list."""
+    with open(path) as f:
+        text = f.read().strip()
+    if text.startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded Strava webhook events.")
+    parser.add_argument("file", help="JSON lines file of events (or a JSON list)")
+    parser.add_argument("--url", help="Post to a running server instead of the app in this process")
+    parser.add_argument("--work", action="store_true", help="Apply the queued events before exiting")
+    # A leading "dev" uses the development database (it can't be an optional positional
+    # argument next to the file)
+    dev = sys.argv[1:2] == ["dev"]
+    args = parser.parse_args(sys.argv[2:] if dev else sys.argv[1:])
+    events = read_events(args.file)
+
+    if args.url:
+        import requests
+        for event in events:
+            response = requests.post(args.url.rstrip('/') + "/strava/webhook", json=event, timeout=10)
+            print(response.status_code, response.text.strip())
+        sys.exit(0)
+
+    from app.factory import create_app
+    # The webhook is off without a verify token, any value turns it on here
+    app = create_app("development" if dev else None,
+                     STRAVA_WEBHOOK_VERIFY_TOKEN=os.getenv('STRAVA_WEBHOOK_VERIFY_TOKEN') or "replay",
+                     STRAVA_WEBHOOK_SUBSCRIPTION_ID=None, STRAVA_WEBHOOK_RECORD_FILE=None)
+    client = app.test_client()
+    for event in events:
+        response = client.post("/strava/webhook", json=event)
+        print(response.status_code, response.get_json())
+
+    if args.work:
+        from app.extensions import strava
+        from app.jobs import work
+        from models import CurveJob
+        work(app, strava, once=True)
+        with app.app_context():
+            for job in CurveJob.query.filter_by(kind="activity_events").order_by(CurveJob.id.desc()).limit(10):
+                print(f"Job {job.id} (user {job.user_id}): {job.status} {job.result or job.error or ''}")
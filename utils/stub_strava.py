@@ -0,0 +1,214 @@
+# A local stand-in for the Strava API that serves synthetic athletes and rides
+# (see app/synthetic.py), for load tests and trying the app without a Strava account.
+#
+#   python utils/stub_strava.py [--port 8765] [--rides 20] [--latency 0.05]
+#
+# Then point the app at it:
+#   STRAVA_API_URL=http://127.0.0.1:8765/api/v3 STRAVA_OAUTH_URL=http://127.0.0.1:8765/oauth
+# Any OAuth code works: "athlete-42" signs in as athlete 42, other codes get an athlete derived
+# from the code.
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Add the project root to the path so we can import app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from app.synthetic import MIN_RIDE_SECONDS, synthetic_stream
+
+STREAMS_PATH = re.compile(r'^/api/v3/activities/(\d+)/streams$')
+
+
+def athlete_for_code(code):
+    """Athlete ID an OAuth code signs in as."""
+    match = re.fullmatch(r'athlete-(\d+)', code or '')
+    if match:
+        return int(match.group(1))
+    return int(hashlib.sha1((code or '').encode()).hexdigest()[:6], 16)
+
+
+class StubStrava:
+    """
+    Threaded HTTP server answering the Strava endpoints the app uses.
+
+    Attributes:
+        rides (int): Number of rides every athlete has.
+        max_ride_seconds (int): Longest ride (lengths are log-uniform from 30 minutes up to this).
+        latency (float): Seconds added to every response, to imitate the round trip to Strava.
+        requests (dict): Number of requests served per endpoint.
+
+    Notes:
+        Athletes, activities and streams are generated from their IDs, so every run serves the
+        same data. Activity lists carry an ETag and answer If-None-Match with 304 like Strava.
+        Stream responses are gzip'd when asked for and the encoded responses are kept in memory.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, rides=20, max_ride_seconds=6 * 3600, latency=0.0):
+        self.rides = rides
+        self.max_ride_seconds = max_ride_seconds
+        self.latency = latency
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._stream_body = lru_cache(maxsize=256)(self._stream_body)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        return f"{self.url}/api/v3"
+
+    @property
+    def oauth_url(self):
+        return f"{self.url}/oauth"
+
+    def start(self):
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, endpoint):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def ride_seconds(self, activity_id):
+        """Length of an activity, log-uniform between 30 minutes and max_ride_seconds."""
+        rng = np.random.default_rng(activity_id)
+        low, high = np.log(MIN_RIDE_SECONDS), np.log(max(self.max_ride_seconds, MIN_RIDE_SECONDS))
+        return int(np.exp(rng.uniform(low, high)))
+
+    def activities(self, athlete_id):
+        """Every activity of an athlete, most recent first (one ride per day)."""
+        today = datetime(2025, 1, 1, 8, tzinfo=timezone.utc)
+        return [
+            {
+                "id": athlete_id * 100000 + i,
+                "name": f"Synthetic ride {i}",
+                "type": "Ride",
+                "start_date": (today - timedelta(days=self.rides - i)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                "distance": self.ride_seconds(athlete_id * 100000 + i) * 8.0,
+                "device_watts": True,
+            }
+            for i in range(self.rides, 0, -1)
+        ]
+
+    def _stream_body(self, activity_id, gzip):
+        # FTP between 180 W and 330 W, fixed per athlete
+        ftp = 180 + (activity_id // 100000) % 150
+        body = json.dumps(synthetic_stream(self.ride_seconds(activity_id), ftp, seed=activity_id)).encode()
+        if gzip:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip container
+            body = compressor.compress(body) + compressor.flush()
+        return body
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass  # Keep the load test output readable
+
+            def _reply(self, status, body=b'', headers=None):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('X-RateLimit-Limit', '100000,1000000')
+                self.send_header('X-RateLimit-Usage', '0,0')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, status, data, headers=None):
+                self._reply(status, json.dumps(data).encode(),
+                            {'Content-Type': 'application/json', **(headers or {})})
+
+            def _athlete(self):
+                token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+                return int(token.removeprefix('token-')) if token.startswith('token-') else None
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                form = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+                if url.path != '/oauth/token':
+                    return self._json(404, {"message": "Record Not Found"})
+                stub._count('oauth/token')
+                athlete_id = athlete_for_code((form.get('code') or [''])[0])
+                self._json(200, {
+                    "access_token": f"token-{athlete_id}",
+                    "athlete": {"id": athlete_id, "username": f"rider{athlete_id}"},
+                })
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                athlete_id = self._athlete()
+                if athlete_id is None:
+                    return self._json(401, {"message": "Authorization Error"})
+
+                if url.path == '/api/v3/athlete/activities':
+                    stub._count('athlete/activities')
+                    query = parse_qs(url.query)
+                    per_page = int((query.get('per_page') or [30])[0])
+                    page = int((query.get('page') or [1])[0])
+                    activities = stub.activities(athlete_id)[(page - 1) * per_page:page * per_page]
+                    etag = '"%s"' % hashlib.sha1(json.dumps(activities).encode()).hexdigest()[:16]
+                    if self.headers.get('If-None-Match') == etag:
+                        return self._reply(304, headers={'ETag': etag})
+                    return self._json(200, activities, {'ETag': etag})
+
+                match = STREAMS_PATH.match(url.path)
+                if match:
+                    stub._count('activities/streams')
+                    activity_id = int(match.group(1))
+                    if activity_id // 100000 != athlete_id:
+                        return self._json(404, {"message": "Record Not Found"})
+                    gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+                    headers = {'Content-Type': 'application/json'}
+                    if gzip:
+                        headers['Content-Encoding'] = 'gzip'
+                    return self._reply(200, stub._stream_body(activity_id, gzip), headers)
+
+                self._json(404, {"message": "Record Not Found"})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic athletes and rides like the Strava API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rides", type=int, default=20, help="Rides per athlete")
+    parser.add_argument("--max-ride-hours", type=float, default=6, help="Longest ride")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    args = parser.parse_args()
+
+    stub = StubStrava(args.host, args.port, args.rides, int(args.max_ride_hours * 3600), args.latency)
+    print(f"Stub Strava API on {stub.api_url} (OAuth: {stub.oauth_url})")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
@@ -0,0 +1,30 @@
+# Background worker for the power curve job queue
+# Usage: python worker.py [dev] [--processes N] [--once]
+import argparse
+import multiprocessing
+
+
+def run_worker(env, once):
+    # Import inside the process so every worker gets its own database connections
+    from app.factory import create_app
+    from app.jobs import work
+    from app.strava import StravaClient
+    from app.stream_cache import StreamCache
+    work(create_app(env), StravaClient(stream_cache=StreamCache()), once=once)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run power curve background workers.")
+    parser.add_argument("mode", nargs="?", help="'dev' to use the development database (default: APP_ENV)")
+    parser.add_argument("--processes", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        run_worker(args.mode, args.once)
+    else:
+        workers = [multiprocessing.Process(target=run_worker, args=(args.mode, args.once)) for _ in range(args.processes)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()